@@ -6,14 +6,19 @@ Features:
 - Pages list (create/select pages)
 - Drag components from palette into the page canvas
 - Select a placed component and edit its props (JSON)
+- Live preview of the current page, rendered in the background (see preview.py)
 - Export the resulting project schema as JSON compatible with VirtoWeb
 
 This prototype uses PyQt6 (Qt6). To run:
   pip install -r requirements.txt
   python main.py
 
+The preview uses PyQt6-WebEngine when it is installed (pages are shown with
+their stylesheets) and a QTextBrowser otherwise.
+
 Packaging: use PyInstaller to create executables for each platform.
 """
+import copy
 import json
 import os
 import sys
@@ -22,11 +27,28 @@ from functools import partial
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QListWidget, QListWidgetItem, QPushButton,
     QHBoxLayout, QVBoxLayout, QFileDialog, QLabel, QTextEdit, QInputDialog,
-    QMessageBox, QLineEdit, QComboBox
+    QMessageBox, QLineEdit, QComboBox, QTextBrowser
 )
-from PyQt6.QtCore import Qt, QMimeData
+from PyQt6.QtCore import Qt, QMimeData, QObject, QRunnable, QThreadPool, QUrl, pyqtSignal
 from PyQt6.QtGui import QDrag
 
+try:
+    from PyQt6.QtWebEngineWidgets import QWebEngineView
+except ImportError:
+    QWebEngineView = None
+
+from preview import TEMPLATE_DIR, Cancelled, PagePreview
+
+# used when the loaded schema has none
+DEFAULT_PROJECT = {'id': 'builder-output', 'title': 'Builder Output', 'version': '1.0.0'}
+DEFAULT_LAYOUTS = [
+    {'id': 'main', 'template': 'layouts/main', 'regions': ['head', 'header', 'main', 'footer'], 'default': True}
+]
+
+
+def page_route(page_id):
+    return '/' + ('' if page_id == 'home' else page_id)
+
 
 class DraggableListWidget(QListWidget):
     def __init__(self, *args, **kwargs):
@@ -48,6 +70,8 @@ class DraggableListWidget(QListWidget):
 
 
 class CanvasListWidget(QListWidget):
+    componentDropped = pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.setAcceptDrops(True)
@@ -72,15 +96,49 @@ class CanvasListWidget(QListWidget):
             item.setData(role, {'component': comp_id, 'props': {}})
             self.addItem(item)
             event.acceptProposedAction()
+            self.componentDropped.emit()
         else:
             super().dropEvent(event)
 
 
+class PreviewSignals(QObject):
+    done = pyqtSignal(int, str, object)  # generation, html, stats
+    failed = pyqtSignal(int, str)  # generation, error
+
+
+class PreviewTask(QRunnable):
+    """Render one page snapshot on the preview pool.
+
+    Results carry the generation of the request; the render stops early once
+    `current()` returns a newer generation.
+    """
+
+    def __init__(self, preview, site, page, generation, current):
+        super().__init__()
+        self.preview = preview
+        self.site = site
+        self.page = page
+        self.generation = generation
+        self.current = current
+        self.signals = PreviewSignals()
+
+    def run(self):
+        try:
+            html, stats = self.preview.render(self.site, self.page,
+                                              cancelled=lambda: self.current() != self.generation)
+        except Cancelled:
+            return
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        self.signals.done.emit(self.generation, html, stats)
+
+
 class BuilderApp(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle('VirtoWeb Desktop Builder (prototype)')
-        self.resize(1000, 600)
+        self.resize(1400, 700)
 
         # state
         self.schema = None
@@ -88,6 +146,12 @@ class BuilderApp(QWidget):
         self.pages = {}  # page_id -> list of component instances
         self.current_page = None
 
+        # live preview: one render at a time, off the UI thread; only the newest request matters
+        self.preview = PagePreview()
+        self.preview_pool = QThreadPool(self)
+        self.preview_pool.setMaxThreadCount(1)
+        self.preview_generation = 0
+
         # UI
         palette = QVBoxLayout()
         palette.addWidget(QLabel('Components'))
@@ -110,6 +174,7 @@ class BuilderApp(QWidget):
 
         self.canvas = CanvasListWidget()
         self.canvas.itemClicked.connect(self.on_canvas_item_selected)
+        self.canvas.componentDropped.connect(self.on_component_dropped)
         middle.addWidget(QLabel('Canvas (drop components here)'))
         middle.addWidget(self.canvas)
 
@@ -129,13 +194,22 @@ class BuilderApp(QWidget):
         btn_save.clicked.connect(self.save_project_file)
         right.addWidget(btn_save)
 
+        preview = QVBoxLayout()
+        preview.addWidget(QLabel('Preview'))
+        self.preview_view = QWebEngineView() if QWebEngineView is not None else QTextBrowser()
+        preview.addWidget(self.preview_view)
+        self.preview_status = QLabel('')
+        preview.addWidget(self.preview_status)
+
         layout = QHBoxLayout(self)
         L = QWidget(); L.setLayout(palette)
         M = QWidget(); M.setLayout(middle)
         R = QWidget(); R.setLayout(right)
+        P = QWidget(); P.setLayout(preview)
         layout.addWidget(L, 1)
         layout.addWidget(M, 2)
         layout.addWidget(R, 1)
+        layout.addWidget(P, 3)
 
         # load default components
         self.load_default_components()
@@ -211,6 +285,7 @@ class BuilderApp(QWidget):
     def on_page_selected(self, text):
         self.current_page = text
         self.load_canvas_for_page(text)
+        self.schedule_preview()
 
     def load_canvas_for_page(self, page_id):
         self.canvas.clear()
@@ -227,6 +302,17 @@ class BuilderApp(QWidget):
         inst = item.data(role)
         self.props_editor.setPlainText(json.dumps(inst.get('props', {}), indent=2))
 
+    def sync_page(self):
+        # items hold copies of the instances: the canvas is the current page's source of truth
+        if self.current_page not in self.pages:
+            return
+        role = int(Qt.ItemDataRole.UserRole)
+        self.pages[self.current_page] = [self.canvas.item(i).data(role) for i in range(self.canvas.count())]
+
+    def on_component_dropped(self):
+        self.sync_page()
+        self.schedule_preview()
+
     def apply_props(self):
         item = self.canvas.currentItem()
         if not item:
@@ -241,18 +327,75 @@ class BuilderApp(QWidget):
         inst = item.data(role)
         inst['props'] = obj
         item.setData(role, inst)
+        self.sync_page()
+        self.schedule_preview()
+
+    def preview_site(self):
+        """The loaded schema's project, layouts and options with the palette's components."""
+        schema = self.schema or {}
+        return {
+            'project': schema.get('project') or DEFAULT_PROJECT,
+            'layouts': {l['id']: l for l in schema.get('layouts') or DEFAULT_LAYOUTS},
+            'components': dict(self.components),
+            'options': (schema.get('generator') or {}).get('options', {}),
+            'assets': schema.get('assets', []),
+        }
+
+    def preview_page(self, page_id, layouts):
+        """The page as the generator sees it: the schema's page with the canvas as its main region."""
+        instances = self.pages.get(page_id, [])
+        for p in (self.schema or {}).get('pages', []):
+            if p.get('id') == page_id:
+                return dict(p, regions=dict(p.get('regions') or {}, main=instances))
+        layout = next((l for l in layouts.values() if l.get('default')), next(iter(layouts.values())))
+        return {'id': page_id, 'route': page_route(page_id), 'title': page_id.title(), 'layout': layout['id'],
+                'regions': {'main': instances}}
+
+    def schedule_preview(self):
+        """Render the current page in the background, superseding any pending render."""
+        self.preview_generation += 1
+        # queued renders are dropped; a running one stops before its next fragment
+        self.preview_pool.clear()
+        if not self.current_page:
+            self.set_preview_html('')
+            self.preview_status.setText('')
+            return
+        site = self.preview_site()
+        # the worker gets its own copy: nothing it reads is touched by the UI thread
+        site, page = copy.deepcopy((site, self.preview_page(self.current_page, site['layouts'])))
+        generation = self.preview_generation
+        task = PreviewTask(self.preview, site, page, generation, lambda: self.preview_generation)
+        task.signals.done.connect(self.show_preview)
+        task.signals.failed.connect(self.show_preview_error)
+        self.preview_pool.start(task)
+
+    def set_preview_html(self, html):
+        if QWebEngineView is not None:
+            self.preview_view.setHtml(html, QUrl.fromLocalFile(TEMPLATE_DIR + os.sep))
+        else:
+            self.preview_view.setHtml(html)
+
+    def show_preview(self, generation, html, stats):
+        if generation != self.preview_generation:
+            return
+        self.set_preview_html(html)
+        total = stats['rendered'] + stats['reused']
+        self.preview_status.setText(f"Rendered {stats['rendered']} of {total} components in {stats['ms']:.1f} ms")
+
+    def show_preview_error(self, generation, message):
+        if generation != self.preview_generation:
+            return
+        self.preview_status.setText(f'Preview failed: {message}')
 
     def export_schema(self):
         # Build a minimal schema containing project, layouts, components, pages
-        project = {'id': 'builder-output', 'title': 'Builder Output', 'version': '1.0.0'}
-        layouts = [
-            {'id': 'main', 'template': 'layouts/main', 'regions': ['head', 'header', 'main', 'footer'], 'default': True}
-        ]
+        project = DEFAULT_PROJECT
+        layouts = DEFAULT_LAYOUTS
         components = list(self.components.values())
         pages = []
         for pid, instances in self.pages.items():
             regions = {'main': [{'component': i['component'], 'props': i.get('props', {})} for i in instances]}
-            pages.append({'id': pid, 'route': '/' + ('' if pid == 'home' else pid), 'title': pid.title(), 'layout': 'main', 'regions': regions})
+            pages.append({'id': pid, 'route': page_route(pid), 'title': pid.title(), 'layout': 'main', 'regions': regions})
 
         out = {'project': project, 'layouts': layouts, 'components': components, 'pages': pages}
         path, _ = QFileDialog.getSaveFileName(self, 'Export schema JSON', os.getcwd(), 'JSON Files (*.json)')
@@ -0,0 +1,120 @@
+"""
+Live page preview for the desktop builder.
+
+Pages are rendered with the generator's own SiteRenderer (the path
+render_static_site takes for every page), so the preview shows what a build
+writes, minus the output files: asset references point at the source files
+instead of fingerprinted copies.
+
+Rendered component fragments are kept between renders, keyed by template and
+merged props (and by the page for templates that read `page`), so after a prop
+edit or a drop only the changed or new fragment is rendered again and the
+layout is re-rendered around the kept ones. A render can be cancelled: the
+`cancelled` callback is checked before each fragment that has to be rendered.
+
+This module has no Qt dependency; main.py runs it on a QThreadPool worker.
+"""
+import os
+import pathlib
+import sys
+import time
+from collections import OrderedDict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.backends.assets import AssetUrls, collect_assets  # noqa: E402
+from generators.backends.common import FragmentCache, SiteRenderer  # noqa: E402
+from generators.backends.manifest import hash_obj  # noqa: E402
+from generators.backends.static_backend import TEMPLATE_DIR  # noqa: E402
+from generators.backends.templates import TemplateTable, make_environment  # noqa: E402
+
+# rendered fragments kept across renders, least recently used dropped first
+MAX_FRAGMENTS = 2048
+
+
+class Cancelled(Exception):
+    """Raised inside a render that a newer one has superseded."""
+
+
+class PreviewFragments(FragmentCache):
+    """FragmentCache that keeps page-dependent fragments too, keyed by the page, up to MAX_FRAGMENTS."""
+
+    def __init__(self, limit=MAX_FRAGMENTS):
+        super().__init__()
+        self._fragments = OrderedDict()
+        self.limit = limit
+        self.cancelled = None
+
+    def render(self, templates, tmpl_name, tmpl, context):
+        reads = templates.reads(tmpl_name)
+        page = context['page'] if reads is None or 'page' in reads else None
+        key = hash_obj([tmpl_name, context['props'], page])
+        html = self._fragments.get(key)
+        if html is not None:
+            self.hits += 1
+            self._fragments.move_to_end(key)
+            return html
+        if self.cancelled is not None and self.cancelled():
+            raise Cancelled()
+        self.misses += 1
+        html = self._fragments[key] = tmpl.render(**context)
+        if len(self._fragments) > self.limit:
+            self._fragments.popitem(last=False)
+        return html
+
+
+class PagePreview:
+    """Render single pages of a site snapshot, reusing fragments between calls.
+
+    A snapshot is a dict with `project`, `layouts` and `components` (both keyed
+    by id), `options` and `assets`, as in the generator's AST. The renderer is
+    kept while the snapshot's site-wide parts stay the same. Not thread-safe:
+    use it from one thread at a time.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR):
+        self.template_dir = template_dir
+        self.templates = None
+        self.renderer = None
+        self.site_key = None
+
+    def _renderer_for(self, site):
+        key = hash_obj({k: site.get(k) for k in ('project', 'layouts', 'components', 'options', 'assets')})
+        if key != self.site_key:
+            if self.templates is None:
+                self.templates = TemplateTable(make_environment(self.template_dir))
+            # assets are linked at their sources: nothing is copied for a preview
+            urls = {logical: pathlib.Path(src).as_uri()
+                    for logical, src in collect_assets(self.template_dir, site).items()}
+            renderer = SiteRenderer(site, self.templates, AssetUrls(urls))
+            renderer.search = None
+            if self.renderer is not None:
+                # fragments only depend on template, props and page, which the key covers
+                renderer.fragments = self.renderer.fragments
+            else:
+                renderer.fragments = PreviewFragments()
+            self.renderer = renderer
+            self.site_key = key
+        return self.renderer
+
+    def render(self, site, page, cancelled=None):
+        """Return (html, stats) for `page`; raises Cancelled when `cancelled()` turns true."""
+        if cancelled is not None and cancelled():
+            raise Cancelled()
+        renderer = self._renderer_for(site)
+        fragments = renderer.fragments
+        before = fragments.stats()
+        fragments.cancelled = cancelled
+        start = time.perf_counter()
+        try:
+            html = renderer.render_page(page)
+        finally:
+            fragments.cancelled = None
+        after = fragments.stats()
+        return html, {
+            'rendered': after['misses'] - before['misses'],
+            'reused': after['hits'] - before['hits'],
+            'ms': (time.perf_counter() - start) * 1000,
+        }
@@ -0,0 +1,200 @@
+"""Asset pipeline: content-hash fingerprinting.
+
+Every asset (the template `assets/` folder plus the schema's `assets` list) is
+published under a name that embeds a hash of its content, e.g.
+`/assets/styles.css` -> `/assets/styles.3f9a1c0b2d.css`. A fingerprinted file
+never changes content, so servers can send it with an immutable, year-long
+Cache-Control header (see FINGERPRINT_RE).
+
+`build_assets` hashes and copies files on a thread pool; with `minify_css` set,
+stylesheets are minified while they are published (and hashed after
+minification). Source hashes are reused
+while a file's size and mtime are unchanged, and a fingerprinted file that already
+exists in the output is never copied again. The logical -> published URL map is
+written to `asset-manifest.json` in the output root; `AssetUrls.rewrite` replaces
+logical URLs in rendered HTML (e.g. the stylesheet `<link>` of `layouts/main`).
+
+The size/mtime cache is machine-specific, so it is kept apart from the published
+manifest in the dotfile `.virtoweb-assets.json` (servers skip dotfiles): the
+manifest depends only on asset contents, and shards built on different machines
+publish identical manifests.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from .minify import minify_css as minify
+from .publish import write_file
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+ASSET_MANIFEST = 'asset-manifest.json'
+ASSET_MANIFEST_VERSION = 1
+# per-source [size, mtime_ns, digest, minified] of the last build; not published
+ASSET_STATE = '.virtoweb-assets.json'
+HASH_LENGTH = 10
+# matches fingerprinted file names; servers use it to pick the immutable cache policy
+FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{10}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's contents, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint_path(rel, digest):
+    """Insert the content hash before the extension: `a/b.css` -> `a/b.<hash>.css`."""
+    base, ext = os.path.splitext(rel)
+    return f'{base}.{digest[:HASH_LENGTH]}{ext}'
+
+
+def collect_assets(template_dir, ast):
+    """Return `{logical url: source path}` for template assets and schema assets."""
+    sources = {}
+    assets_src = os.path.join(template_dir, 'assets')
+    for dirpath, _, filenames in os.walk(assets_src):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, template_dir).replace(os.sep, '/')
+            sources['/' + rel] = path
+    for asset in ast.get('assets', []):
+        # relative sources resolve against the repository root, as in generate_static.py
+        src = asset['src'] if os.path.isabs(asset['src']) else os.path.join(ROOT, asset['src'])
+        sources['/' + asset['dest'].replace(os.sep, '/').lstrip('/')] = src
+    return sources
+
+
+def load_asset_manifest(out):
+    try:
+        with open(os.path.join(out, ASSET_MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != ASSET_MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def load_asset_state(out):
+    try:
+        with open(os.path.join(out, ASSET_STATE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get('version') != ASSET_MANIFEST_VERSION:
+        return {}
+    return state.get('sources', {})
+
+
+def _publish(src, dst):
+    """Copy src to its fingerprinted dst; returns True if a copy was made."""
+    if os.path.exists(dst) and os.path.getsize(dst) == os.path.getsize(src):
+        # the name is the content hash: same size and name means same file
+        return False
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return True
+
+
+class AssetUrls:
+    """Map of logical asset URLs to fingerprinted ones, with an HTML rewriter."""
+
+    def __init__(self, urls):
+        self.urls = dict(urls)
+        self._pattern = None
+        if self.urls:
+            alternatives = '|'.join(re.escape(u) for u in sorted(self.urls, key=len, reverse=True))
+            # only rewrite whole attribute/url() values, not text that mentions a path
+            self._pattern = re.compile(r'(?<=["\'(=])(' + alternatives + r')(?=["\')?#\s>])')
+
+    def url(self, logical):
+        return self.urls.get(logical, logical)
+
+    def rewrite(self, html):
+        if self._pattern is None:
+            return html
+        return self._pattern.sub(lambda m: self.urls[m.group(1)], html)
+
+
+def build_assets(template_dir, ast, out, workers=None, minify_css=False):
+    """Fingerprint and copy all assets into `out`, minifying CSS if `minify_css`.
+
+    Returns (AssetUrls, stats) where stats has `copied` and `unchanged` counts,
+    `files` (output paths relative to out, including the asset manifest and the
+    asset state) and `stale` (fingerprinted files of the previous build no longer produced).
+    """
+    sources = collect_assets(template_dir, ast)
+    previous = load_asset_manifest(out) or {}
+    known = load_asset_state(out)
+
+    def stage(item):
+        logical, src = item
+        try:
+            st = os.stat(src)
+        except OSError as e:
+            print(f'Warning: failed to copy asset {src}: {e}')
+            return None
+        transform = minify_css and logical.lower().endswith('.css')
+        entry = known.get(logical)
+        if entry and entry[:2] == [st.st_size, st.st_mtime_ns] and entry[3:] == [transform]:
+            digest = entry[2]
+            data = None
+        elif transform:
+            with open(src, 'r', encoding='utf-8') as f:
+                data = minify(f.read()).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()
+        else:
+            digest = file_digest(src)
+            data = None
+        rel = fingerprint_path(logical.lstrip('/'), digest)
+        dst = os.path.join(out, rel)
+        if transform:
+            if os.path.exists(dst):
+                copied = False
+            else:
+                if data is None:
+                    with open(src, 'r', encoding='utf-8') as f:
+                        data = minify(f.read()).encode('utf-8')
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                copied = write_file(dst, data)
+        else:
+            copied = _publish(src, dst)
+        return logical, rel, [st.st_size, st.st_mtime_ns, digest, transform], copied
+
+    urls = {}
+    hashes = {}
+    files = {ASSET_MANIFEST, ASSET_STATE}
+    copied = unchanged = 0
+    # hashing and copying is I/O bound: threads overlap it without pickling anything
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(stage, sorted(sources.items())):
+            if result is None:
+                continue
+            logical, rel, entry, was_copied = result
+            urls[logical] = '/' + rel
+            hashes[logical] = entry
+            files.add(os.path.normpath(rel))
+            if was_copied:
+                copied += 1
+            else:
+                unchanged += 1
+
+    data = json.dumps({'version': ASSET_MANIFEST_VERSION, 'assets': urls}, indent=2, sort_keys=True)
+    if write_file(os.path.join(out, ASSET_MANIFEST), data):
+        copied += 1
+    else:
+        unchanged += 1
+    write_file(os.path.join(out, ASSET_STATE),
+               json.dumps({'version': ASSET_MANIFEST_VERSION, 'sources': hashes}, sort_keys=True))
+    # fingerprints published by the previous build that this build no longer uses
+    stale = {os.path.normpath(u.lstrip('/')) for u in previous.get('assets', {}).values()} - files
+    return AssetUrls(urls), {'copied': copied, 'unchanged': unchanged, 'files': files, 'stale': stale}
@@ -1,78 +1,497 @@
 import os
-import shutil
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+from .assets import ASSET_STATE, AssetUrls, build_assets
+from .compress import compress_outputs, variant_paths
+from .manifest import MANIFEST_NAME, TemplateHasher, hash_obj, load_manifest, save_manifest, remove_stale_outputs
+from .minify import minify_html, minify_settings
+from .profile import BuildProfile, active, phase
+from .publish import prune_tree, write_file
+from .routes import iter_pages
+from .search import (SEARCH_STATE, PageTerms, SearchCollector, build_search_index, previous_search_files,
+                     search_settings)
+from .shards import page_shard, site_hash
+from .stream import ChunkWriter, LazyRegion, stream_layout, stream_settings
+from .templates import TemplateTable, make_environment
 
 
-def render_static_site(ast, template_dir, out_public):
-    """Render the site's pages using Jinja2 templates found in template_dir and write
-    fully-rendered HTML files into out_public preserving route structure.
+# per-process state for parallel rendering, set up once by _init_worker
+_worker = {}
+# pages buffered before being split into chunks for the worker pool
+PARALLEL_WINDOW = 4096
 
-    Copies `assets/` from template_dir into out_public/assets.
-    """
-    env = Environment(loader=FileSystemLoader(template_dir), autoescape=select_autoescape(['html', 'xml']))
 
-    # prepare output
-    out = os.path.abspath(out_public)
-    if os.path.exists(out):
-        shutil.rmtree(out)
-    os.makedirs(out, exist_ok=True)
+def page_output_file(route):
+    """Return the output path (relative to the public root) for a page route."""
+    route = unquote(route)
+    if route == '/' or route == '':
+        return 'index.html'
+    return os.path.join(route.strip('/'), 'index.html')
+
+
+def merge_props(comp, inst):
+    props = dict(comp.get('props', {}))
+    props.update(inst.get('props') or {})
+    return props
+
+
+def page_templates(ast, page):
+    """Return the layout and component template names a page renders directly."""
+    layout = ast.get('layouts', {}).get(page.get('layout'))
+    if not layout:
+        return set()
+    components = ast.get('components', {})
+    names = {layout.get('template') + '.html.j2'}
+    for region_name in layout.get('regions', []):
+        for inst in (page.get('regions') or {}).get(region_name, []):
+            comp = components.get(inst.get('component'))
+            if comp:
+                names.add(comp.get('template') + '.html.j2')
+    return names
+
 
-    # copy template assets (styles etc.)
-    assets_src = os.path.join(template_dir, 'assets')
-    if os.path.exists(assets_src):
-        shutil.copytree(assets_src, os.path.join(out, 'assets'))
+def page_input_hash(ast, page, hasher, asset_urls=None):
+    """Hash everything the rendered HTML of `page` depends on.
 
+    `asset_urls` is the logical -> fingerprinted asset URL map the HTML is rewritten with.
+    """
     layouts = ast.get('layouts', {})
     components = ast.get('components', {})
+    layout = layouts.get(page.get('layout'))
+    templates = {}
+    instances = []
+    if layout:
+        tmpl_name = layout.get('template') + '.html.j2'
+        templates[tmpl_name] = hasher.hash(tmpl_name)
+        for region_name in layout.get('regions', []):
+            for inst in (page.get('regions') or {}).get(region_name, []):
+                comp = components.get(inst.get('component'))
+                if not comp:
+                    instances.append([region_name, inst.get('component'), None])
+                    continue
+                tmpl_name = comp.get('template') + '.html.j2'
+                templates[tmpl_name] = hasher.hash(tmpl_name)
+                instances.append([region_name, inst.get('component'), merge_props(comp, inst)])
+    return hash_obj({
+        'page': page,
+        'layout': layout,
+        'instances': instances,
+        'templates': templates,
+        'project': ast.get('project', {}),
+        'assets': asset_urls or {},
+        'options': ast.get('options', {}),
+    })
+
+
+class FragmentCache:
+    """Memoize component renders that don't depend on the page being rendered.
+
+    A component template whose context reads don't include `page` renders the same
+    HTML for the same merged props on every page (`project` is fixed for a build),
+    so its output is cached by (template, props hash). Page-dependent renders are
+    never cached.
+    """
+
+    def __init__(self):
+        self._fragments = {}
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'uncached': self.uncached}
 
-    def render_component(inst, page):
+    def clear(self):
+        self._fragments.clear()
+
+    def render(self, templates, tmpl_name, tmpl, context):
+        reads = templates.reads(tmpl_name)
+        if reads is None or 'page' in reads:
+            self.uncached += 1
+            return tmpl.render(**context)
+        key = (tmpl_name, hash_obj(context['props']))
+        html = self._fragments.get(key)
+        if html is None:
+            self.misses += 1
+            html = self._fragments[key] = tmpl.render(**context)
+        else:
+            self.hits += 1
+        return html
+
+
+def add_fragment_stats(total, stats):
+    for k, v in stats.items():
+        total[k] = total.get(k, 0) + v
+    return total
+
+
+class SiteRenderer:
+    """Render pages of one AST with a TemplateTable and a shared FragmentCache.
+
+    Asset references in the rendered HTML are rewritten with `assets` (AssetUrls)
+    and the HTML is minified when `generator.options.minify` asks for it. With
+    `generator.options.streamPages` pages are streamed to their files in bounded
+    chunks (see stream.py). With `generator.options.search` the text of each
+    rendered page is collected into `search` for the search index (see search.py).
+    """
+
+    def __init__(self, ast, templates, assets=None):
+        self.ast = ast
+        self.templates = templates
+        self.project = ast.get('project', {})
+        self.layouts = ast.get('layouts', {})
+        self.components = ast.get('components', {})
+        self.fragments = FragmentCache()
+        self.assets = assets or AssetUrls({})
+        self.minify_html, self.minify_css = minify_settings(ast.get('options'))
+        self.stream_buffer = stream_settings(ast.get('options'))
+        self.search = SearchCollector() if search_settings(ast.get('options')) else None
+        # set while profiling: template and page render times are recorded
+        self.profile = active()
+
+    def render_component(self, inst, page):
         comp_id = inst.get('component')
-        comp = components.get(comp_id)
+        comp = self.components.get(comp_id)
         if not comp:
             return f'<!-- Missing component {comp_id} -->'
         tmpl_name = comp.get('template') + '.html.j2'
         try:
-            tmpl = env.get_template(tmpl_name)
+            tmpl = self.templates.get(tmpl_name)
         except Exception as e:
             return f'<!-- Component template load error {tmpl_name}: {e} -->'
-        props = dict(comp.get('props', {}))
-        props.update(inst.get('props') or {})
-        return tmpl.render(project=ast.get('project', {}), page=page, props=props, regions={})
-
-    for p in ast.get('pages', []):
-        route = p.get('route', '/')
-        if '{' in route and '}' in route:
-            # skip parameterized routes for now
-            continue
-        if route == '/' or route == '':
-            out_dir = out
-        else:
-            out_dir = os.path.join(out, route.lstrip('/'))
-        os.makedirs(out_dir, exist_ok=True)
+        props = merge_props(comp, inst)
+        context = {'project': self.project, 'page': page, 'props': props, 'regions': {}}
+        if self.profile is None:
+            return self.fragments.render(self.templates, tmpl_name, tmpl, context)
+        start = time.perf_counter()
+        html = self.fragments.render(self.templates, tmpl_name, tmpl, context)
+        self.profile.template(tmpl_name, time.perf_counter() - start)
+        return html
+
+    def render_page(self, p):
+        """Render a single page to an HTML string."""
+        if self.profile is None:
+            return self._render_page(p)
+        start = time.perf_counter()
+        html = self._render_page(p)
+        self.profile.page(p.get('route', '/'), time.perf_counter() - start)
+        return html
 
+    def _render_page(self, p):
         layout_id = p.get('layout')
-        layout = layouts.get(layout_id)
+        layout = self.layouts.get(layout_id)
         if not layout:
-            # write a basic page
-            with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
-                f.write(f"<h1>Missing layout {layout_id}</h1>")
-            continue
+            return f"<h1>Missing layout {layout_id}</h1>"
 
         layout_tmpl = layout.get('template') + '.html.j2'
         try:
-            layout_template = env.get_template(layout_tmpl)
+            layout_template = self.templates.get(layout_tmpl)
         except Exception as e:
-            with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
-                f.write(f"<!-- Layout template load error {layout_tmpl}: {e} -->")
-            continue
+            return f"<!-- Layout template load error {layout_tmpl}: {e} -->"
 
+        terms = PageTerms(p) if self.search is not None else None
         rendered_regions = {}
         for region_name in layout.get('regions', []):
             parts = []
             for inst in (p.get('regions') or {}).get(region_name, []):
-                parts.append(render_component(inst, p))
+                parts.append(self.render_component(inst, p))
             rendered_regions[region_name] = '\n'.join(parts)
+            if terms is not None:
+                terms.feed(rendered_regions[region_name])
+        if terms is not None:
+            self.search.add(page_output_file(p.get('route', '/')), terms)
+
+        if self.profile is None:
+            html = layout_template.render(project=self.project, page=p, regions=rendered_regions)
+        else:
+            start = time.perf_counter()
+            html = layout_template.render(project=self.project, page=p, regions=rendered_regions)
+            self.profile.template(layout_tmpl, time.perf_counter() - start)
+        return self.transform(html)
+
+    def transform(self, html):
+        """Asset rewriting and minification applied to rendered HTML."""
+        html = self.assets.rewrite(html)
+        if self.minify_html:
+            html = minify_html(html, css=self.minify_css)
+        return html
+
+    def stream_page(self, p, out_file):
+        """Render a page straight into out_file in bounded chunks; returns False if unchanged."""
+        layout = self.layouts.get(p.get('layout'))
+        layout_tmpl = layout.get('template') + '.html.j2' if layout else None
+        try:
+            layout_template = self.templates.get(layout_tmpl) if layout else None
+        except Exception:
+            layout_template = None
+        if layout_template is None:
+            # the error page is tiny: render it the usual way
+            return write_file(out_file, self.render_page(p))
+
+        terms = PageTerms(p) if self.search is not None else None
+
+        def render(inst):
+            html = self.render_component(inst, p)
+            if terms is not None:
+                terms.feed(html)
+            return html
+
+        page_regions = p.get('regions') or {}
+        regions = {}
+        for region_name in layout.get('regions', []):
+            regions[region_name] = LazyRegion(region_name, page_regions.get(region_name, []), render)
+        writer = ChunkWriter(out_file, self.stream_buffer, self.transform)
+        try:
+            stream_layout(layout_template, {'project': self.project, 'page': p}, regions, writer)
+        except BaseException:
+            writer.abort()
+            raise
+        if terms is not None:
+            self.search.add(page_output_file(p.get('route', '/')), terms)
+        return writer.close()
 
-        html = layout_template.render(project=ast.get('project', {}), page=p, regions=rendered_regions)
-        with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
-            f.write(html)
+    def write_page(self, p, out_file):
+        """Render and write a page; returns False if the file already had that content."""
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        if self.stream_buffer:
+            if self.profile is None:
+                return self.stream_page(p, out_file)
+            # rendering and writing interleave: the page time covers both
+            start = time.perf_counter()
+            written = self.stream_page(p, out_file)
+            self.profile.page(p.get('route', '/'), time.perf_counter() - start)
+            return written
+        html = self.render_page(p)
+        if self.profile is None:
+            return write_file(out_file, html)
+        start = time.perf_counter()
+        written = write_file(out_file, html)
+        self.profile.add_time('write pages', time.perf_counter() - start)
+        return written
+
+
+def _init_worker(ast, template_dir, asset_urls, profile):
+    templates = TemplateTable(make_environment(template_dir))
+    _worker['renderer'] = renderer = SiteRenderer(ast, templates, AssetUrls(asset_urls))
+    renderer.profile = BuildProfile() if profile else None
+    if profile:
+        renderer.profile.start_tracing()
+
+
+def _render_chunk(jobs):
+    renderer = _worker['renderer']
+    before = renderer.fragments.stats()
+    written = 0
+    with renderer.profile.phase('render (workers)') if renderer.profile is not None else nullcontext():
+        for p, out_file in jobs:
+            written += renderer.write_page(p, out_file)
+    # report only this chunk's share; the worker's cache outlives the chunk
+    after = renderer.fragments.stats()
+    profile = renderer.profile.drain() if renderer.profile is not None else None
+    search = renderer.search.drain() if renderer.search is not None else None
+    return len(jobs), written, {k: after[k] - before[k] for k in after}, profile, search
+
+
+class SerialRenderer:
+    """Render `(page, out_file)` jobs in-process as they are submitted."""
+
+    def __init__(self, ast, templates, assets=None):
+        self.renderer = SiteRenderer(ast, templates, assets)
+        self.rendered = 0
+        self.written = 0
+        self.search = self.renderer.search
+
+    def submit(self, p, out_file):
+        self.written += self.renderer.write_page(p, out_file)
+        self.rendered += 1
+
+    def close(self):
+        return self.rendered, self.written, self.renderer.fragments.stats()
+
+
+class ParallelRenderer:
+    """Render `(page, out_file)` jobs across `workers` processes.
+
+    Each worker builds its own Jinja environment once and renders whole chunks of
+    pages, so the output is identical to a serial build. Jobs are buffered into
+    windows of PARALLEL_WINDOW pages and the number of in-flight chunks is capped,
+    so memory stays bounded however many pages are streamed through.
+    """
+
+    def __init__(self, ast, template_dir, workers, assets=None):
+        # workers never need the page list (and a streamed one can't be pickled)
+        self.ast = {k: v for k, v in ast.items() if k != 'pages'}
+        self.template_dir = template_dir
+        self.asset_urls = assets.urls if assets else {}
+        self.workers = workers
+        self.pool = None
+        self.window = []
+        self.pending = deque()
+        self.rendered = 0
+        self.written = 0
+        self.fragment_stats = FragmentCache().stats()
+        # page text extracted by the workers
+        self.search = SearchCollector() if search_settings(ast.get('options')) else None
+
+    def submit(self, p, out_file):
+        self.window.append((p, out_file))
+        if len(self.window) >= PARALLEL_WINDOW:
+            self._flush()
+
+    def _collect(self):
+        count, written, stats, profile, search = self.pending.popleft().result()
+        self.rendered += count
+        self.written += written
+        add_fragment_stats(self.fragment_stats, stats)
+        if profile is not None:
+            active().merge(profile)
+        if search is not None:
+            self.search.merge(search)
+
+    def _flush(self):
+        jobs, self.window = self.window, []
+        if not jobs:
+            return
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.ast, self.template_dir, self.asset_urls, active() is not None))
+        # a few chunks per worker keeps the pool busy when page costs are uneven
+        chunk_size = max(1, -(-len(jobs) // (self.workers * 4)))
+        for i in range(0, len(jobs), chunk_size):
+            self.pending.append(self.pool.submit(_render_chunk, jobs[i:i + chunk_size]))
+        while len(self.pending) > self.workers * 8:
+            self._collect()
+
+    def close(self):
+        """Wait for all jobs; return pages rendered, files written and fragment counts."""
+        try:
+            self._flush()
+            while self.pending:
+                self._collect()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+        return self.rendered, self.written, self.fragment_stats
+
+
+def render_static_site(ast, template_dir, out_public, incremental=False, workers=1, templates=None):
+    """Render the site's pages using Jinja2 templates found in template_dir and write
+    fully-rendered HTML files into out_public preserving route structure.
+
+    Assets (`assets/` from template_dir and the schema's `assets`) are published
+    under content-hashed names (see assets.py) and references to them in the
+    rendered HTML are rewritten. With `generator.options.minify` pages and
+    stylesheets are minified as they are written (see minify.py). With
+    `generator.options.search` a sharded client-side search index is written under
+    `assets/search/` (see search.py). Text outputs get precompressed `.gz`/`.br`
+    siblings (see compress.py).
+
+    A build manifest is always written to out_public. With `incremental=True` only
+    pages whose inputs changed since the manifest was written are re-rendered;
+    outputs of removed pages are deleted. Files whose bytes don't change are never
+    rewritten, so their mtimes stay stable. Returns rendered/written/unchanged/deleted
+    counts.
+
+    With `workers` > 1 pages are rendered across a pool of worker processes.
+
+    With `ast['shard']` set to `(i, n)` only the pages of shard i of n are rendered
+    and the manifest records what the merge step needs (see shards.py).
+
+    Parameterized routes (e.g. `/products/{slug}`) are expanded from the page's
+    `data` (see routes.py); file-backed data sources are resolved relative to
+    `ast['source_dir']`.
+
+    Pass a warm `templates` TemplateTable to reuse already compiled templates
+    (watch mode does this between rebuilds).
+    """
+    if templates is None:
+        templates = TemplateTable(make_environment(template_dir))
+
+    # prepare output; existing files are kept so unchanged ones can be skipped
+    out = os.path.abspath(out_public)
+    previous = load_manifest(out) if incremental else None
+    os.makedirs(out, exist_ok=True)
+
+    # fingerprint and copy assets first: page HTML refers to their hashed names
+    _, minify_css = minify_settings(ast.get('options'))
+    with phase('assets'):
+        assets, asset_stats = build_assets(template_dir, ast, out, workers=max(workers, 4), minify_css=minify_css)
+    produced = {MANIFEST_NAME} | asset_stats['files']
+    written = asset_stats['copied']
+    unchanged = asset_stats['unchanged']
+
+    old_pages = previous['pages'] if previous else {}
+    new_pages = {}
+    hasher = TemplateHasher(templates.env)
+    if workers > 1:
+        sink = ParallelRenderer(ast, template_dir, workers, assets)
+    else:
+        sink = SerialRenderer(ast, templates, assets)
+    skipped = 0
+    shard = ast.get('shard')
+    routes = {}
+    collisions = []
+
+    # pages are streamed: parameterized routes expand lazily from their data
+    with phase('render'):
+        for p in iter_pages(ast.get('pages', []), ast.get('source_dir')):
+            rel = page_output_file(p.get('route', '/'))
+            if shard is not None:
+                if page_shard(rel, shard[1]) != shard[0]:
+                    continue
+                if rel in routes:
+                    collisions.append([rel, routes[rel], p.get('route', '/')])
+                routes[rel] = p.get('route', '/')
+            digest = page_input_hash(ast, p, hasher, assets.urls)
+            new_pages[rel] = digest
+            out_file = os.path.join(out, rel)
+            if old_pages.get(rel) == digest and os.path.exists(out_file):
+                skipped += 1
+                continue
+            sink.submit(p, out_file)
+        rendered, pages_written, fragment_stats = sink.close()
+    written += pages_written
+    unchanged += skipped + rendered - pages_written
+    produced.update(new_pages)
+
+    search = search_settings(ast.get('options'))
+    if search is not None:
+        with phase('search'):
+            search_stats = build_search_index(out, sink.search.docs, new_pages, search, incremental,
+                                              index=shard is None)
+        written += search_stats['written']
+        unchanged += search_stats['unchanged']
+        produced |= search_stats['files']
+    else:
+        search_stats = {'stale': previous_search_files(out) if previous is not None else set()}
+
+    # precompressed .gz/.br siblings; only outputs newer than their variants are compressed
+    with phase('compress'):
+        compressed = compress_outputs(out, produced - {MANIFEST_NAME, SEARCH_STATE, ASSET_STATE},
+                                      workers=max(workers, 4))
+    written += compressed['written']
+    unchanged += compressed['unchanged']
+    produced |= compressed['files']
+
+    with phase('cleanup'):
+        if previous is None:
+            # full build: anything this build didn't produce is stale
+            deleted = prune_tree(out, produced)
+        else:
+            stale = (set(old_pages) - set(new_pages)) | asset_stats['stale'] | search_stats['stale']
+            deleted = remove_stale_outputs(out, stale | variant_paths(stale), produced)
+        if shard is None:
+            save_manifest(out, new_pages)
+        else:
+            save_manifest(out, new_pages, {
+                'number': shard[0], 'count': shard[1], 'site': site_hash(ast, assets.urls, hasher),
+                'routes': routes, 'collisions': collisions,
+            })
+    if incremental:
+        print(f'Incremental build: {rendered} rendered, {skipped} unchanged, {deleted} removed')
+    print('Fragment cache: {hits} hits, {misses} misses, {uncached} page-dependent renders'.format(**fragment_stats))
+    print(f'Output: {written} files written, {unchanged} unchanged, {deleted} deleted')
+    return {'rendered': rendered, 'written': written, 'unchanged': unchanged, 'deleted': deleted}
@@ -0,0 +1,112 @@
+"""Precompressed output variants.
+
+After rendering, every text output (HTML, CSS, JS, JSON, SVG, ...) of at least
+MIN_SIZE bytes gets a `.gz` sibling and, when the `brotli` package is installed,
+a `.br` sibling, so servers can send compressed bytes without compressing per
+request. Files are compressed on a thread pool (zlib and brotli release the GIL).
+A variant is only rebuilt when it is older than its source; since unchanged
+outputs keep their mtime, repeated builds don't recompress anything.
+
+gzip output is written with a zero timestamp, so identical input always gives
+identical bytes.
+"""
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .publish import write_file
+
+COMPRESSIBLE = {'.html', '.css', '.js', '.mjs', '.json', '.svg', '.txt', '.xml', '.map'}
+# below this the compressed response isn't meaningfully smaller than the headers
+MIN_SIZE = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def encodings():
+    """Return the `(extension, compress)` pairs available in this environment."""
+    codecs = [('.gz', lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0))]
+    brotli = _brotli()
+    if brotli is not None:
+        codecs.append(('.br', lambda data: brotli.compress(data, quality=BROTLI_QUALITY)))
+    return codecs
+
+
+def variant_paths(rels):
+    """Every variant a set of outputs may have had, whether or not it exists."""
+    return {rel + ext for rel in rels for ext in ('.gz', '.br')}
+
+
+def is_compressible(rel):
+    return os.path.splitext(rel)[1].lower() in COMPRESSIBLE
+
+
+def _compress_one(path, codecs):
+    """Refresh the variants of one file; returns (written, unchanged)."""
+    written = unchanged = 0
+    src_mtime = os.stat(path).st_mtime_ns
+    data = None
+    for ext, compress in codecs:
+        target = path + ext
+        try:
+            if os.stat(target).st_mtime_ns >= src_mtime:
+                unchanged += 1
+                continue
+        except FileNotFoundError:
+            pass
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        compressed = compress(data)
+        if write_file(target, compressed):
+            written += 1
+        else:
+            # same bytes but older than the source: replace it so the next check is cheap.
+            # Not os.utime(): in an atomic build the file is a hardlink to the one being served
+            write_file(target, compressed, force=True)
+            unchanged += 1
+    return written, unchanged
+
+
+def compress_outputs(out, rels, workers=None):
+    """Write compressed variants for the compressible files among `rels`.
+
+    Returns `{'written', 'unchanged', 'files'}` where `files` are the variant paths
+    (relative to out) that now exist. Variants of files that are too small are
+    removed.
+    """
+    codecs = encodings()
+    jobs = []
+    files = set()
+    for rel in rels:
+        if not is_compressible(rel):
+            continue
+        path = os.path.join(out, rel)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if size < MIN_SIZE:
+            for variant in variant_paths([rel]):
+                try:
+                    os.remove(os.path.join(out, variant))
+                except FileNotFoundError:
+                    pass
+            continue
+        jobs.append(path)
+        files |= {rel + ext for ext, _ in codecs}
+
+    written = unchanged = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for w, u in pool.map(lambda path: _compress_one(path, codecs), jobs):
+            written += w
+            unchanged += u
+    return {'written': written, 'unchanged': unchanged, 'files': files}
@@ -0,0 +1,229 @@
+"""Form handler specs shared by the server backends.
+
+The schema's `forms` are compiled once at build time into plain specs that the
+generated servers embed: per field the checks to run (required, length bounds,
+a full-match pattern, number bounds, allowed values), with the patterns implied
+by the field type (`email`, `url`, `number`) filled in and every pattern checked
+to compile. Python `re`, JavaScript (`new RegExp(p, 'u')`) and PCRE disagree on
+much of their syntax, so patterns are limited to the subset all three read the
+same way (see portable_pattern_error). The servers turn the specs into validator functions when they start,
+so a submission only runs the checks.
+
+`validation` on a field accepts `minLength`, `maxLength`, `pattern`, `min`,
+`max` and `enum`. Text fields get a default `maxLength` so a submission's size is
+bounded. CSRF protection is on unless a form sets `"csrf": false`: the handler
+then requires the request's `Origin` (or `Referer`) to match its `Host`, which
+works for pre-rendered pages that can't carry a per-session token.
+
+Only forms whose action is a path on this site get a handler; a form posting to
+another service (`https://formspree.io/f/...`) is left to it, with a warning.
+The JSON Schema leaves `validation` open, so `check_forms` reports what the
+handlers can't compile (unknown validation keys are ignored with a warning);
+`generate()` runs it before building with a backend that writes handlers.
+
+Storage and limits come from `generator.options.forms` (see FORM_DEFAULTS): the
+SQLite database (WAL mode; by default `data/forms.sqlite3` inside the project,
+a directory atomic publishing carries over between builds), the bounded in-memory queue feeding the batched
+writer, the batch size, the request body limit and the per-IP rate limit.
+"""
+import re
+
+# project subdirectory for data the running site writes; publish_dir keeps it across builds
+DATA_DIR = 'data'
+FORM_DEFAULTS = {
+    # relative paths resolve against the generated project's directory
+    'database': DATA_DIR + '/forms.sqlite3',
+    'queueSize': 10000,
+    'batchSize': 500,
+    'maxBodyBytes': 64 * 1024,
+    # token bucket per client IP: `requests` per `perSeconds`, in each server process
+    'rateLimit': {'requests': 30, 'perSeconds': 60},
+    # take the client IP from X-Forwarded-For (only behind a proxy that sets it)
+    'trustProxy': False,
+}
+VALIDATION_KEYS = {'minLength', 'maxLength', 'pattern', 'min', 'max', 'enum'}
+DEFAULT_MAX_LENGTH = 1000
+TYPE_MAX_LENGTH = {'textarea': 20000}
+TYPE_PATTERNS = {
+    'email': r'[^@\s]+@[^@\s]+\.[^@\s]+',
+    'url': r'https?://[^\s]+',
+    'number': r'-?[0-9]+(\.[0-9]+)?',
+}
+# for PCRE literals: the first of these that doesn't occur in the pattern
+PCRE_DELIMITERS = '~#%!@;,'
+# escapes that mean the same in Python re, JavaScript with the u flag and PCRE
+# (the u flag rejects identity escapes of anything but syntax characters)
+SYNTAX_CHARS = set('^$\\.*+?()[]{}|/')
+PORTABLE_ESCAPES = set('dDwWsSbBtnrf123456789') | SYNTAX_CHARS
+PORTABLE_CLASS_ESCAPES = set('dDwWstnrf-') | SYNTAX_CHARS
+QUANTIFIER_RE = re.compile(r'\{[0-9]+(,[0-9]*)?\}')
+HEX2_RE = re.compile(r'[0-9A-Fa-f]{2}')
+
+
+def form_settings(options):
+    """Return `generator.options.forms` merged over FORM_DEFAULTS."""
+    settings = dict(FORM_DEFAULTS)
+    settings.update((options or {}).get('forms') or {})
+    settings['rateLimit'] = dict(FORM_DEFAULTS['rateLimit'], **(settings.get('rateLimit') or {}))
+    return settings
+
+
+def portable_pattern_error(pattern):
+    """Why `pattern` may not compile or match alike in all three handlers, or None.
+
+    Allowed: literals, `.`, `^`, `$`, alternation, `( )`, `(?: )`, lookarounds
+    `(?= )`, `(?! )`, `(?<= )`, `(?<! )`, greedy and lazy quantifiers including
+    `{n}`, `{n,}` and `{n,m}`, character classes, backreferences `\\1`-`\\9`,
+    `\\xHH` and the escapes in PORTABLE_ESCAPES.
+    """
+    i = 0
+    n = len(pattern)
+    in_class = False
+    quantified = False
+    while i < n:
+        c = pattern[i]
+        after_quantifier, quantified = quantified, False
+        if c == '\\':
+            e = pattern[i + 1:i + 2]
+            if e == 'x' and HEX2_RE.match(pattern, i + 2):
+                i += 4
+                continue
+            if e not in (PORTABLE_CLASS_ESCAPES if in_class else PORTABLE_ESCAPES):
+                return f'escape \\{e} differs between Python, JavaScript and PCRE'
+            i += 2
+            continue
+        if in_class:
+            if c == '[':
+                return 'unescaped [ inside a character class (POSIX classes and nested sets are not portable)'
+            if c == ']':
+                in_class = False
+            i += 1
+            continue
+        if c == '[':
+            i += 2 if pattern.startswith('^', i + 1) else 1
+            if pattern.startswith(']', i):
+                return 'empty character class or a leading ] (escape it as \\])'
+            in_class = True
+            continue
+        if c == '(' and pattern.startswith('?', i + 1):
+            for opener in ('(?:', '(?=', '(?!', '(?<=', '(?<!'):
+                if pattern.startswith(opener, i):
+                    break
+            else:
+                return (f'group {pattern[i:i + 4]!r}...: named groups, inline flags, comments, atomic and '
+                        f'conditional groups are not portable')
+            i += len(opener)
+            continue
+        if c == '{':
+            m = QUANTIFIER_RE.match(pattern, i)
+            if m is None:
+                return 'a literal { must be escaped as \\{'
+            i = m.end()
+            quantified = True
+            continue
+        if c in '}]':
+            return f'a literal {c} must be escaped as \\{c}'
+        if c in '*+?':
+            if c == '+' and after_quantifier:
+                return 'possessive quantifiers are not portable'
+            quantified = c != '?' or not after_quantifier
+        i += 1
+    return None
+
+
+def compile_field(form_id, field):
+    name = field['name']
+    ftype = field.get('type', 'text')
+    rules = {k: v for k, v in (field.get('validation') or {}).items() if k in VALIDATION_KEYS}
+    spec = {
+        'name': name,
+        'required': bool(field.get('required', False)),
+        'minLength': int(rules.get('minLength', 0)),
+        'maxLength': int(rules.get('maxLength', TYPE_MAX_LENGTH.get(ftype, DEFAULT_MAX_LENGTH))),
+        'pattern': rules.get('pattern', TYPE_PATTERNS.get(ftype)),
+        'number': ftype == 'number' or 'min' in rules or 'max' in rules,
+        'min': rules.get('min'),
+        'max': rules.get('max'),
+        'enum': [str(v) for v in rules['enum']] if 'enum' in rules else None,
+    }
+    if spec['pattern'] is not None:
+        try:
+            re.compile(spec['pattern'])
+        except re.error as e:
+            raise ValueError(f'Form {form_id!r} field {name!r}: invalid pattern {spec["pattern"]!r}: {e}') from None
+        problem = portable_pattern_error(spec['pattern'])
+        if problem:
+            raise ValueError(f'Form {form_id!r} field {name!r}: pattern {spec["pattern"]!r} is not portable '
+                             f'to the Node and PHP handlers: {problem}')
+    return spec
+
+
+def pcre_literal(pattern):
+    """The pattern as an anchored PCRE literal for preg_match."""
+    for delim in PCRE_DELIMITERS:
+        if delim not in pattern:
+            return f'{delim}^(?:{pattern})${delim}Du'
+    raise ValueError(f'Pattern {pattern!r} uses every PCRE delimiter in {PCRE_DELIMITERS!r}')
+
+
+def is_local_action(action):
+    """True for actions the generated handlers serve: paths on this site, not `//host/...`."""
+    return action.startswith('/') and not action.startswith('//')
+
+
+def check_forms(forms):
+    """Return `(errors, warnings)` for compiling handlers for `forms` (id -> form).
+
+    Errors keep the handlers from being generated; warnings name forms that get
+    no handler and validation keys that are ignored.
+    """
+    errors = []
+    warnings = []
+    seen = {}
+    for form_id, form in sorted(forms.items()):
+        action = form['action']
+        if not is_local_action(action):
+            warnings.append(f'Form {form_id!r}: action {action!r} is not a path on this site; no handler is generated')
+            continue
+        key = (form['method'], action)
+        if key in seen:
+            errors.append(f'Forms {seen[key]!r} and {form_id!r} both handle {form["method"]} {action}')
+        seen[key] = form_id
+        for field in form['fields']:
+            unknown = set(field.get('validation') or {}) - VALIDATION_KEYS
+            if unknown:
+                warnings.append(f'Form {form_id!r} field {field["name"]!r}: ignoring unsupported validation '
+                                f'{sorted(unknown)} (supported: {sorted(VALIDATION_KEYS)})')
+            try:
+                spec = compile_field(form_id, field)
+                if spec['pattern'] is not None:
+                    pcre_literal(spec['pattern'])
+            except ValueError as e:
+                errors.append(str(e))
+    return errors, warnings
+
+
+def compile_forms(ast):
+    """Return the handler specs for the AST's local forms, ordered by action.
+
+    Prints check_forms' warnings; raises ValueError if it reports errors.
+    """
+    forms = ast.get('forms') or {}
+    errors, warnings = check_forms(forms)
+    if errors:
+        raise ValueError('Form errors:\n' + '\n'.join(errors))
+    for warning in warnings:
+        print('Warning:', warning)
+    specs = []
+    for form_id, form in sorted(forms.items()):
+        if not is_local_action(form['action']):
+            continue
+        specs.append({
+            'id': form_id,
+            'action': form['action'],
+            'method': form['method'],
+            'csrf': form.get('csrf', True) is not False,
+            'fields': [compile_field(form_id, f) for f in form['fields']],
+        })
+    specs.sort(key=lambda s: (s['action'], s['method']))
+    return specs
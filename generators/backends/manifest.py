@@ -0,0 +1,113 @@
+"""Build manifest used for incremental rendering.
+
+The manifest lives in the rendered output directory and records, for every
+written page, a hash of everything that page's HTML depends on (the page dict,
+its layout, the merged component props, the template sources it touched and
+`project`). A later build only re-renders pages whose hash changed and removes
+outputs of pages that no longer exist.
+"""
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+
+from jinja2 import meta
+
+MANIFEST_NAME = '.virtoweb-manifest.json'
+# bump when the renderer changes in a way that alters output for identical inputs
+MANIFEST_VERSION = 1
+
+
+def _jsonable(obj):
+    # AST nodes (see core/nodes.py) hash exactly like the dicts they replace
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return str(obj)
+
+
+def hash_obj(obj):
+    data = json.dumps(obj, sort_keys=True, separators=(',', ':'), default=_jsonable)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def load_manifest(out):
+    path = os.path.join(out, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(out, pages, shard=None):
+    """Write the manifest; `pages` maps output path (relative to out) -> input hash.
+
+    A shard build (see shards.py) also records `shard`: its number, the shard
+    count and what the merge step checks.
+    """
+    path = os.path.join(out, MANIFEST_NAME)
+    tmp = path + '.tmp'
+    manifest = {'version': MANIFEST_VERSION, 'pages': pages}
+    if shard is not None:
+        manifest['shard'] = shard
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def remove_stale_outputs(out, old_pages, new_pages):
+    """Delete outputs recorded in the previous manifest that this build did not produce."""
+    removed = 0
+    for rel in old_pages:
+        if rel in new_pages:
+            continue
+        path = os.path.join(out, rel)
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+        # prune directories left empty by the removal, stopping at the output root
+        d = os.path.dirname(path)
+        while d != out and d.startswith(out):
+            try:
+                os.rmdir(d)
+            except OSError:
+                break
+            d = os.path.dirname(d)
+    return removed
+
+
+class TemplateHasher:
+    """Hash template sources, following `{% include %}`/`{% extends %}` references.
+
+    Hashes are memoized for the lifetime of the object (one build).
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._hashes = {}
+
+    def hash(self, name):
+        if name in self._hashes:
+            return self._hashes[name]
+        # guard against include cycles while we recurse
+        self._hashes[name] = None
+        try:
+            source, _, _ = self.env.loader.get_source(self.env, name)
+        except Exception:
+            self._hashes[name] = 'missing'
+            return 'missing'
+        h = hashlib.sha256(source.encode('utf-8'))
+        try:
+            refs = sorted(r for r in meta.find_referenced_templates(self.env.parse(source)) if r)
+        except Exception:
+            refs = []
+        for ref in refs:
+            h.update(ref.encode('utf-8'))
+            h.update((self.hash(ref) or '').encode('utf-8'))
+        self._hashes[name] = h.hexdigest()
+        return self._hashes[name]
@@ -0,0 +1,105 @@
+"""HTML and CSS minification.
+
+Enabled through `generator.options.minify` in the project schema: `true` minifies
+both HTML and CSS, or use `{"html": true, "css": false}` to pick. Pages are
+minified as they are rendered and stylesheets as they are published, so no
+extra pass over the output tree is needed.
+
+The HTML minifier is deliberately conservative: comments are dropped (except
+IE conditional comments), whitespace runs in text collapse to one space, and
+whitespace next to block-level tags is removed. Tags and attribute values are
+left untouched, as are `<pre>`, `<textarea>` and `<script>` elements; `<style>`
+contents go through the CSS minifier.
+"""
+import re
+
+_HTML_TOKEN = re.compile(
+    r'(<!--.*?-->'
+    r'|<(pre|textarea|script|style)\b[^>]*>.*?</\2\s*>'
+    r'|<[^>]*>)',
+    re.S | re.I,
+)
+BLOCK_TAG = re.compile(
+    r'</?(?:html|head|body|title|meta|link|base|header|footer|main|nav|section|article|aside'
+    r'|div|p|h[1-6]|ul|ol|li|dl|dt|dd|table|thead|tbody|tfoot|tr|td|th|form|fieldset|legend'
+    r'|figure|figcaption|blockquote|hr|br|address|details|summary|option|select|noscript|!doctype)\b',
+    re.I,
+)
+_WS = re.compile(r'\s+')
+_STYLE = re.compile(r'(<style\b[^>]*>)(.*?)(</style\s*>)', re.S | re.I)
+
+_CSS_TOKEN = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|/\*.*?\*/)', re.S)
+_CSS_PUNCT = re.compile(r'\s*([{};,>])\s*')
+_CSS_COLON = re.compile(r':\s+')
+
+
+def minify_settings(options):
+    """Return `(html, css)` flags from the `generator.options` dict."""
+    value = (options or {}).get('minify', False)
+    if isinstance(value, dict):
+        return bool(value.get('html', True)), bool(value.get('css', True))
+    return bool(value), bool(value)
+
+
+def minify_css(css):
+    out = []
+    for i, part in enumerate(_CSS_TOKEN.split(css)):
+        if i % 2:
+            # strings are kept verbatim; comments are dropped unless marked /*! ... */
+            if part.startswith('/*'):
+                if part.startswith('/*!'):
+                    out.append(part)
+                continue
+            out.append(part)
+            continue
+        part = _WS.sub(' ', part)
+        part = _CSS_PUNCT.sub(r'\1', part)
+        part = _CSS_COLON.sub(':', part)
+        out.append(part)
+    css = ''.join(out).strip()
+    return css.replace(';}', '}')
+
+
+def minify_html(html, css=True):
+    tokens = _HTML_TOKEN.split(html)
+    # split() yields text, token, tag-name group, text, ...; fold into (kind, value)
+    parts = []
+    for i in range(0, len(tokens), 3):
+        parts.append(('text', tokens[i]))
+        if i + 1 < len(tokens):
+            parts.append(('tag', tokens[i + 1]))
+
+    out = []
+    for i, (kind, value) in enumerate(parts):
+        if kind == 'tag':
+            if value.startswith('<!--'):
+                if value.startswith('<!--[if'):
+                    out.append(value)
+                continue
+            if css and value[:6].lower() == '<style':
+                value = _STYLE.sub(lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), value)
+            out.append(value)
+            continue
+        if not value:
+            continue
+        text = _WS.sub(' ', value)
+        if text.startswith(' ') and (_at_block(parts, i, -1) or (out and out[-1].endswith(' '))):
+            text = text[1:]
+        if text.endswith(' ') and _at_block(parts, i, 1):
+            text = text[:-1]
+        out.append(text)
+    return ''.join(out)
+
+
+def _at_block(parts, i, step):
+    """True if the nearest tag before/after parts[i] (skipping comments) is block-level."""
+    i += step
+    while 0 <= i < len(parts):
+        kind, value = parts[i]
+        if kind == 'tag' and not value.startswith('<!--'):
+            return bool(BLOCK_TAG.match(value))
+        if kind == 'text' and value.strip():
+            return False
+        i += step
+    # start or end of the document
+    return True
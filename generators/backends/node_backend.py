@@ -1,28 +1,53 @@
+import json
 import os
-import shutil
+
+from .forms import DATA_DIR, compile_forms, form_settings
+from .publish import publish_dir, write_file
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
+# generator.options.server: workers 0 = one per CPU, 1 = single process
+SERVER_DEFAULTS = {
+    'port': 3000,
+    'workers': 0,
+    'memoryCacheBytes': 64 * 1024 * 1024,
+    'routeCheckInterval': 2,
+}
 
 
 class NodeBackend:
-    """Scaffold a minimal Express app that serves static HTML files.
+    """Scaffold an Express app that serves the pre-rendered site.
 
-    This backend produces a small Node project with an `express` server that serves the
-    generated `public/` folder. The generated project includes `package.json` and a tiny server.
+    This backend produces a small Node project whose `server.js` serves the generated
+    `public/` folder from a route table built at startup, optionally across a cluster
+    of worker processes. Server settings come from `generator.options.server`.
+    When the schema defines `forms`, `form-handlers.js` answers their actions and
+    stores submissions in SQLite (see forms.py).
     """
 
-    def generate(self, ast, output_dir):
+    # subdirectory of the project that holds the pre-rendered site
+    PUBLIC = 'public'
+
+    # writes handlers for the schema's forms (see forms.py)
+    FORM_HANDLERS = True
+    # left in place by builds (see publish.publish_dir): the form database lives there
+    KEEP = (DATA_DIR,)
+
+    def generate(self, ast, output_dir, incremental=False, workers=1, atomic=True):
         out = os.path.abspath(output_dir)
-        if os.path.exists(out):
-            shutil.rmtree(out)
-        os.makedirs(out, exist_ok=True)
+        # build into a staged copy of the project and swap it in when done
+        with publish_dir(out, atomic, keep=self.KEEP) as stage:
+            # Render static HTML into public/ using Jinja2 templates
+            from .common import render_static_site
+            public = os.path.join(stage, self.PUBLIC)
+            render_static_site(ast, TEMPLATE_DIR, public, incremental=incremental, workers=workers)
+            self.scaffold(ast, stage)
 
-        # Render static HTML into public/ using Jinja2 templates
-        from .common import render_static_site
-        public = os.path.join(out, 'public')
-        render_static_site(ast, TEMPLATE_DIR, public)
+        print('Node (Express) backend: generated project at', out)
 
+    def scaffold(self, ast, out):
+        """Write the server scaffold around an already rendered public/ folder."""
+        forms = compile_forms(ast)
         # package.json
         pkg = {
             'name': ast['project'].get('id', 'virtoweb-node-site'),
@@ -31,19 +56,551 @@ class NodeBackend:
             'scripts': {'start': 'node server.js'},
             'dependencies': {'express': '^4.18.0'}
         }
-        import json
-        with open(os.path.join(out, 'package.json'), 'w', encoding='utf-8') as f:
-            json.dump(pkg, f, indent=2)
+        if forms:
+            pkg['dependencies']['better-sqlite3'] = '^11.0.0'
+        write_file(os.path.join(out, 'package.json'), json.dumps(pkg, indent=2))
+
+        # server settings from generator.options.server (see server.js for their meaning)
+        config = dict(SERVER_DEFAULTS)
+        config.update((ast.get('options') or {}).get('server') or {})
 
         server_js = """
+// Serve the pre-rendered site in public/.
+//
+// Every file under public/ is indexed once at startup into a route table
+// (URL -> file, content type, strong ETag, cache policy, precompressed variants),
+// so a request is a Map lookup. Conditional requests are answered with 304 and hot
+// HTML is served from an in-memory LRU bounded by CONFIG.memoryCacheBytes. The
+// table is rebuilt after a new build is published.
+//
+// With CONFIG.workers > 1 (0 = one per CPU) the primary process forks that many
+// workers sharing the listening socket, and replaces any that exit.
+//
+// Settings come from generator.options.server in the project schema; the PORT and
+// WEB_CONCURRENCY environment variables override them.
+const cluster = require('cluster');
 const express = require('express');
+const fs = require('fs');
+const os = require('os');
 const path = require('path');
-const app = express();
-const port = process.env.PORT || 3000;
-app.use(express.static(path.join(__dirname, 'public')));
-app.listen(port, () => console.log(`Server running on port ${port}`));
+
+const CONFIG = __CONFIG__;
+const port = process.env.PORT || CONFIG.port;
+const workers = parseInt(process.env.WEB_CONCURRENCY || CONFIG.workers, 10) || os.cpus().length;
+const PUBLIC = path.join(__dirname, 'public');
+// rewritten by every build
+const MANIFEST = path.join(PUBLIC, '.virtoweb-manifest.json');
+// fingerprinted assets (name.<hash>.ext) never change: cache them for a year
+const FINGERPRINTED = /\\.[0-9a-f]{10}\\.[A-Za-z0-9]+$/;
+const CACHE_IMMUTABLE = 'public, max-age=31536000, immutable';
+// pages must be revalidated (cheap: a 304 via the ETag) so deploys show up at once
+const CACHE_PAGE = 'no-cache';
+const CACHE_ASSET = 'public, max-age=3600';
+// precompressed siblings written by the generator, in order of preference
+const ENCODINGS = [['br', '.br'], ['gzip', '.gz']];
+const TYPES = {
+  '.html': 'text/html; charset=utf-8', '.css': 'text/css; charset=utf-8',
+  '.js': 'application/javascript; charset=utf-8', '.mjs': 'application/javascript; charset=utf-8',
+  '.json': 'application/json; charset=utf-8', '.txt': 'text/plain; charset=utf-8',
+  '.xml': 'application/xml', '.svg': 'image/svg+xml', '.png': 'image/png', '.jpg': 'image/jpeg',
+  '.jpeg': 'image/jpeg', '.gif': 'image/gif', '.webp': 'image/webp', '.avif': 'image/avif',
+  '.ico': 'image/x-icon', '.woff': 'font/woff', '.woff2': 'font/woff2', '.map': 'application/json',
+};
+
+// Byte-bounded LRU of file bodies; Map iteration order doubles as recency order.
+class LRU {
+  constructor(budget) {
+    this.budget = budget;
+    this.bytes = 0;
+    this.map = new Map();
+  }
+
+  get(key) {
+    const value = this.map.get(key);
+    if (value !== undefined) {
+      this.map.delete(key);
+      this.map.set(key, value);
+    }
+    return value;
+  }
+
+  set(key, value) {
+    if (value.length > this.budget) return;
+    if (this.map.has(key)) {
+      this.bytes -= this.map.get(key).length;
+      this.map.delete(key);
+    }
+    this.map.set(key, value);
+    this.bytes += value.length;
+    for (const [oldest, body] of this.map) {
+      if (this.bytes <= this.budget) break;
+      this.map.delete(oldest);
+      this.bytes -= body.length;
+    }
+  }
+
+  clear() {
+    this.map.clear();
+    this.bytes = 0;
+  }
+}
+
+function cacheControl(rel) {
+  if (FINGERPRINTED.test(rel)) return CACHE_IMMUTABLE;
+  if (rel.endsWith('.html')) return CACHE_PAGE;
+  return CACHE_ASSET;
+}
+
+function loadEntry(file, rel, type, encoding) {
+  const st = fs.statSync(file);
+  const etag = `"${Math.floor(st.mtimeMs * 1000).toString(16)}-${st.size.toString(16)}${encoding ? '-' + encoding : ''}"`;
+  const headers = {
+    'Content-Type': type,
+    'Content-Length': st.size,
+    'ETag': etag,
+    'Last-Modified': st.mtime.toUTCString(),
+    'Cache-Control': cacheControl(rel),
+  };
+  if (encoding) headers['Content-Encoding'] = encoding;
+  return { file, etag, mtime: Math.floor(st.mtimeMs / 1000), headers, html: rel.endsWith('.html'), variants: [] };
+}
+
+function buildRoutes(root) {
+  const routes = new Map();
+  const walk = (dir) => {
+    for (const item of fs.readdirSync(dir, { withFileTypes: true })) {
+      // build manifests and other dotfiles are not part of the site
+      if (item.name.startsWith('.')) continue;
+      const file = path.join(dir, item.name);
+      if (item.isDirectory()) {
+        walk(file);
+        continue;
+      }
+      if (ENCODINGS.some(([, ext]) => item.name.endsWith(ext))) continue;
+      const rel = path.relative(root, file).split(path.sep).join('/');
+      const type = TYPES[path.extname(item.name).toLowerCase()] || 'application/octet-stream';
+      const entry = loadEntry(file, rel, type);
+      for (const [coding, ext] of ENCODINGS) {
+        if (fs.existsSync(file + ext)) entry.variants.push([coding, loadEntry(file + ext, rel, type, coding)]);
+      }
+      if (entry.variants.length) {
+        entry.headers['Vary'] = 'Accept-Encoding';
+        for (const [, variant] of entry.variants) variant.headers['Vary'] = 'Accept-Encoding';
+      }
+      routes.set('/' + rel, entry);
+      if (item.name === 'index.html') {
+        const base = '/' + rel.slice(0, -'index.html'.length);
+        routes.set(base, entry);
+        if (base !== '/') routes.set(base.slice(0, -1), entry);
+      }
+    }
+  };
+  if (fs.existsSync(root)) walk(root);
+  return routes;
+}
+
+// Map each coding named in Accept-Encoding to whether it is acceptable (q > 0).
+function acceptedEncodings(header) {
+  const accepted = new Map();
+  for (const part of (header || '').split(',')) {
+    const [coding, ...params] = part.trim().split(';');
+    const q = params.map(p => p.trim()).find(p => p.startsWith('q='));
+    accepted.set(coding.trim().toLowerCase(), !q || parseFloat(q.slice(2)) > 0);
+  }
+  return accepted;
+}
+
+// The first of `variants` ([coding, entry] pairs) that the Accept-Encoding header allows.
+function pickVariant(variants, header) {
+  const accepted = acceptedEncodings(header);
+  for (const [coding, variant] of variants) {
+    // an explicit q=0 for the coding overrides `*`
+    if (accepted.has(coding) ? accepted.get(coding) : accepted.get('*')) return variant;
+  }
+  return undefined;
+}
+
+function notModified(req, entry) {
+  const match = req.headers['if-none-match'];
+  if (match !== undefined) {
+    // If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    return match.split(',').some(tag => {
+      tag = tag.trim();
+      if (tag.startsWith('W/')) tag = tag.slice(2);
+      return tag === '*' || tag === entry.etag;
+    });
+  }
+  const since = Date.parse(req.headers['if-modified-since']);
+  return !Number.isNaN(since) && entry.mtime <= since / 1000;
+}
+
+function staticSite(root, budget) {
+  const cache = new LRU(budget);
+  let routes = buildRoutes(root);
+  let stamp;
+  let nextCheck = 0;
+
+  const refresh = () => {
+    // every build rewrites its manifest, and atomic publishing swaps the directory
+    let current = null;
+    try {
+      current = `${fs.statSync(root).ino}:${fs.statSync(MANIFEST).mtimeMs}`;
+    } catch (e) {
+      current = null;
+    }
+    if (current !== stamp) {
+      // the first call only records the stamp of the tree indexed above
+      if (stamp !== undefined) {
+        routes = buildRoutes(root);
+        cache.clear();
+      }
+      stamp = current;
+    }
+  };
+  refresh();
+
+  return (req, res, next) => {
+    if (req.method !== 'GET' && req.method !== 'HEAD') return next();
+    const now = Date.now();
+    if (now >= nextCheck) {
+      refresh();
+      nextCheck = now + CONFIG.routeCheckInterval * 1000;
+    }
+    let pathname;
+    try {
+      pathname = decodeURIComponent(req.path);
+    } catch (e) {
+      return next();
+    }
+    let entry = routes.get(pathname);
+    if (entry === undefined) return next();
+
+    if (entry.variants.length) entry = pickVariant(entry.variants, req.headers['accept-encoding']) || entry;
+
+    if (notModified(req, entry)) {
+      const headers = { 'ETag': entry.etag, 'Last-Modified': entry.headers['Last-Modified'], 'Cache-Control': entry.headers['Cache-Control'] };
+      if (entry.headers['Vary']) headers['Vary'] = entry.headers['Vary'];
+      res.writeHead(304, headers);
+      return res.end();
+    }
+    res.writeHead(200, entry.headers);
+    if (req.method === 'HEAD') return res.end();
+    if (entry.html) {
+      const body = cache.get(entry.file);
+      if (body !== undefined) return res.end(body);
+      return fs.readFile(entry.file, (err, data) => {
+        if (err) return res.destroy(err);
+        cache.set(entry.file, data);
+        res.end(data);
+      });
+    }
+    fs.createReadStream(entry.file).on('error', err => res.destroy(err)).pipe(res);
+  };
+}
+
+function serve() {
+  const app = express();
+  app.disable('x-powered-by');
+__FORMS_HOOK__  app.use(staticSite(PUBLIC, CONFIG.memoryCacheBytes));
+  app.use((req, res) => res.status(404).send('Not found'));
+  const server = app.listen(port, () => console.log(`Server ${process.pid} running on port ${port}`));
+  server.keepAliveTimeout = 5000;
+}
+
+const isPrimary = cluster.isPrimary === undefined ? cluster.isMaster : cluster.isPrimary;
+if (workers > 1 && isPrimary) {
+  console.log(`Primary ${process.pid}: starting ${workers} workers`);
+  for (let i = 0; i < workers; i++) cluster.fork();
+  cluster.on('exit', (worker, code, signal) => {
+    console.log(`Worker ${worker.process.pid} exited (${signal || code}); restarting`);
+    cluster.fork();
+  });
+} else {
+  serve();
+}
 """
-        with open(os.path.join(out, 'server.js'), 'w', encoding='utf-8') as f:
-            f.write(server_js)
+        server_js = server_js.replace('__CONFIG__', json.dumps(config, sort_keys=True))
+        handlers = os.path.join(out, 'form-handlers.js')
+        if forms:
+            source = FORM_HANDLERS_JS.replace('__FORMS__', json.dumps(forms, indent=2))
+            source = source.replace('__SETTINGS__', json.dumps(form_settings(ast.get('options')), indent=2))
+            write_file(handlers, source)
+            # form actions are answered before the static site
+            server_js = server_js.replace('__FORMS_HOOK__', "  app.use(require('./form-handlers')());\n")
+        else:
+            server_js = server_js.replace('__FORMS_HOOK__', '')
+            if os.path.exists(handlers):
+                os.remove(handlers)
+        write_file(os.path.join(out, 'server.js'), server_js)
 
-        print('Node (Express) backend: generated project at', out)
+
+FORM_HANDLERS_JS = r"""// Form submission handlers generated from the project schema's `forms`.
+//
+// A request to a form's action is checked for a same-origin Origin/Referer (when
+// the form has CSRF protection) and against a per-IP token bucket, then its
+// fields are validated and the submission is queued. The queue is written to
+// SQLite (better-sqlite3, WAL mode) once per event-loop turn, up to
+// SETTINGS.batchSize rows per transaction, so submissions that arrive together
+// share a commit. When SETTINGS.queueSize submissions are waiting (the database
+// is locked by another process) the handler answers 503 with Retry-After.
+// Queued submissions are written before the process exits.
+//
+// Responses: 303 back to the referring page (or 202 with JSON when the request
+// accepts application/json), 422 with the field errors, 403 for cross-site
+// posts, 413, 415, 429 and 503.
+//
+// Rows go to the `submissions` table (form, received, ip, data as JSON) of the
+// database at FORMS_DATABASE (environment) or the schema's
+// generator.options.forms.database, relative to this project's directory. The
+// default, data/forms.sqlite3, is carried over when the project is rebuilt.
+const fs = require('fs');
+const path = require('path');
+const Database = require('better-sqlite3');
+
+const FORMS = __FORMS__;
+const SETTINGS = __SETTINGS__;
+const DATABASE = path.resolve(__dirname, process.env.FORMS_DATABASE || SETTINGS.database);
+// rate limiter entries kept before refilled buckets are dropped
+const MAX_TRACKED_CLIENTS = 100000;
+
+function compileValidator(fields) {
+  const checks = fields.map(f => ({
+    ...f,
+    pattern: f.pattern === null ? null : new RegExp('^(?:' + f.pattern + ')$', 'u'),
+    enum: f.enum === null ? null : new Set(f.enum),
+  }));
+  return (values) => {
+    const data = {};
+    const errors = {};
+    for (const c of checks) {
+      const raw = values[c.name];
+      const value = (typeof raw === 'string' ? raw : raw === undefined || raw === null ? '' : JSON.stringify(raw)).trim();
+      if (!value) {
+        if (c.required) errors[c.name] = 'This field is required.';
+        continue;
+      }
+      // lengths in code points, like the other backends
+      const length = [...value].length;
+      if (length > c.maxLength) errors[c.name] = `Use at most ${c.maxLength} characters.`;
+      else if (length < c.minLength) errors[c.name] = `Use at least ${c.minLength} characters.`;
+      else if (c.pattern && !c.pattern.test(value)) errors[c.name] = 'The value has an invalid format.';
+      else if (c.enum && !c.enum.has(value)) errors[c.name] = 'The value is not one of the allowed choices.';
+      else if (c.number) {
+        const n = Number(value);
+        if (!Number.isFinite(n)) errors[c.name] = 'Enter a number.';
+        else if (c.min !== null && n < c.min) errors[c.name] = `Enter a number of at least ${c.min}.`;
+        else if (c.max !== null && n > c.max) errors[c.name] = `Enter a number of at most ${c.max}.`;
+        else data[c.name] = value;
+      } else data[c.name] = value;
+    }
+    return { data, errors };
+  };
+}
+
+// Token bucket per client: `requests` per `perSeconds`, refilled continuously.
+class RateLimiter {
+  constructor(requests, perSeconds) {
+    this.capacity = requests;
+    this.rate = requests / perSeconds;
+    this.buckets = new Map();
+  }
+
+  // Take a token; returns 0, or the seconds until one is available.
+  acquire(client, now) {
+    const bucket = this.buckets.get(client);
+    let tokens = this.capacity;
+    if (bucket) tokens = Math.min(this.capacity, bucket.tokens + (now - bucket.last) * this.rate);
+    if (tokens < 1) {
+      this.buckets.set(client, { tokens, last: now });
+      return (1 - tokens) / this.rate;
+    }
+    this.buckets.set(client, { tokens: tokens - 1, last: now });
+    if (this.buckets.size > MAX_TRACKED_CLIENTS) this.prune(now);
+    return 0;
+  }
+
+  prune(now) {
+    // a bucket that has refilled is the same as no bucket
+    for (const [client, b] of this.buckets) {
+      if (b.tokens + (now - b.last) * this.rate >= this.capacity) this.buckets.delete(client);
+    }
+  }
+}
+
+// Bounded queue of submissions, written in one transaction per batch.
+class SubmissionWriter {
+  constructor(file, queueSize, batchSize) {
+    fs.mkdirSync(path.dirname(file), { recursive: true });
+    this.db = new Database(file, { timeout: 30000 });
+    this.db.pragma('journal_mode = WAL');
+    // in WAL mode NORMAL only syncs at checkpoints: commits are appends to the log
+    this.db.pragma('synchronous = NORMAL');
+    this.db.exec(`CREATE TABLE IF NOT EXISTS submissions (
+      id INTEGER PRIMARY KEY, form TEXT NOT NULL, received REAL NOT NULL, ip TEXT, data TEXT NOT NULL);
+      CREATE INDEX IF NOT EXISTS submissions_form ON submissions (form, received);`);
+    const insert = this.db.prepare('INSERT INTO submissions (form, received, ip, data) VALUES (?, ?, ?, ?)');
+    this.insertBatch = this.db.transaction(rows => {
+      for (const row of rows) insert.run(row);
+    });
+    this.queueSize = queueSize;
+    this.batchSize = batchSize;
+    this.queue = [];
+    this.scheduled = false;
+  }
+
+  // Queue a [form, received, ip, data] row; false when the queue is full.
+  submit(row) {
+    if (this.queue.length >= this.queueSize) return false;
+    this.queue.push(row);
+    if (!this.scheduled) {
+      this.scheduled = true;
+      // everything that arrives in this turn of the event loop shares the commit
+      setImmediate(() => this.flush());
+    }
+    return true;
+  }
+
+  flush() {
+    this.scheduled = false;
+    while (this.queue.length) {
+      const batch = this.queue.slice(0, this.batchSize);
+      try {
+        this.insertBatch(batch);
+      } catch (err) {
+        // another process holds the write lock past the busy timeout: keep the rows
+        console.error(`form writer: ${err.message}; retrying`);
+        if (!this.scheduled) {
+          this.scheduled = true;
+          setTimeout(() => this.flush(), 100);
+        }
+        return;
+      }
+      this.queue.splice(0, batch.length);
+    }
+  }
+}
+
+function sameHost(url, host) {
+  if (!url || !host) return false;
+  try {
+    return new URL(url).host.toLowerCase() === host.toLowerCase();
+  } catch (e) {
+    return false;
+  }
+}
+
+function readBody(req, limit) {
+  return new Promise((resolve, reject) => {
+    const declared = parseInt(req.headers['content-length'] || '0', 10);
+    if (declared > limit) return reject(Object.assign(new Error(`The submission is larger than ${limit} bytes.`), { status: 413 }));
+    const chunks = [];
+    let size = 0;
+    req.on('data', chunk => {
+      size += chunk.length;
+      if (size <= limit) chunks.push(chunk);
+    });
+    req.on('end', () => {
+      if (size > limit) reject(Object.assign(new Error(`The submission is larger than ${limit} bytes.`), { status: 413 }));
+      else resolve(Buffer.concat(chunks).toString('utf8'));
+    });
+    req.on('error', reject);
+  });
+}
+
+async function readValues(req, method, limit) {
+  if (method === 'GET') return Object.fromEntries(new URLSearchParams(req.url.split('?')[1] || ''));
+  const type = (req.headers['content-type'] || '').split(';')[0].trim().toLowerCase();
+  if (type !== 'application/x-www-form-urlencoded' && type !== 'application/json') {
+    throw Object.assign(new Error('Send application/x-www-form-urlencoded or application/json.'), { status: 415 });
+  }
+  const body = await readBody(req, limit);
+  if (type === 'application/json') {
+    let data;
+    try {
+      data = JSON.parse(body || '{}');
+    } catch (e) {
+      throw Object.assign(new Error('The submission could not be decoded.'), { status: 400 });
+    }
+    if (data === null || typeof data !== 'object' || Array.isArray(data)) {
+      throw Object.assign(new Error('Expected a JSON object.'), { status: 400 });
+    }
+    return data;
+  }
+  // first value wins for repeated names, like the other backends
+  const values = {};
+  for (const [k, v] of new URLSearchParams(body)) if (!(k in values)) values[k] = v;
+  return values;
+}
+
+function respond(res, status, payload, wantsJson, headers = {}) {
+  let body;
+  if (wantsJson) {
+    body = JSON.stringify({ ...payload, ok: status < 300 });
+    headers['Content-Type'] = 'application/json; charset=utf-8';
+  } else {
+    const lines = payload.error ? [payload.error] : Object.entries(payload.errors).map(([k, v]) => `${k}: ${v}`);
+    body = lines.join('\n') + '\n';
+    headers['Content-Type'] = 'text/plain; charset=utf-8';
+  }
+  headers['Content-Length'] = Buffer.byteLength(body);
+  res.writeHead(status, headers);
+  res.end(body);
+}
+
+// Express middleware answering the forms' actions; other requests fall through.
+module.exports = function formHandlers(forms = FORMS, settings = SETTINGS, database = DATABASE) {
+  const routes = new Map(forms.map(f => [`${f.method} ${f.action}`, { form: f, validate: compileValidator(f.fields) }]));
+  const limiter = new RateLimiter(settings.rateLimit.requests, settings.rateLimit.perSeconds);
+  const writer = new SubmissionWriter(database, settings.queueSize, settings.batchSize);
+  process.on('exit', () => writer.flush());
+  for (const signal of ['SIGINT', 'SIGTERM']) {
+    process.once(signal, () => {
+      writer.flush();
+      process.exit(0);
+    });
+  }
+
+  const handler = async (req, res, next) => {
+    let pathname;
+    try {
+      pathname = decodeURIComponent(req.path);
+    } catch (e) {
+      return next();
+    }
+    const route = routes.get(`${req.method} ${pathname}`);
+    if (route === undefined) return next();
+    const { form, validate } = route;
+    const wantsJson = (req.headers['accept'] || '').includes('application/json');
+    const host = req.headers['host'];
+
+    // browsers send Origin with every POST; Referer covers older ones and GET forms
+    if (form.csrf && !sameHost(req.headers['origin'] || req.headers['referer'], host)) {
+      return respond(res, 403, { error: 'Cross-site submissions are not accepted.' }, wantsJson);
+    }
+    let ip = req.socket.remoteAddress || '';
+    if (settings.trustProxy && req.headers['x-forwarded-for']) ip = req.headers['x-forwarded-for'].split(',')[0].trim();
+    const wait = limiter.acquire(ip, Date.now() / 1000);
+    if (wait) {
+      return respond(res, 429, { error: 'Too many submissions; try again later.' }, wantsJson,
+        { 'Retry-After': String(Math.ceil(wait)) });
+    }
+    let values;
+    try {
+      values = await readValues(req, form.method, settings.maxBodyBytes);
+    } catch (err) {
+      if (!err.status) return next(err);
+      return respond(res, err.status, { error: err.message }, wantsJson);
+    }
+    const { data, errors } = validate(values);
+    if (Object.keys(errors).length) return respond(res, 422, { errors }, wantsJson);
+    if (!writer.submit([form.id, Date.now() / 1000, ip, JSON.stringify(data)])) {
+      return respond(res, 503, { error: 'Busy; try again shortly.' }, wantsJson, { 'Retry-After': '1' });
+    }
+    if (wantsJson) return respond(res, 202, { ok: true }, true);
+    const referer = req.headers['referer'];
+    res.writeHead(303, { 'Location': sameHost(referer, host) ? referer : '/', 'Content-Length': 0 });
+    res.end();
+  };
+  return handler;
+};
+"""
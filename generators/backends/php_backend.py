@@ -1,49 +1,500 @@
+import mimetypes
 import os
-import shutil
+
+from .assets import FINGERPRINT_RE, IMMUTABLE_CACHE
+from .forms import DATA_DIR, compile_forms, form_settings, pcre_literal
+from .publish import publish_dir, write_file
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
+# precompressed siblings written by the generator, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+VARIANT_EXTS = tuple(ext for _, ext in ENCODINGS)
 
 
 class PhpBackend:
-    """Scaffold a minimal PHP project that serves generated templates.
+    """Scaffold a PHP project that serves the pre-rendered site.
+
+    Output structure:
+      <out>/
+        index.php    front controller: php -S localhost:8000 index.php
+        routes.php   generated route map (URL -> file, type, ETag, ...), cached by opcache
+        form_handlers.php  submission endpoints for the schema's forms (when it has any)
+        public/...   the pre-rendered site
 
-    The PHP backend will copy static templates into a public folder and add a simple index.php
-    that uses PHP's include to render static HTML fragments.
+    Set `generator.options.server.sendfile` to `x-sendfile` (Apache mod_xsendfile,
+    lighttpd) or `x-accel-redirect` (nginx, with an internal location at
+    `sendfilePrefix`, default `/_public/`) to hand file bodies to the web server.
     """
 
-    def generate(self, ast, output_dir):
+    # subdirectory of the project that holds the pre-rendered site
+    PUBLIC = 'public'
+
+    # writes handlers for the schema's forms (see forms.py)
+    FORM_HANDLERS = True
+    # left in place by builds (see publish.publish_dir): the form database lives there
+    KEEP = (DATA_DIR,)
+
+    def generate(self, ast, output_dir, incremental=False, workers=1, atomic=True):
         out = os.path.abspath(output_dir)
-        if os.path.exists(out):
-            shutil.rmtree(out)
-        os.makedirs(out, exist_ok=True)
-
-
-        # Render static HTML into public/ using Jinja2 templates
-        from .common import render_static_site
-        public = os.path.join(out, 'public')
-        render_static_site(ast, TEMPLATE_DIR, public)
-
-        index_php = """
-<?php
-// Minimal router that serves files from public/ and falls back to index.html
-$uri = urldecode(parse_url($_SERVER['REQUEST_URI'], PHP_URL_PATH));
-$path = __DIR__ . '/public' . $uri;
-if ($uri === '/' || $uri === '') {
-    $path = __DIR__ . '/public/index.html';
-} elseif (is_dir($path)) {
-    $path = rtrim($path, '/') . '/index.html';
-}
-if (file_exists($path)) {
-    header('Content-Type: text/html; charset=utf-8');
-    echo file_get_contents($path);
+        # build into a staged copy of the project and swap it in when done
+        with publish_dir(out, atomic, keep=self.KEEP) as stage:
+            # Render static HTML into public/ using Jinja2 templates
+            from .common import render_static_site
+            public = os.path.join(stage, self.PUBLIC)
+            render_static_site(ast, TEMPLATE_DIR, public, incremental=incremental, workers=workers)
+            self.scaffold(ast, stage)
+
+        print('PHP backend: generated project at', out)
+
+    def scaffold(self, ast, out):
+        """Write the server scaffold around an already rendered public/ folder."""
+        server = (ast.get('options') or {}).get('server') or {}
+        sendfile = server.get('sendfile') or ''
+        prefix = server.get('sendfilePrefix', '/_public/')
+        write_file(os.path.join(out, 'routes.php'), route_map_php(os.path.join(out, self.PUBLIC)))
+        forms = compile_forms(ast)
+        handlers_path = os.path.join(out, 'form_handlers.php')
+        if forms:
+            write_file(handlers_path, form_handlers_php(forms, form_settings(ast.get('options'))))
+            actions = ', '.join(f"'{php_string(f['method'] + ' ' + f['action'])}'" for f in forms)
+            forms_hook = FORMS_HOOK.replace('__ACTIONS__', actions)
+        else:
+            forms_hook = ''
+            if os.path.exists(handlers_path):
+                os.remove(handlers_path)
+
+        index_php = """<?php
+// Front controller serving public/ from the route map in routes.php.
+// The map is a plain array, so opcache keeps it in shared memory: a request
+// costs an array lookup, and a conditional request matching the ETag is
+// answered with 304 without touching the disk.
+const SENDFILE = '""" + php_string(sendfile) + """';
+const SENDFILE_PREFIX = '""" + php_string(prefix) + """';
+$routes = require __DIR__ . '/routes.php';
+
+$method = $_SERVER['REQUEST_METHOD'] ?? 'GET';
+$uri = rawurldecode(parse_url($_SERVER['REQUEST_URI'], PHP_URL_PATH) ?? '/');
+__FORMS_HOOK__$route = $routes[$uri] ?? null;
+if ($route === null || ($method !== 'GET' && $method !== 'HEAD')) {
+    http_response_code(404);
+    header('Content-Type: text/plain; charset=utf-8');
+    echo 'Not found';
+    exit;
+}
+// [file, type, etag, mtime, size, cache-control, [coding => [file, etag, size]]]
+[$file, $type, $etag, $mtime, $size, $cache, $variants] = $route;
+
+if ($variants) {
+    header('Vary: Accept-Encoding');
+    $accepted = [];
+    foreach (explode(',', $_SERVER['HTTP_ACCEPT_ENCODING'] ?? '') as $part) {
+        $params = array_map('trim', explode(';', $part));
+        $coding = strtolower(array_shift($params));
+        $accepted[$coding] = true;
+        foreach ($params as $param) {
+            if (strncmp($param, 'q=', 2) === 0 && (float) substr($param, 2) <= 0) {
+                $accepted[$coding] = false;
+            }
+        }
+    }
+    foreach ($variants as $coding => $variant) {
+        // an explicit q=0 for the coding overrides `*`
+        if ($accepted[$coding] ?? $accepted['*'] ?? false) {
+            [$file, $etag, $size] = $variant;
+            header('Content-Encoding: ' . $coding);
+            break;
+        }
+    }
+}
+header('ETag: ' . $etag);
+header('Last-Modified: ' . gmdate('D, d M Y H:i:s', $mtime) . ' GMT');
+header('Cache-Control: ' . $cache);
+
+// If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+if (isset($_SERVER['HTTP_IF_NONE_MATCH'])) {
+    foreach (explode(',', $_SERVER['HTTP_IF_NONE_MATCH']) as $tag) {
+        $tag = trim($tag);
+        if (strncmp($tag, 'W/', 2) === 0) {
+            $tag = substr($tag, 2);
+        }
+        if ($tag === '*' || $tag === $etag) {
+            http_response_code(304);
+            exit;
+        }
+    }
+} elseif (isset($_SERVER['HTTP_IF_MODIFIED_SINCE'])) {
+    $since = strtotime($_SERVER['HTTP_IF_MODIFIED_SINCE']);
+    if ($since !== false && $mtime <= $since) {
+        http_response_code(304);
+        exit;
+    }
+}
+
+header('Content-Type: ' . $type);
+if (SENDFILE === 'x-sendfile') {
+    header('X-Sendfile: ' . __DIR__ . '/public/' . $file);
+    exit;
+}
+if (SENDFILE === 'x-accel-redirect') {
+    header('X-Accel-Redirect: ' . SENDFILE_PREFIX . $file);
+    exit;
+}
+header('Content-Length: ' . $size);
+if ($method === 'HEAD') {
     exit;
 }
-http_response_code(404);
-echo 'Not found';
-?>
+// stream straight to the output without loading the file into a PHP string
+readfile(__DIR__ . '/public/' . $file);
 """
-        with open(os.path.join(out, 'index.php'), 'w', encoding='utf-8') as f:
-            f.write(index_php)
+        write_file(os.path.join(out, 'index.php'), index_php.replace('__FORMS_HOOK__', forms_hook))
 
-        print('PHP backend: generated project at', out)
+
+def php_string(value):
+    """Escape a value for a single-quoted PHP string literal."""
+    return str(value).replace('\\', '\\\\').replace("'", "\\'")
+
+
+def php_value(value):
+    """Return `value` (JSON-like data) as a PHP literal."""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, dict):
+        return '[' + ', '.join(f'{php_value(k)} => {php_value(v)}' for k, v in value.items()) + ']'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(php_value(v) for v in value) + ']'
+    return "'" + php_string(value) + "'"
+
+
+def form_handlers_php(forms, settings):
+    """Return form_handlers.php for the compiled `forms` (see forms.compile_forms)."""
+    lines = ['[']
+    for form in forms:
+        lines.append(f"    {php_value(form['method'] + ' ' + form['action'])} => "
+                     f"[{php_value(form['id'])}, {php_value(form['csrf'])}, [")
+        for f in form['fields']:
+            pattern = pcre_literal(f['pattern']) if f['pattern'] is not None else None
+            allowed = {v: True for v in f['enum']} if f['enum'] is not None else None
+            lines.append('        ' + php_value([f['name'], f['required'], f['minLength'], f['maxLength'], pattern,
+                                                  f['number'], f['min'], f['max'], allowed]) + ',')
+        lines.append('    ]],')
+    lines.append(']')
+    return FORM_HANDLERS_PHP.replace('__FORMS__', '\n'.join(lines)).replace('__SETTINGS__', php_value(settings))
+
+
+def _etag(st, encoding=None):
+    return '"%x-%x%s"' % (st.st_mtime_ns, st.st_size, '-' + encoding if encoding else '')
+
+
+def _content_type(name):
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def route_map_php(public):
+    """Return the PHP source of the route map for the files under `public`."""
+    lines = ['<?php', '// Generated by VirtoWeb: URL -> [file, type, etag, mtime, size, cache-control, variants]', 'return [']
+    for dirpath, dirnames, filenames in os.walk(public):
+        # build manifests and other dotfiles are not part of the site
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        names = set(filenames)
+        for name in sorted(filenames):
+            if name.startswith('.') or (name.endswith(VARIANT_EXTS) and name[:-3] in names):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, public).replace(os.sep, '/')
+            st = os.stat(path)
+            variants = []
+            for coding, ext in ENCODINGS:
+                if name + ext in names:
+                    vst = os.stat(path + ext)
+                    variants.append(f"'{coding}' => ['{php_string(rel + ext)}', '{php_string(_etag(vst, coding))}', {vst.st_size}]")
+            cache = IMMUTABLE_CACHE if FINGERPRINT_RE.search(name) else ('no-cache' if name.endswith('.html') else 'public, max-age=3600')
+            entry = (f"['{php_string(rel)}', '{php_string(_content_type(name))}', '{php_string(_etag(st))}', "
+                     f"{int(st.st_mtime)}, {st.st_size}, '{cache}', [{', '.join(variants)}]]")
+            urls = ['/' + rel]
+            if name == 'index.html':
+                base = '/' + rel[:-len('index.html')]
+                urls.append(base)
+                if base != '/':
+                    urls.append(base.rstrip('/'))
+            for url in urls:
+                lines.append(f"    '{php_string(url)}' => {entry},")
+    lines.append('];')
+    return '\n'.join(lines) + '\n'
+
+
+# included by index.php before the route lookup
+FORMS_HOOK = """// form actions are answered by form_handlers.php
+if (in_array($method . ' ' . $uri, [__ACTIONS__], true)) {
+    require __DIR__ . '/form_handlers.php';
+    exit;
+}
+"""
+
+FORM_HANDLERS_PHP = r'''<?php
+// Form submission handler generated from the project schema's `forms`;
+// index.php includes it for a form's action ($method and $uri are set there).
+//
+// A submission is checked for a same-origin Origin/Referer (when the form has
+// CSRF protection) and against a per-IP limit, then its fields are validated
+// with the patterns compiled into FORMS and it is stored in SQLite.
+//
+// PHP runs every request on its own, so there is no in-process queue to batch
+// commits from: each accepted submission is one short write transaction on a
+// database in WAL mode with synchronous=NORMAL, which appends to the log
+// without an fsync per commit. The rate limit is a fixed window per IP (not
+// the token bucket of the Python and Node handlers), shared by all PHP
+// processes. It is counted in APCu when that is enabled, before the body is
+// read; otherwise in the database, in the same transaction as the
+// submission, so only valid submissions count.
+//
+// Responses: 303 back to the referring page (or 202 with JSON when the request
+// accepts application/json), 422 with the field errors, 403 for cross-site
+// posts, 400, 413, 415, 429 and 503.
+//
+// Rows go to the `submissions` table (form, received, ip, data as JSON) of the
+// database at FORMS_DATABASE (environment) or the schema's
+// generator.options.forms.database, relative to this project's directory. The
+// default, data/forms.sqlite3, is carried over when the project is rebuilt;
+// its directory gets an .htaccess denying access in case the web server's
+// document root is the project.
+
+// 'METHOD /action' => [id, csrf, fields]; a field is
+// [name, required, minLength, maxLength, pattern, number, min, max, allowed values]
+const FORMS = __FORMS__;
+const SETTINGS = __SETTINGS__;
+const SCHEMA_SQL = 'CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY, form TEXT NOT NULL, received REAL NOT NULL, ip TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS submissions_form ON submissions (form, received);
+CREATE TABLE IF NOT EXISTS rate_limits (ip TEXT NOT NULL, slot INTEGER NOT NULL, hits INTEGER NOT NULL,
+    PRIMARY KEY (ip, slot)) WITHOUT ROWID;';
+
+function form_respond(int $status, array $payload, bool $json, array $headers = []): void
+{
+    http_response_code($status);
+    foreach ($headers as $header) {
+        header($header);
+    }
+    if ($json) {
+        $payload['ok'] = $status < 300;
+        header('Content-Type: application/json; charset=utf-8');
+        echo json_encode($payload, JSON_UNESCAPED_UNICODE | JSON_UNESCAPED_SLASHES);
+    } else {
+        header('Content-Type: text/plain; charset=utf-8');
+        if (isset($payload['error'])) {
+            echo $payload['error'], "\n";
+        } else {
+            foreach ($payload['errors'] as $name => $message) {
+                echo $name, ': ', $message, "\n";
+            }
+        }
+    }
+    exit;
+}
+
+function form_same_host(?string $url, string $host): bool
+{
+    if (!$url || $host === '') {
+        return false;
+    }
+    $parts = parse_url($url);
+    if (!$parts || !isset($parts['host'])) {
+        return false;
+    }
+    $netloc = $parts['host'] . (isset($parts['port']) ? ':' . $parts['port'] : '');
+    return strtolower($netloc) === strtolower($host);
+}
+
+// name => value from a query string or urlencoded body; the first value wins
+// and names are kept as sent (PHP's own parsing turns dots into underscores)
+function form_parse_query(string $query): array
+{
+    $values = [];
+    foreach (explode('&', $query) as $pair) {
+        if ($pair === '') {
+            continue;
+        }
+        $parts = explode('=', $pair, 2);
+        $name = urldecode($parts[0]);
+        if (!array_key_exists($name, $values)) {
+            $values[$name] = urldecode($parts[1] ?? '');
+        }
+    }
+    return $values;
+}
+
+function form_validate(array $fields, array $values): array
+{
+    $data = [];
+    $errors = [];
+    foreach ($fields as [$name, $required, $minLength, $maxLength, $pattern, $number, $min, $max, $allowed]) {
+        $value = $values[$name] ?? '';
+        if (!is_string($value)) {
+            $value = $value === null ? '' : json_encode($value);
+        }
+        $value = trim($value);
+        if ($value === '') {
+            if ($required) {
+                $errors[$name] = 'This field is required.';
+            }
+            continue;
+        }
+        // length in code points; false for invalid UTF-8
+        $length = preg_match_all('/./su', $value);
+        if ($length === false) {
+            $errors[$name] = 'The value has an invalid format.';
+        } elseif ($length > $maxLength) {
+            $errors[$name] = "Use at most $maxLength characters.";
+        } elseif ($length < $minLength) {
+            $errors[$name] = "Use at least $minLength characters.";
+        } elseif ($pattern !== null && !preg_match($pattern, $value)) {
+            $errors[$name] = 'The value has an invalid format.';
+        } elseif ($allowed !== null && !isset($allowed[$value])) {
+            $errors[$name] = 'The value is not one of the allowed choices.';
+        } elseif ($number && (!is_numeric($value) || !is_finite((float) $value))) {
+            $errors[$name] = 'Enter a number.';
+        } elseif ($number && $min !== null && (float) $value < $min) {
+            $errors[$name] = "Enter a number of at least $min.";
+        } elseif ($number && $max !== null && (float) $value > $max) {
+            $errors[$name] = "Enter a number of at most $max.";
+        } else {
+            $data[$name] = $value;
+        }
+    }
+    return [$data, $errors];
+}
+
+function form_db(): PDO
+{
+    $path = getenv('FORMS_DATABASE') ?: SETTINGS['database'];
+    if ($path[0] !== '/') {
+        $path = __DIR__ . '/' . $path;
+    }
+    $dir = dirname($path);
+    if (!is_dir($dir) && @mkdir($dir, 0770, true)) {
+        file_put_contents($dir . '/.htaccess', "Require all denied\n");
+    }
+    $db = new PDO('sqlite:' . $path, null, null, [PDO::ATTR_ERRMODE => PDO::ERRMODE_EXCEPTION, PDO::ATTR_TIMEOUT => 30]);
+    $db->exec('PRAGMA journal_mode=WAL');
+    // in WAL mode NORMAL only syncs at checkpoints: commits are appends to the log
+    $db->exec('PRAGMA synchronous=NORMAL');
+    $db->exec(SCHEMA_SQL);
+    return $db;
+}
+
+// [current window, seconds until the next one]
+function form_window(): array
+{
+    $per = max(1, (int) SETTINGS['rateLimit']['perSeconds']);
+    $now = time();
+    return [intdiv($now, $per), $per - $now % $per];
+}
+
+// 0, or the seconds until $ip may submit again (counted in APCu)
+function form_apcu_limit(string $ip): int
+{
+    [$slot, $retry] = form_window();
+    $hits = apcu_inc("virtoweb-forms:$ip:$slot", 1, $success, 2 * max(1, (int) SETTINGS['rateLimit']['perSeconds']));
+    return $hits !== false && $hits > SETTINGS['rateLimit']['requests'] ? $retry : 0;
+}
+
+// Store a submission in one write transaction, counting it against the
+// limit in the database unless APCu did; returns 0, or the seconds until $ip
+// may submit again (nothing is written then).
+function form_store(PDO $db, string $formId, string $ip, array $data, bool $counted): int
+{
+    // IMMEDIATE takes the write lock up front, so the read below can't turn into a busy upgrade
+    $db->exec('BEGIN IMMEDIATE');
+    try {
+        if (!$counted) {
+            [$slot, $retry] = form_window();
+            $select = $db->prepare('SELECT hits FROM rate_limits WHERE ip = ? AND slot = ?');
+            $select->execute([$ip, $slot]);
+            if ((int) $select->fetchColumn() >= SETTINGS['rateLimit']['requests']) {
+                $db->exec('ROLLBACK');
+                return $retry;
+            }
+            $db->prepare('INSERT INTO rate_limits (ip, slot, hits) VALUES (?, ?, 1)
+                ON CONFLICT (ip, slot) DO UPDATE SET hits = hits + 1')->execute([$ip, $slot]);
+            if (mt_rand(1, 100) === 1) {
+                $db->prepare('DELETE FROM rate_limits WHERE slot < ?')->execute([$slot]);
+            }
+        }
+        $db->prepare('INSERT INTO submissions (form, received, ip, data) VALUES (?, ?, ?, ?)')
+            ->execute([$formId, microtime(true), $ip, json_encode($data, JSON_UNESCAPED_UNICODE)]);
+        $db->exec('COMMIT');
+    } catch (PDOException $e) {
+        try {
+            $db->exec('ROLLBACK');
+        } catch (PDOException $ignored) {
+            // no transaction left to roll back
+        }
+        throw $e;
+    }
+    return 0;
+}
+
+$form = FORMS[$method . ' ' . $uri];
+$wantsJson = strpos($_SERVER['HTTP_ACCEPT'] ?? '', 'application/json') !== false;
+$host = $_SERVER['HTTP_HOST'] ?? '';
+
+// browsers send Origin with every POST; Referer covers older ones and GET forms
+if ($form[1] && !form_same_host($_SERVER['HTTP_ORIGIN'] ?? $_SERVER['HTTP_REFERER'] ?? null, $host)) {
+    form_respond(403, ['error' => 'Cross-site submissions are not accepted.'], $wantsJson);
+}
+$ip = $_SERVER['REMOTE_ADDR'] ?? '';
+if (SETTINGS['trustProxy'] && !empty($_SERVER['HTTP_X_FORWARDED_FOR'])) {
+    $ip = trim(explode(',', $_SERVER['HTTP_X_FORWARDED_FOR'])[0]);
+}
+$apcu = function_exists('apcu_enabled') && apcu_enabled();
+if ($apcu && ($retry = form_apcu_limit($ip))) {
+    form_respond(429, ['error' => 'Too many submissions; try again later.'], $wantsJson, ['Retry-After: ' . $retry]);
+}
+
+if ($method === 'GET') {
+    $values = form_parse_query($_SERVER['QUERY_STRING'] ?? '');
+} else {
+    $maxBody = SETTINGS['maxBodyBytes'];
+    if ((int) ($_SERVER['CONTENT_LENGTH'] ?? 0) > $maxBody) {
+        form_respond(413, ['error' => "The submission is larger than $maxBody bytes."], $wantsJson);
+    }
+    $type = strtolower(trim(explode(';', $_SERVER['CONTENT_TYPE'] ?? '')[0]));
+    if ($type === 'application/x-www-form-urlencoded') {
+        $values = form_parse_query((string) file_get_contents('php://input', false, null, 0, $maxBody));
+    } elseif ($type === 'application/json') {
+        $decoded = json_decode((string) file_get_contents('php://input', false, null, 0, $maxBody));
+        if (!($decoded instanceof stdClass)) {
+            form_respond(400, ['error' => 'Expected a JSON object.'], $wantsJson);
+        }
+        $values = (array) $decoded;
+    } else {
+        form_respond(415, ['error' => 'Send application/x-www-form-urlencoded or application/json.'], $wantsJson);
+    }
+}
+
+[$data, $errors] = form_validate($form[2], $values);
+if ($errors) {
+    form_respond(422, ['errors' => $errors], $wantsJson);
+}
+try {
+    $retry = form_store(form_db(), $form[0], $ip, $data, $apcu);
+} catch (PDOException $e) {
+    form_respond(503, ['error' => 'Busy; try again shortly.'], $wantsJson, ['Retry-After: 1']);
+}
+if ($retry) {
+    form_respond(429, ['error' => 'Too many submissions; try again later.'], $wantsJson, ['Retry-After: ' . $retry]);
+}
+if ($wantsJson) {
+    form_respond(202, [], true);
+}
+$referer = $_SERVER['HTTP_REFERER'] ?? '';
+http_response_code(303);
+header('Location: ' . (form_same_host($referer, $host) ? $referer : '/'));
+'''
@@ -0,0 +1,189 @@
+"""Atomic output publishing.
+
+A build never writes into the live output directory. `publish_dir(out)` clones
+the current output into a sibling staging directory using hardlinks, the build
+writes into the clone, and the clone is swapped in with a rename once the build
+succeeds, so a web server pointed at `out` never sees a half-written site.
+
+Files are written with `write_file`, which skips the write when the file already
+holds exactly the same bytes (keeping its mtime, so rsync/CDN syncs only pick up
+real changes) and otherwise writes a temp file and renames it over the target.
+The rename gives the new content a fresh inode, so the live tree sharing the old
+inode through the hardlink clone is never modified.
+
+Directories passed as `keep` (a server project's `data/`, which holds the form
+database) belong to the running site rather than the build: they are not cloned
+but moved into the stage just before the swap, so a database written while the
+build ran loses nothing and its WAL files are never duplicated.
+"""
+import ctypes
+import os
+import shutil
+from contextlib import contextmanager
+
+# renameat2() flag: atomically exchange two paths (Linux >= 3.15)
+_RENAME_EXCHANGE = 2
+_AT_FDCWD = -100
+
+
+def write_file(path, data, force=False):
+    """Write str/bytes `data` to `path` unless it already has that content.
+
+    Returns True if the file was written, False if it was left unchanged. With
+    `force=True` the file is always replaced (by a new inode, like any write).
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    try:
+        if not force and os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def same_content(a, b, block=1 << 16):
+    """True if files `a` and `b` both exist and hold the same bytes (compared block by block)."""
+    # not filecmp: its cache keys on size and mtime, and temp paths are reused within a process
+    try:
+        if os.path.getsize(a) != os.path.getsize(b):
+            return False
+        with open(a, 'rb') as fa, open(b, 'rb') as fb:
+            while True:
+                x = fa.read(block)
+                if x != fb.read(block):
+                    return False
+                if not x:
+                    return True
+    except OSError:
+        return False
+
+
+def copy_file(src, dst):
+    """Copy src to dst unless dst already has the same content; returns True if copied."""
+    if same_content(src, dst):
+        return False
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return True
+
+
+def copy_tree(src, dst):
+    """Copy a directory tree file by file with copy_file; returns (copied, unchanged, rels)."""
+    copied = unchanged = 0
+    rels = set()
+    for dirpath, _, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target, exist_ok=True)
+        for name in filenames:
+            rels.add(os.path.relpath(os.path.join(dirpath, name), src))
+            if copy_file(os.path.join(dirpath, name), os.path.join(target, name)):
+                copied += 1
+            else:
+                unchanged += 1
+    return copied, unchanged, rels
+
+
+def prune_tree(root, keep):
+    """Delete files under root whose relative path is not in `keep`; return the count."""
+    removed = 0
+    for dirpath, _, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.relpath(path, root) not in keep:
+                os.remove(path)
+                removed += 1
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return removed
+
+
+def clone_tree(src, dst, skip=()):
+    """Recreate src at dst with hardlinked files (copies where links aren't possible).
+
+    Top-level entries named in `skip` are left out.
+    """
+    for dirpath, dirnames, filenames in os.walk(src):
+        if dirpath == src:
+            dirnames[:] = [d for d in dirnames if d not in skip]
+            filenames = [f for f in filenames if f not in skip]
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target, exist_ok=True)
+        for name in filenames:
+            s = os.path.join(dirpath, name)
+            d = os.path.join(target, name)
+            if os.path.islink(s):
+                os.symlink(os.readlink(s), d)
+                continue
+            try:
+                os.link(s, d)
+            except OSError:
+                shutil.copy2(s, d)
+
+
+def _exchange(a, b):
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    return renameat2(_AT_FDCWD, os.fsencode(a), _AT_FDCWD, os.fsencode(b), _RENAME_EXCHANGE) == 0
+
+
+def swap_in(stage, out):
+    """Replace `out` with `stage` by renaming; the old tree is removed afterwards."""
+    if not os.path.exists(out):
+        os.rename(stage, out)
+        return
+    if _exchange(stage, out):
+        # stage now holds the previous tree
+        shutil.rmtree(stage)
+        return
+    # no atomic exchange available: two renames leave a window of microseconds
+    old = out + '.virtoweb-old'
+    if os.path.exists(old):
+        shutil.rmtree(old)
+    os.rename(out, old)
+    os.rename(stage, out)
+    shutil.rmtree(old)
+
+
+@contextmanager
+def publish_dir(out, atomic=True, keep=()):
+    """Yield a directory to build into; on success it replaces `out` atomically.
+
+    The subdirectories of `out` named in `keep` are carried over as they are.
+    With `atomic=False` the build writes into `out` directly.
+    """
+    out = os.path.abspath(out)
+    if not atomic:
+        os.makedirs(out, exist_ok=True)
+        yield out
+        return
+    parent, name = os.path.split(out)
+    os.makedirs(parent, exist_ok=True)
+    stage = os.path.join(parent, f'.{name}.virtoweb-stage')
+    if os.path.exists(stage):
+        # left behind by an interrupted build
+        shutil.rmtree(stage)
+    if os.path.isdir(out):
+        clone_tree(out, stage, skip=keep)
+    else:
+        os.makedirs(stage)
+    try:
+        yield stage
+    except BaseException:
+        shutil.rmtree(stage, ignore_errors=True)
+        raise
+    for name in keep:
+        kept = os.path.join(out, name)
+        if os.path.isdir(kept):
+            os.rename(kept, os.path.join(stage, name))
+    swap_in(stage, out)
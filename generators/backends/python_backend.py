@@ -1,5 +1,8 @@
 import os
-import shutil
+import pprint
+
+from .forms import DATA_DIR, compile_forms, form_settings
+from .publish import publish_dir, write_file
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
@@ -10,51 +13,633 @@ class PythonBackend:
 
     Output structure:
       <out>/
-        app.py
+        app.py             Flask app; `application` is the WSGI callable
+        gunicorn.conf.py   production launch: gunicorn -c gunicorn.conf.py app:application
+        form_handlers.py   handlers for the schema's forms (only when it has forms)
         requirements.txt
-        templates/...
-        static/...
+        public/...         the pre-rendered site
 """
 
-    def generate(self, ast, output_dir):
+    # subdirectory of the project that holds the pre-rendered site
+    PUBLIC = 'public'
+
+    # writes handlers for the schema's forms (see forms.py)
+    FORM_HANDLERS = True
+    # left in place by builds (see publish.publish_dir): the form database lives there
+    KEEP = (DATA_DIR,)
+
+    def generate(self, ast, output_dir, incremental=False, workers=1, atomic=True):
         out = os.path.abspath(output_dir)
-        if os.path.exists(out):
-            shutil.rmtree(out)
-        os.makedirs(out, exist_ok=True)
+        # build into a staged copy of the project and swap it in when done
+        with publish_dir(out, atomic, keep=self.KEEP) as stage:
+            # Render a fully static public/ folder (pre-render Jinja templates to HTML)
+            from .common import render_static_site
 
-        # Render a fully static public/ folder (pre-render Jinja templates to HTML)
-        from .common import render_static_site
+            public_dir = os.path.join(stage, self.PUBLIC)
+            render_static_site(ast, TEMPLATE_DIR, public_dir, incremental=incremental, workers=workers)
+            self.scaffold(ast, stage)
 
-        public_dir = os.path.join(out, 'public')
-        render_static_site(ast, TEMPLATE_DIR, public_dir)
+        print('Python (Flask) backend: generated project at', out)
 
+    def scaffold(self, ast, out):
+        """Write the server scaffold around an already rendered public/ folder."""
         # write a minimal Flask app that serves the generated public/ folder
-        app_py = """
-from flask import Flask, send_from_directory
+        app_py = '''
+"""Serve the pre-rendered site in public/.
+
+Every file under public/ is indexed once at startup into an in-memory route
+table (URL -> file, content type, ETag, Last-Modified, precompressed variants and
+cache policy), so a request is a dict lookup: no filesystem probing per request.
+Conditional requests (If-None-Match / If-Modified-Since) are answered with 304,
+and files up to MEMORY_CACHE_MAX_SIZE bytes are served from memory.
+
+The table is rebuilt after a new build is published (checked at most every
+ROUTE_CHECK_INTERVAL seconds).
+
+Static files are answered by a WSGI middleware in front of Flask; anything not
+in public/ falls through to the Flask routes below.
+
+Production:
+    gunicorn -c gunicorn.conf.py app:application
+Development:
+    python app.py
+"""
+import mimetypes
 import os
-app = Flask(__name__, static_folder='public', static_url_path='')
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from flask import Flask
+
+PUBLIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public')
+# files up to this size are kept in memory (0 disables the memory cache)
+MEMORY_CACHE_MAX_SIZE = int(os.environ.get('MEMORY_CACHE_MAX_SIZE', 256 * 1024))
+ROUTE_CHECK_INTERVAL = float(os.environ.get('ROUTE_CHECK_INTERVAL', 2))
+
+# fingerprinted assets (name.<hash>.ext) never change: cache them for a year
+FINGERPRINTED = re.compile(r'\\.[0-9a-f]{10}\\.[A-Za-z0-9]+$')
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+# pages must be revalidated (cheap: a 304 via the ETag) so deploys show up at once
+CACHE_PAGE = 'no-cache'
+CACHE_ASSET = 'public, max-age=3600'
+# precompressed siblings written by the generator, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+CHUNK_SIZE = 64 * 1024
+# rewritten by every build
+MANIFEST = '.virtoweb-manifest.json'
+
+app = Flask(__name__, static_folder=None)
+
+
+class Entry:
+    __slots__ = ('path', 'headers', 'etag', 'mtime', 'body', 'variants')
+
+
+def cache_control(rel):
+    if FINGERPRINTED.search(rel):
+        return CACHE_IMMUTABLE
+    if rel.endswith('.html'):
+        return CACHE_PAGE
+    return CACHE_ASSET
+
+
+def load_entry(path, rel, content_type, encoding=None):
+    st = os.stat(path)
+    entry = Entry()
+    entry.path = path
+    entry.mtime = int(st.st_mtime)
+    entry.etag = '"%x-%x%s"' % (st.st_mtime_ns, st.st_size, '-' + encoding if encoding else '')
+    entry.headers = [
+        ('Content-Type', content_type),
+        ('Content-Length', str(st.st_size)),
+        ('ETag', entry.etag),
+        ('Last-Modified', formatdate(st.st_mtime, usegmt=True)),
+        ('Cache-Control', cache_control(rel)),
+    ]
+    if encoding:
+        entry.headers.append(('Content-Encoding', encoding))
+    entry.body = None
+    if st.st_size <= MEMORY_CACHE_MAX_SIZE:
+        with open(path, 'rb') as f:
+            entry.body = f.read()
+    entry.variants = []
+    return entry
+
+
+def build_routes(root):
+    """Map every URL of the public tree to its Entry."""
+    routes = {}
+    variant_exts = tuple(ext for _, ext in ENCODINGS)
+    for dirpath, dirnames, filenames in os.walk(root):
+        # build manifests and other dotfiles are not part of the site
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.startswith('.') or name.endswith(variant_exts):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+                content_type += '; charset=utf-8'
+            entry = load_entry(path, rel, content_type)
+            for coding, ext in ENCODINGS:
+                if os.path.isfile(path + ext):
+                    entry.variants.append((coding, load_entry(path + ext, rel, content_type, coding)))
+            if entry.variants:
+                entry.headers.append(('Vary', 'Accept-Encoding'))
+                for _, variant in entry.variants:
+                    variant.headers.append(('Vary', 'Accept-Encoding'))
+            routes['/' + rel] = entry
+            if name == 'index.html':
+                base = '/' + rel[:-len('index.html')]
+                routes[base] = entry
+                if base != '/':
+                    routes[base.rstrip('/')] = entry
+    return routes
+
+
+def accepted_encodings(header):
+    """Map each coding named in Accept-Encoding to whether it is acceptable (q > 0)."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        ok = True
+        if q.startswith('q='):
+            try:
+                ok = float(q[2:]) > 0
+            except ValueError:
+                ok = False
+        accepted[coding.strip().lower()] = ok
+    return accepted
 
-@app.route('/')
-def index():
-    return send_from_directory(app.static_folder, 'index.html')
 
-@app.route('/<path:path>')
-def static_proxy(path):
-    # send static files from public/
-    full = os.path.join(app.static_folder, path)
-    if os.path.isdir(full):
-        return send_from_directory(app.static_folder, os.path.join(path, 'index.html'))
-    return send_from_directory(app.static_folder, path)
+def pick_variant(variants, header):
+    """The first of `variants` ((coding, entry) pairs) that Accept-Encoding `header` allows, or None."""
+    accepted = accepted_encodings(header)
+    for coding, variant in variants:
+        # an explicit q=0 for the coding overrides `*`
+        if accepted.get(coding, accepted.get('*', False)):
+            return variant
+    return None
+
+
+def not_modified(environ, entry):
+    match = environ.get('HTTP_IF_NONE_MATCH')
+    if match is not None:
+        # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+        for tag in match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == '*' or tag == entry.etag:
+                return True
+        return False
+    since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if since:
+        try:
+            return entry.mtime <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class StaticSite:
+    """WSGI middleware answering requests for public/ from the route table."""
+
+    def __init__(self, app, root):
+        self.app = app
+        self.root = root
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.stamp = None
+        self.next_check = 0
+        self.refresh()
+
+    def refresh(self):
+        # every build rewrites its manifest, and atomic publishing swaps the directory
+        try:
+            stamp = (os.stat(self.root).st_ino, os.stat(os.path.join(self.root, MANIFEST)).st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self.stamp:
+            self.routes = build_routes(self.root)
+            self.stamp = stamp
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+        now = time.monotonic()
+        if now >= self.next_check:
+            with self.lock:
+                if now >= self.next_check:
+                    self.refresh()
+                    self.next_check = now + ROUTE_CHECK_INTERVAL
+        # PATH_INFO carries the raw UTF-8 bytes decoded as latin-1 (PEP 3333)
+        path = (environ.get('PATH_INFO') or '/').encode('latin-1').decode('utf-8', 'replace')
+        entry = self.routes.get(path)
+        if entry is None:
+            return self.app(environ, start_response)
+
+        if entry.variants:
+            entry = pick_variant(entry.variants, environ.get('HTTP_ACCEPT_ENCODING', '')) or entry
+
+        if not_modified(environ, entry):
+            headers = [h for h in entry.headers if h[0] not in ('Content-Length', 'Content-Type', 'Content-Encoding')]
+            start_response('304 Not Modified', headers)
+            return []
+        start_response('200 OK', list(entry.headers))
+        if method == 'HEAD':
+            return []
+        if entry.body is not None:
+            return [entry.body]
+        f = open(entry.path, 'rb')
+        wrapper = environ.get('wsgi.file_wrapper')
+        if wrapper is not None:
+            return wrapper(f, CHUNK_SIZE)
+        return iter_file(f)
+
+
+def iter_file(f):
+    with f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            yield block
+
+
+@app.errorhandler(404)
+def not_found(e):
+    return 'Not found', 404
+
+
+app.wsgi_app = StaticSite(app.wsgi_app, PUBLIC)
+__FORMS_HOOK__# WSGI entry point for production servers
+application = app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
-"""
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=int(os.environ.get('PORT', 5000)))
+'''
+
+        forms = compile_forms(ast)
+        handlers = os.path.join(out, 'form_handlers.py')
+        if forms:
+            source = FORM_HANDLERS_PY.replace('__FORMS__', pprint.pformat(forms, sort_dicts=False))
+            source = source.replace('__SETTINGS__', pprint.pformat(form_settings(ast.get('options')), sort_dicts=False))
+            write_file(handlers, source)
+            app_py = app_py.replace('__FORMS_HOOK__', FORMS_HOOK)
+        else:
+            app_py = app_py.replace('__FORMS_HOOK__', '')
+            if os.path.exists(handlers):
+                os.remove(handlers)
+        write_file(os.path.join(out, 'app.py'), app_py)
 
-        with open(os.path.join(out, 'app.py'), 'w', encoding='utf-8') as f:
-            f.write(app_py)
+        # production launch: several pre-forked workers sharing the preloaded route table
+        gunicorn_conf = """
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# load app.py (and build the route table) once in the master; workers share it copy-on-write
+preload_app = True
+keepalive = 5
+"""
+        write_file(os.path.join(out, 'gunicorn.conf.py'), gunicorn_conf)
 
         # requirements
-        with open(os.path.join(out, 'requirements.txt'), 'w', encoding='utf-8') as f:
-            f.write('Flask\n')
+        write_file(os.path.join(out, 'requirements.txt'), 'Flask\ngunicorn\n')
 
-        print('Python (Flask) backend: generated project at', out)
+
+# wraps the static site: form actions are answered before anything else
+FORMS_HOOK = """from form_handlers import FormHandler  # noqa: E402
+
+app.wsgi_app = FormHandler(app.wsgi_app)
+"""
+
+FORM_HANDLERS_PY = r'''"""Form submission handlers generated from the project schema's `forms`.
+
+FormHandler is WSGI middleware in front of the app. A request to a form's
+action is checked for a same-origin Origin/Referer (when the form has CSRF
+protection) and against a per-IP token bucket, then its fields are validated and
+the submission is put on a bounded in-memory queue. A writer thread (one per
+process) drains the queue into SQLite in WAL mode, one transaction per batch of
+up to BATCH_SIZE submissions, so submissions that arrive together share a
+commit. When the queue is full the handler answers 503 with Retry-After instead
+of queueing without bound. Queued submissions are written before the process
+exits; a crash loses at most the queue.
+
+Responses: 303 back to the referring page (or 202 with JSON when the request
+accepts application/json), 422 with the field errors, 403 for cross-site posts,
+413, 415, 429 and 503.
+
+Rows go to the `submissions` table (form, received, ip, data as JSON) of the
+database at FORMS_DATABASE (environment) or the schema's
+generator.options.forms.database, relative to this project's directory. The
+default, data/forms.sqlite3, is carried over when the project is rebuilt.
+"""
+import atexit
+import json
+import math
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+FORMS = __FORMS__
+SETTINGS = __SETTINGS__
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATABASE = os.path.join(HERE, os.environ.get('FORMS_DATABASE') or SETTINGS['database'])
+QUEUE_SIZE = SETTINGS['queueSize']
+BATCH_SIZE = SETTINGS['batchSize']
+MAX_BODY = SETTINGS['maxBodyBytes']
+# rate limiter entries kept before refilled buckets are dropped
+MAX_TRACKED_CLIENTS = 100000
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    form TEXT NOT NULL,
+    received REAL NOT NULL,
+    ip TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_form ON submissions (form, received);
+"""
+INSERT_SQL = 'INSERT INTO submissions (form, received, ip, data) VALUES (?, ?, ?, ?)'
+
+
+def compile_validator(fields):
+    """Turn a form's field specs into a function: values -> (data, errors)."""
+    checks = []
+    for f in fields:
+        pattern = re.compile(f['pattern']) if f['pattern'] is not None else None
+        enum = frozenset(f['enum']) if f['enum'] is not None else None
+        checks.append((f['name'], f['required'], f['minLength'], f['maxLength'], pattern,
+                       f['number'], f['min'], f['max'], enum))
+
+    def validate(values):
+        data = {}
+        errors = {}
+        for name, required, min_length, max_length, pattern, number, low, high, enum in checks:
+            value = values.get(name, '').strip()
+            if not value:
+                if required:
+                    errors[name] = 'This field is required.'
+                continue
+            if len(value) > max_length:
+                errors[name] = f'Use at most {max_length} characters.'
+            elif len(value) < min_length:
+                errors[name] = f'Use at least {min_length} characters.'
+            elif pattern is not None and pattern.fullmatch(value) is None:
+                errors[name] = 'The value has an invalid format.'
+            elif enum is not None and value not in enum:
+                errors[name] = 'The value is not one of the allowed choices.'
+            elif number:
+                try:
+                    n = float(value)
+                except ValueError:
+                    errors[name] = 'Enter a number.'
+                    continue
+                if not math.isfinite(n):
+                    errors[name] = 'Enter a number.'
+                elif low is not None and n < low:
+                    errors[name] = f'Enter a number of at least {low}.'
+                elif high is not None and n > high:
+                    errors[name] = f'Enter a number of at most {high}.'
+                else:
+                    data[name] = value
+            else:
+                data[name] = value
+        return data, errors
+
+    return validate
+
+
+class RateLimiter:
+    """Token bucket per client: `requests` per `per_seconds`, refilled continuously."""
+
+    def __init__(self, requests, per_seconds):
+        self.capacity = float(requests)
+        self.rate = requests / float(per_seconds)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, client, now):
+        """Take a token; returns 0, or the seconds until one is available."""
+        with self.lock:
+            tokens, last = self.buckets.get(client, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[client] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self.buckets[client] = (tokens - 1, now)
+            if len(self.buckets) > MAX_TRACKED_CLIENTS:
+                self.prune(now)
+            return 0
+
+    def prune(self, now):
+        # a bucket that has refilled is the same as no bucket
+        full = [c for c, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * self.rate >= self.capacity]
+        for client in full:
+            del self.buckets[client]
+
+
+def connect(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    # in WAL mode NORMAL only syncs at checkpoints: commits are appends to the log
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(SCHEMA_SQL)
+    return db
+
+
+class SubmissionWriter:
+    """Bounded queue of submissions, written by one thread in batched transactions."""
+
+    def __init__(self, path, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.written = 0
+        self.batches = 0
+
+    def start(self):
+        # started lazily: gunicorn imports the app in the master and forks the workers
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue(self.queue.maxsize)
+                self.thread = threading.Thread(target=self.run, name='form-writer', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+                atexit.register(self.close)
+
+    def submit(self, row):
+        """Queue a (form, received, ip, data) row; False when the queue is full."""
+        self.start()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            return False
+        return True
+
+    def run(self):
+        db = connect(self.path)
+        stop = False
+        while not stop:
+            row = self.queue.get()
+            if row is None:
+                break
+            # everything that arrived while the last batch was committing shares this commit
+            batch = [row]
+            while len(batch) < self.batch_size:
+                try:
+                    row = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            self.write(db, batch)
+        db.close()
+
+    def write(self, db, batch):
+        delay = 0.05
+        while True:
+            try:
+                with db:
+                    db.executemany(INSERT_SQL, batch)
+            except sqlite3.OperationalError as e:
+                # another process holds the write lock past the busy timeout: keep the batch
+                print(f'form writer: {e}; retrying in {delay:.2f}s', file=sys.stderr)
+                time.sleep(delay)
+                delay = min(delay * 2, 2)
+                continue
+            self.written += len(batch)
+            self.batches += 1
+            return
+
+    def close(self, timeout=30):
+        """Write what is queued and stop the writer thread."""
+        if self.pid != os.getpid() or not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+
+def same_host(url, host):
+    return bool(url and host) and urlsplit(url).netloc.lower() == host.lower()
+
+
+def same_origin(environ):
+    # browsers send Origin with every POST; Referer covers older ones and GET forms
+    return same_host(environ.get('HTTP_ORIGIN') or environ.get('HTTP_REFERER'), environ.get('HTTP_HOST', ''))
+
+
+def client_ip(environ, trust_proxy):
+    if trust_proxy:
+        forwarded = environ.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return environ.get('REMOTE_ADDR', '')
+
+
+def read_values(environ, method):
+    """Return (values, None) or (None, (status, message))."""
+    if method == 'GET':
+        return dict(parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True)), None
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = -1
+    if length < 0 or length > MAX_BODY:
+        return None, ('413 Content Too Large', f'The submission is larger than {MAX_BODY} bytes.')
+    body = environ['wsgi.input'].read(length) if length else b''
+    content_type = environ.get('CONTENT_TYPE', '').split(';')[0].strip().lower()
+    try:
+        if content_type == 'application/x-www-form-urlencoded':
+            return dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True)), None
+        if content_type == 'application/json':
+            data = json.loads(body or b'{}')
+            if isinstance(data, dict):
+                return {k: v if isinstance(v, str) else '' if v is None else json.dumps(v) for k, v in data.items()}, None
+            return None, ('400 Bad Request', 'Expected a JSON object.')
+    except (UnicodeDecodeError, ValueError):
+        return None, ('400 Bad Request', 'The submission could not be decoded.')
+    return None, ('415 Unsupported Media Type', 'Send application/x-www-form-urlencoded or application/json.')
+
+
+class FormHandler:
+    """WSGI middleware answering the forms' actions; other requests go to `app`."""
+
+    def __init__(self, app, forms=FORMS, settings=SETTINGS, database=DATABASE):
+        self.app = app
+        self.routes = {(f['method'], f['action']): (f, compile_validator(f['fields'])) for f in forms}
+        limit = settings['rateLimit']
+        self.limiter = RateLimiter(limit['requests'], limit['perSeconds'])
+        self.writer = SubmissionWriter(database, settings['queueSize'], settings['batchSize'])
+        self.trust_proxy = settings['trustProxy']
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        # PATH_INFO carries the raw UTF-8 bytes decoded as latin-1 (PEP 3333)
+        path = (environ.get('PATH_INFO') or '/').encode('latin-1').decode('utf-8', 'replace')
+        route = self.routes.get((method, path))
+        if route is None:
+            return self.app(environ, start_response)
+        form, validate = route
+        wants_json = 'application/json' in environ.get('HTTP_ACCEPT', '')
+
+        if form['csrf'] and not same_origin(environ):
+            return respond(start_response, '403 Forbidden', {'error': 'Cross-site submissions are not accepted.'},
+                           wants_json)
+        ip = client_ip(environ, self.trust_proxy)
+        wait = self.limiter.acquire(ip, time.monotonic())
+        if wait:
+            return respond(start_response, '429 Too Many Requests', {'error': 'Too many submissions; try again later.'},
+                           wants_json, [('Retry-After', str(math.ceil(wait)))])
+        values, failure = read_values(environ, method)
+        if failure is not None:
+            return respond(start_response, failure[0], {'error': failure[1]}, wants_json)
+        data, errors = validate(values)
+        if errors:
+            return respond(start_response, '422 Unprocessable Content', {'errors': errors}, wants_json)
+        if not self.writer.submit((form['id'], time.time(), ip, json.dumps(data, ensure_ascii=False))):
+            return respond(start_response, '503 Service Unavailable', {'error': 'Busy; try again shortly.'},
+                           wants_json, [('Retry-After', '1')])
+        if wants_json:
+            return respond(start_response, '202 Accepted', {'ok': True}, True)
+        referer = environ.get('HTTP_REFERER', '')
+        location = referer if same_host(referer, environ.get('HTTP_HOST', '')) else '/'
+        start_response('303 See Other', [('Location', location), ('Content-Length', '0')])
+        return []
+
+
+def respond(start_response, status, payload, wants_json, headers=()):
+    if wants_json:
+        body = json.dumps(dict(payload, ok=status.startswith('2')), ensure_ascii=False).encode('utf-8')
+        content_type = 'application/json; charset=utf-8'
+    else:
+        if 'error' in payload:
+            lines = [payload['error']]
+        else:
+            lines = [f'{name}: {message}' for name, message in payload['errors'].items()]
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        content_type = 'text/plain; charset=utf-8'
+    start_response(status, [('Content-Type', content_type), ('Content-Length', str(len(body))), *headers])
+    return [body]
+'''
@@ -0,0 +1,122 @@
+"""Parameterized route expansion.
+
+A page whose route contains placeholders (e.g. `/products/{slug}`) is expanded
+into one concrete page per data record. Records come from the page's `data`:
+
+- an inline array of objects: `"data": [{"slug": "a"}, {"slug": "b"}]`
+- an inline object with `items`: `"data": {"items": [...]}`
+- an external file: `"data": {"source": "data/products.jsonl"}` (JSONL or CSV,
+  resolved relative to the schema file unless absolute; `format` overrides the
+  file extension)
+
+Everything here is a generator: records are read lazily and pages are yielded one
+at a time, so a single page definition can fan out to millions of pages without
+holding the dataset in memory.
+"""
+import csv
+import json
+import os
+import re
+from urllib.parse import quote
+
+PARAM_RE = re.compile(r'\{([^{}]+)\}')
+
+
+class _Fields(dict):
+    # leave unknown placeholders untouched when formatting titles
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def _format_fields(text, record):
+    try:
+        return text.format_map(_Fields(record))
+    except (ValueError, IndexError, AttributeError, KeyError, TypeError):
+        return text
+
+
+def is_parameterized(route):
+    return bool(PARAM_RE.search(route or ''))
+
+
+def route_params(route):
+    return PARAM_RE.findall(route or '')
+
+
+def _iter_file(path, fmt):
+    if fmt == 'jsonl':
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    elif fmt == 'csv':
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    else:
+        raise ValueError(f'Unsupported data source format: {fmt}')
+
+
+def iter_records(data, base_dir=None):
+    """Yield the data records backing a parameterized page."""
+    if isinstance(data, list):
+        yield from data
+        return
+    if not isinstance(data, dict):
+        return
+    if 'items' in data:
+        yield from data.get('items') or []
+        return
+    src = data.get('source')
+    if not src:
+        return
+    path = src if os.path.isabs(src) or not base_dir else os.path.join(base_dir, src)
+    fmt = (data.get('format') or os.path.splitext(path)[1].lstrip('.')).lower()
+    if fmt == 'ndjson':
+        fmt = 'jsonl'
+    yield from _iter_file(path, fmt)
+
+
+def expand_page(page, base_dir=None):
+    """Yield one concrete page per data record of a parameterized page."""
+    route = page.get('route', '/')
+    params = route_params(route)
+    try:
+        records = iter_records(page.get('data'), base_dir)
+        for n, record in enumerate(records):
+            if not isinstance(record, dict):
+                print(f"Skipping record {n} of page {page.get('id')}: not an object")
+                continue
+            values = {}
+            for name in params:
+                value = record.get(name)
+                value = '' if value is None else str(value)
+                # each value must map to exactly one output directory
+                if value in ('', '.', '..') or '/' in value or '\\' in value:
+                    break
+                values[name] = value
+            else:
+                segments = {name: quote(value, safe='') for name, value in values.items()}
+                concrete = PARAM_RE.sub(lambda m: segments[m.group(1)], route)
+                expanded = dict(page)
+                expanded['id'] = f"{page.get('id')}:{'/'.join(segments[p] for p in params)}"
+                expanded['route'] = concrete
+                expanded['data'] = record
+                expanded['params'] = values
+                for key in ('title', 'description'):
+                    if isinstance(page.get(key), str):
+                        expanded[key] = _format_fields(page[key], record)
+                yield expanded
+                continue
+            print(f"Skipping record {n} of page {page.get('id')}: missing or invalid value for a route parameter")
+    except (OSError, ValueError) as e:
+        print(f"Skipping parameterized route {route} of page {page.get('id')}: {e}")
+
+
+def iter_pages(pages, base_dir=None):
+    """Yield concrete pages, expanding parameterized routes lazily."""
+    for page in pages:
+        if is_parameterized(page.get('route', '/')):
+            yield from expand_page(page, base_dir)
+        else:
+            yield page
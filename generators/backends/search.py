@@ -0,0 +1,376 @@
+"""Client-side search index.
+
+Enabled with `generator.options.search` (`true`, or `{"prefixLength": n}`).
+While a page is rendered its text is collected: the title, description and
+meta values from the schema and the text of every rendered component fragment
+(tags, scripts and styles stripped). After the render the index is written
+under `assets/search/`:
+
+  index.json             bootstrap: shard file names, document count, settings
+  terms-<prefix>.<h>.json  postings of every term starting with <prefix>
+  docs-<n>.<h>.json      url, title and description of DOCS_PER_SHARD pages
+  search.js              the loader (`VirtoSearch.search(query)`)
+
+A query only fetches index.json, the term shards of its words and the document
+shards of its top hits. Terms are sharded by their first `prefixLength`
+characters, so a partial last word shorter than that fetches every shard whose
+prefix starts with it. Shards are content-hashed, so they can be cached forever
+and an unchanged shard keeps its name (and file) between builds; index.json is
+fetched with `no-cache`.
+
+Postings are flat `[doc delta, weight, doc delta, weight, ...]` lists sorted by
+document id. Weights count title words 5x, description and meta words 2x and
+content words once, capped at MAX_WEIGHT.
+
+The per-page terms are kept in `.virtoweb-search.json` next to the build
+manifest, so an incremental build only re-extracts the pages it re-renders and
+rebuilds the shards from the stored terms in one pass over the pages.
+"""
+import hashlib
+import html
+import json
+import os
+import re
+
+from .publish import write_file
+
+SEARCH_DIR = 'assets/search'
+SEARCH_STATE = '.virtoweb-search.json'
+SEARCH_STATE_VERSION = 1
+DEFAULT_PREFIX = 2
+DOCS_PER_SHARD = 1000
+MAX_WEIGHT = 255
+TITLE_WEIGHT = 5
+SUMMARY_WEIGHT = 2
+
+_SKIP = re.compile(r'<(script|style|template)\b.*?</\1\s*>|<!--.*?-->', re.S | re.I)
+_TAG = re.compile(r'<[^>]*>')
+_WORD = re.compile(r'\w+')
+_PLAIN_KEY = re.compile(r'[a-z0-9_]+')
+
+
+def search_settings(options):
+    """Return the index settings from `generator.options`, or None when search is off."""
+    value = (options or {}).get('search', False)
+    if value is True:
+        return {'prefixLength': DEFAULT_PREFIX}
+    if isinstance(value, dict):
+        return {'prefixLength': max(1, int(value.get('prefixLength', DEFAULT_PREFIX)))}
+    return None
+
+
+def tokenize(text):
+    """Lowercased words of `text`; one-character words aren't indexed."""
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 1]
+
+
+def html_text(fragment):
+    return html.unescape(_TAG.sub(' ', _SKIP.sub(' ', fragment)))
+
+
+def shard_key(term, prefix_length):
+    """File-name-safe shard key of `term` (search.js computes the same)."""
+    prefix = term[:prefix_length]
+    if _PLAIN_KEY.fullmatch(prefix):
+        return prefix
+    return 'x' + prefix.encode('utf-8').hex()
+
+
+class PageTerms:
+    """Term weights of one page, fed with its rendered fragments."""
+
+    def __init__(self, page):
+        self.route = page.get('route', '/')
+        self.title = page.get('title') or ''
+        self.description = page.get('description') or ''
+        self.weights = {}
+        self.add(self.title, TITLE_WEIGHT)
+        self.add(self.description, SUMMARY_WEIGHT)
+        for value in (page.get('meta') or {}).values():
+            if isinstance(value, str):
+                self.add(value, SUMMARY_WEIGHT)
+
+    def add(self, text, weight=1):
+        weights = self.weights
+        for word in tokenize(text):
+            weights[word] = weights.get(word, 0) + weight
+
+    def feed(self, fragment):
+        self.add(html_text(fragment))
+
+    def entry(self):
+        return [self.route, self.title, self.description,
+                {t: min(w, MAX_WEIGHT) for t, w in self.weights.items()}]
+
+
+class SearchCollector:
+    """Page entries extracted during a render, keyed by output path."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def add(self, rel, terms):
+        self.docs[rel] = terms.entry()
+
+    def drain(self):
+        docs, self.docs = self.docs, {}
+        return docs
+
+    def merge(self, docs):
+        self.docs.update(docs)
+
+
+def load_search_state(out):
+    try:
+        with open(os.path.join(out, SEARCH_STATE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != SEARCH_STATE_VERSION:
+        return None
+    return state
+
+
+def previous_search_files(out):
+    """Files of the index a previous build wrote (all stale once search is turned off)."""
+    state = load_search_state(out)
+    return set(state['files']) | {SEARCH_STATE} if state else set()
+
+
+def _write_shard(out, name, data):
+    body = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    rel = f'{SEARCH_DIR}/{name}.{hashlib.sha256(body.encode("utf-8")).hexdigest()[:10]}.json'
+    return os.path.normpath(rel), write_file(os.path.join(out, rel), body)
+
+
+def build_search_index(out, docs, pages, settings, incremental=False, index=True):
+    """Write the index for the pages in `pages` (output paths) into `out`.
+
+    `docs` holds the entries extracted by this build; on an incremental build the
+    pages that weren't re-rendered keep the entries stored by the previous one.
+    With `index=False` only the entries are stored (shard builds leave the index
+    to the merge step).
+    Returns stats like build_assets: `written`/`unchanged` counts, `files` (paths
+    relative to out) and `stale` (shards of the previous build no longer produced).
+    """
+    previous = load_search_state(out) or {}
+    stored = previous.get('docs', {}) if incremental and previous.get('settings') == settings else {}
+    entries = {}
+    for rel in pages:
+        entry = docs.get(rel) or stored.get(rel)
+        if entry is not None:
+            entries[rel] = entry
+    missing = len(pages) - len(entries)
+    if missing:
+        print(f'Warning: search index is missing {missing} unchanged pages; run a full build to add them')
+
+    stats = write_search_index(out, entries, settings) if index else {'written': 0, 'unchanged': 0, 'files': set()}
+    files = stats['files']
+    state_path = os.path.join(out, SEARCH_STATE)
+    tmp = state_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': SEARCH_STATE_VERSION, 'settings': settings, 'docs': entries,
+                   'files': sorted(files)}, f, separators=(',', ':'), ensure_ascii=False, sort_keys=True)
+    os.replace(tmp, state_path)
+    files.add(SEARCH_STATE)
+    stats['stale'] = set(previous.get('files', [])) - files
+    return stats
+
+
+def write_search_index(out, entries, settings):
+    """Write the shards, bootstrap and loader for `entries` ({output path: entry})."""
+    # document ids follow output paths, so an unchanged site gives unchanged shards
+    prefix_length = settings['prefixLength']
+    postings = {}
+    doc_list = []
+    for doc_id, rel in enumerate(sorted(entries)):
+        route, title, description, weights = entries[rel]
+        doc_list.append([route, title, description])
+        for term, weight in weights.items():
+            postings.setdefault(term, []).append((doc_id, weight))
+
+    shards = {}
+    for term, plist in postings.items():
+        flat = []
+        last = 0
+        for doc_id, weight in plist:
+            flat += (doc_id - last, weight)
+            last = doc_id
+        shards.setdefault(shard_key(term, prefix_length), {})[term] = flat
+
+    os.makedirs(os.path.join(out, SEARCH_DIR), exist_ok=True)
+    files = set()
+    written = unchanged = 0
+    term_files = {}
+    for key in sorted(shards):
+        rel, was_written = _write_shard(out, f'terms-{key}', dict(sorted(shards[key].items())))
+        term_files[key] = os.path.basename(rel)
+        files.add(rel)
+        written += was_written
+        unchanged += not was_written
+    doc_files = []
+    for n in range(0, len(doc_list), DOCS_PER_SHARD):
+        rel, was_written = _write_shard(out, f'docs-{n // DOCS_PER_SHARD}', doc_list[n:n + DOCS_PER_SHARD])
+        doc_files.append(os.path.basename(rel))
+        files.add(rel)
+        written += was_written
+        unchanged += not was_written
+
+    bootstrap = {
+        'version': SEARCH_STATE_VERSION, 'prefixLength': prefix_length, 'docCount': len(doc_list),
+        'docsPerShard': DOCS_PER_SHARD, 'terms': term_files, 'docs': doc_files,
+    }
+    for name, data in (('index.json', json.dumps(bootstrap, separators=(',', ':'))), ('search.js', LOADER_JS)):
+        rel = os.path.normpath(f'{SEARCH_DIR}/{name}')
+        files.add(rel)
+        if write_file(os.path.join(out, rel), data):
+            written += 1
+        else:
+            unchanged += 1
+    print(f'Search index: {len(doc_list)} pages, {len(postings)} terms in {len(term_files)} shards')
+    return {'written': written, 'unchanged': unchanged, 'files': files}
+
+
+LOADER_JS = r"""/* VirtoWeb search loader: fetches only the index shards a query needs.
+ *   VirtoSearch.search('query', 10).then(function (hits) { ... })
+ * resolves to [{url, title, description, score}]. The last word of the query
+ * matches as a prefix. An <input data-virtoweb-search> gets live results in the
+ * element its attribute names (a selector), or in a list inserted after it.
+ */
+(function () {
+  'use strict';
+  var script = document.currentScript;
+  var base = script ? script.src.replace(/[^\/]*$/, '') : '/assets/search/';
+  var index = null;
+  var files = {};
+
+  function load(name, fresh) {
+    if (!files[name]) {
+      files[name] = fetch(base + name, fresh ? {cache: 'no-cache'} : {}).then(function (r) {
+        if (!r.ok) throw new Error('search: ' + name + ' ' + r.status);
+        return r.json();
+      });
+      files[name].catch(function () { delete files[name]; });
+    }
+    return files[name];
+  }
+
+  function bootstrap() {
+    if (!index) {
+      index = load('index.json', true);
+      index.catch(function () { index = null; });
+    }
+    return index;
+  }
+
+  function tokenize(text) {
+    return (text.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || []).filter(function (w) { return w.length > 1; });
+  }
+
+  function hexKey(text) {
+    return 'x' + Array.from(new TextEncoder().encode(text), function (b) {
+      return (b < 16 ? '0' : '') + b.toString(16);
+    }).join('');
+  }
+
+  function shardKey(term, n) {
+    var prefix = Array.from(term).slice(0, n).join('');
+    return /^[a-z0-9_]+$/.test(prefix) ? prefix : hexKey(prefix);
+  }
+
+  // term shard files that can hold `word` (or, with `prefix`, the terms starting with it)
+  function shardFiles(idx, word, prefix) {
+    var key = shardKey(word, idx.prefixLength);
+    if (!prefix || Array.from(word).length >= idx.prefixLength) return idx.terms[key] ? [idx.terms[key]] : [];
+    // a partial word shorter than the shard prefix: every shard whose prefix starts with it
+    var starts = [key, hexKey(word)];
+    return Object.keys(idx.terms).filter(function (k) {
+      return starts.some(function (start) { return k.lastIndexOf(start, 0) === 0; });
+    }).map(function (k) { return idx.terms[k]; });
+  }
+
+  function decode(flat, into) {
+    for (var i = 0, doc = 0; i < flat.length; i += 2) {
+      doc += flat[i];
+      into.set(doc, Math.max(into.get(doc) || 0, flat[i + 1]));
+    }
+    return into;
+  }
+
+  function matches(idx, word, prefix) {
+    return Promise.all(shardFiles(idx, word, prefix).map(function (file) { return load(file); })).then(function (shards) {
+      var found = new Map();
+      shards.forEach(function (shard) {
+        if (!prefix) {
+          if (shard[word]) decode(shard[word], found);
+          return;
+        }
+        Object.keys(shard).forEach(function (term) {
+          if (term.lastIndexOf(word, 0) === 0) decode(shard[term], found);
+        });
+      });
+      return found;
+    });
+  }
+
+  function search(query, limit) {
+    limit = limit || 10;
+    var words = tokenize(query);
+    if (!words.length) return Promise.resolve([]);
+    return bootstrap().then(function (idx) {
+      return Promise.all(words.map(function (w, i) {
+        return matches(idx, w, i === words.length - 1);
+      })).then(function (lists) {
+        // every word must match; rarer words weigh more
+        var scores = null;
+        lists.forEach(function (docs) {
+          var idf = Math.log(1 + idx.docCount / Math.max(docs.size, 1));
+          var next = new Map();
+          docs.forEach(function (weight, doc) {
+            if (scores === null || scores.has(doc)) next.set(doc, (scores ? scores.get(doc) : 0) + weight * idf);
+          });
+          scores = next;
+        });
+        var top = Array.from(scores).sort(function (a, b) { return b[1] - a[1] || a[0] - b[0]; }).slice(0, limit);
+        return Promise.all(top.map(function (hit) {
+          return load(idx.docs[Math.floor(hit[0] / idx.docsPerShard)]).then(function (docs) {
+            var d = docs[hit[0] % idx.docsPerShard];
+            return {url: d[0], title: d[1], description: d[2], score: hit[1]};
+          });
+        }));
+      });
+    });
+  }
+
+  function attach(input) {
+    var target = input.getAttribute('data-virtoweb-search');
+    var list = target ? document.querySelector(target) : null;
+    if (!list) {
+      list = document.createElement('ol');
+      list.className = 'virtoweb-search-results';
+      input.parentNode.insertBefore(list, input.nextSibling);
+    }
+    var latest = 0;
+    input.addEventListener('input', function () {
+      var ticket = ++latest;
+      search(input.value).then(function (hits) {
+        if (ticket !== latest) return;
+        list.textContent = '';
+        hits.forEach(function (hit) {
+          var item = document.createElement('li');
+          var link = document.createElement('a');
+          link.href = hit.url;
+          link.textContent = hit.title || hit.url;
+          item.appendChild(link);
+          list.appendChild(item);
+        });
+      });
+    });
+  }
+
+  window.VirtoSearch = {search: search};
+  function init() { document.querySelectorAll('input[data-virtoweb-search]').forEach(attach); }
+  if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', init);
+  else init();
+})();
+"""
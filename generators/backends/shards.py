@@ -0,0 +1,180 @@
+"""Sharded builds.
+
+A site can be split across machines: each one builds the same project file with
+`shard=(i, n)` and renders only the pages whose output path hashes to shard `i`
+of `n` (shards are numbered from 1). The hash is a SHA-256 of the output path,
+so every machine makes the same split, and routes that map to the same file
+always land in the same shard.
+
+A shard's output is a regular build directory: assets, the shard's pages with
+their precompressed variants and a build manifest that records the shard
+number, the shard count, a hash of the site-wide inputs (project, layouts,
+components, options, templates and the fingerprinted asset URLs) and the route
+of every page. Search entries are stored, but the index is left to the merge.
+
+`merge_shards` checks that the shards belong together (the same count, every
+number once, the same site-wide inputs) and that no output path was written by
+two routes, then links the shard trees into one output directory, writes the
+combined manifest and search index and the backend's scaffold. A shard
+directory can be rebuilt incrementally like any build; the merged output can be
+used for incremental single-machine builds.
+"""
+import hashlib
+import os
+
+from .assets import ASSET_STATE
+from .compress import compress_outputs
+from .manifest import MANIFEST_NAME, hash_obj, load_manifest, save_manifest
+from .publish import prune_tree, publish_dir, same_content
+from .search import SEARCH_STATE, build_search_index, load_search_state
+from .staging import link_or_copy
+
+SITE_KEYS = ('project', 'layouts', 'components', 'forms', 'options')
+
+
+def parse_shard(value):
+    """Return `(number, count)` from `"i/n"` or a pair; raises ValueError."""
+    if isinstance(value, str):
+        number, sep, count = value.partition('/')
+        if not sep:
+            raise ValueError(f'Invalid shard {value!r}: expected i/n, e.g. 1/4')
+        value = (number, count)
+    try:
+        number, count = (int(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid shard {value!r}: expected i/n, e.g. 1/4') from None
+    if not 1 <= number <= count:
+        raise ValueError(f'Invalid shard {number}/{count}: the number must be between 1 and {count}')
+    return number, count
+
+
+def page_shard(rel, count):
+    """Shard number (1..count) of the page written to output path `rel`."""
+    digest = hashlib.sha256(rel.replace(os.sep, '/').encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def site_hash(ast, asset_urls, hasher):
+    """Hash of the inputs every shard of one build must share (`hasher`: a TemplateHasher)."""
+    names = hasher.env.list_templates(filter_func=lambda name: name.endswith('.j2'))
+    return hash_obj({'site': {k: ast.get(k) for k in SITE_KEYS}, 'assets': asset_urls,
+                     'templates': {name: hasher.hash(name) for name in names}})
+
+
+def check_shards(manifests):
+    """Raise RuntimeError unless `manifests` ({dir: manifest}) are all shards of one build."""
+    problems = []
+    numbers = {}
+    for path, manifest in manifests.items():
+        shard = (manifest or {}).get('shard')
+        if shard is None:
+            problems.append(f'{path}: not a shard build (no shard manifest)')
+            continue
+        numbers.setdefault(shard['number'], []).append(path)
+    if problems:
+        raise RuntimeError('Cannot merge shards:\n' + '\n'.join(problems))
+
+    shards = {path: m['shard'] for path, m in manifests.items()}
+    counts = {s['count'] for s in shards.values()}
+    if len(counts) > 1:
+        problems.append(f'shard counts differ: {sorted(counts)}')
+    count = max(counts)
+    for number in range(1, count + 1):
+        if number not in numbers:
+            problems.append(f'shard {number}/{count} is missing')
+        elif len(numbers[number]) > 1:
+            problems.append(f'shard {number}/{count} was given more than once: {", ".join(numbers[number])}')
+    if len({s['site'] for s in shards.values()}) > 1:
+        problems.append('shards were built from different project files or templates '
+                        '(site-wide inputs differ); rebuild them from the same revision')
+
+    # a route collision inside one shard was recorded there; across shards it shows as a path in two shards
+    owners = {}
+    for path, shard in shards.items():
+        for rel, first, other in shard.get('collisions', []):
+            problems.append(f'routes {first!r} and {other!r} both write {rel} (shard {shard["number"]})')
+        for rel, route in shard['routes'].items():
+            if rel in owners:
+                problems.append(f'routes {owners[rel][1]!r} (shard {owners[rel][0]}) and {route!r} '
+                                f'(shard {shard["number"]}) both write {rel}')
+            else:
+                owners[rel] = (shard['number'], route)
+    if problems:
+        raise RuntimeError('Cannot merge shards:\n' + '\n'.join(problems))
+
+
+def assemble(public_dirs, dest):
+    """Link the files of every shard tree into `dest`; returns (files, placed, unchanged).
+
+    Files several shards share (assets, their manifest) must be identical.
+    """
+    sources = {}
+    conflicts = []
+    for src_root in public_dirs:
+        for dirpath, dirnames, filenames in os.walk(src_root):
+            dirnames.sort()
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, src_root)
+                # build state is per shard (the asset state holds this machine's mtimes)
+                if rel in (MANIFEST_NAME, SEARCH_STATE, ASSET_STATE):
+                    continue
+                if rel in sources:
+                    if not same_content(sources[rel], path):
+                        conflicts.append(f'{rel} differs between {sources[rel]} and {path}')
+                    continue
+                sources[rel] = path
+    if conflicts:
+        raise RuntimeError('Cannot merge shards:\n' + '\n'.join(conflicts))
+
+    placed = unchanged = 0
+    for rel, src in sources.items():
+        dst = os.path.join(dest, rel)
+        if os.path.exists(dst):
+            if os.path.samefile(src, dst) or same_content(src, dst):
+                unchanged += 1
+                continue
+            os.remove(dst)
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # shard builds replace files by rename, so a linked file never changes under the merge
+        link_or_copy(src, dst)
+        placed += 1
+    return set(sources), placed, unchanged
+
+
+def merge_shards(ast, backend, shard_dirs, output_dir, atomic=True):
+    """Combine the shard builds in `shard_dirs` into one `backend` project at output_dir."""
+    publics = {os.path.abspath(d): os.path.join(os.path.abspath(d), backend.PUBLIC) for d in shard_dirs}
+    manifests = {d: load_manifest(public) for d, public in publics.items()}
+    check_shards(manifests)
+
+    out = os.path.abspath(output_dir)
+    with publish_dir(out, atomic, keep=backend.KEEP) as stage:
+        dest = os.path.join(stage, backend.PUBLIC)
+        os.makedirs(dest, exist_ok=True)
+        produced, placed, unchanged = assemble(publics.values(), dest)
+        pages = {}
+        for manifest in manifests.values():
+            pages.update(manifest['pages'])
+
+        states = [load_search_state(public) for public in publics.values()]
+        states = [s for s in states if s is not None]
+        if states:
+            settings = states[0]['settings']
+            if any(s['settings'] != settings for s in states):
+                raise RuntimeError('Cannot merge shards: search settings differ between shards')
+            docs = {}
+            for state in states:
+                docs.update(state['docs'])
+            search = build_search_index(dest, docs, pages, settings)
+            produced |= search['files']
+            produced |= compress_outputs(dest, search['files'] - {SEARCH_STATE})['files']
+
+        save_manifest(dest, pages)
+        produced.add(MANIFEST_NAME)
+        removed = prune_tree(dest, produced)
+        backend.scaffold(ast, stage)
+    print(f'Merged {len(shard_dirs)} shards: {len(pages)} pages, {placed} files placed, '
+          f'{unchanged} unchanged, {removed} removed -> {out}')
+    return {'pages': len(pages), 'placed': placed, 'unchanged': unchanged, 'removed': removed}
@@ -0,0 +1,162 @@
+"""Render once, emit many.
+
+When several backends are generated together the public tree is rendered a single
+time into a staging directory. Its files are then ingested into a
+content-addressed object store (`objects/<sha256>`) and each backend's public
+folder is populated from that store with hardlinks (or reflinks), falling back to
+a plain copy when the filesystem can't link. Objects are never modified in place,
+so linked copies can't be changed behind a backend's back.
+
+Layout under `<output_dir>/.virtoweb-staging/`:
+
+    public/       the rendered tree (with its build manifest, so incremental works)
+    objects/      content-addressed file store
+    tree.json     rel path -> [size, mtime_ns, sha256] of the last ingest
+"""
+import json
+import os
+import shutil
+
+from .assets import file_digest
+
+STAGING_DIR = '.virtoweb-staging'
+# Linux FICLONE ioctl: share extents copy-on-write (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+
+
+def link_or_copy(src, dst):
+    """Place `src` at `dst` as a hardlink, else a reflink, else a copy."""
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return
+    except (OSError, ImportError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copy2(src, dst)
+
+
+def ingest_tree(src_root, staging):
+    """Add every file under src_root to the object store; return {rel: digest}.
+
+    Files whose size and mtime match the previous ingest are not re-hashed.
+    """
+    objects = os.path.join(staging, 'objects')
+    os.makedirs(objects, exist_ok=True)
+    index_path = os.path.join(staging, 'tree.json')
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    index = {}
+    tree = {}
+    for dirpath, _, filenames in os.walk(src_root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, src_root)
+            st = os.stat(path)
+            known = previous.get(rel)
+            if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+                digest = known[2]
+            else:
+                digest = file_digest(path)
+            obj = os.path.join(objects, digest)
+            if not os.path.exists(obj):
+                tmp = obj + '.tmp'
+                shutil.copy2(path, tmp)
+                os.replace(tmp, obj)
+            index[rel] = [st.st_size, st.st_mtime_ns, digest]
+            tree[rel] = digest
+
+    tmp = index_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path)
+    return tree
+
+
+def place_tree(tree, staging, dest_root):
+    """Populate dest_root from the object store; return (placed, unchanged, removed).
+
+    Files already linked to the right object are left alone; files under dest_root
+    that are not part of the tree are deleted.
+    """
+    objects = os.path.join(staging, 'objects')
+    placed = unchanged = removed = 0
+    for rel, digest in tree.items():
+        obj = os.path.join(objects, digest)
+        dst = os.path.join(dest_root, rel)
+        if os.path.exists(dst):
+            if os.path.samefile(obj, dst):
+                unchanged += 1
+                continue
+            os.remove(dst)
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        link_or_copy(obj, dst)
+        placed += 1
+
+    for dirpath, _, filenames in os.walk(dest_root, topdown=False):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.relpath(path, dest_root) not in tree:
+                os.remove(path)
+                removed += 1
+        if dirpath != dest_root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return placed, unchanged, removed
+
+
+def gc_objects(staging, tree):
+    """Drop objects no longer referenced by the current tree."""
+    objects = os.path.join(staging, 'objects')
+    live = set(tree.values())
+    for name in os.listdir(objects):
+        if name not in live:
+            os.remove(os.path.join(objects, name))
+
+
+def generate_many(backends, ast, output_dir, incremental=False, workers=1, atomic=True):
+    """Generate several backends from one render.
+
+    `backends` maps a name (used as the subdirectory of output_dir) to a backend
+    instance. The public tree is rendered once into the staging area and linked
+    into each backend's public folder before its scaffold is written. Each
+    backend's folder is published atomically (see publish.publish_dir).
+    """
+    from .common import render_static_site
+    from .publish import publish_dir
+    from .static_backend import TEMPLATE_DIR
+
+    root = os.path.abspath(output_dir)
+    staging = os.path.join(root, STAGING_DIR)
+    rendered = os.path.join(staging, 'public')
+    # the staging render keeps its own manifest, so later incremental runs only
+    # re-render what changed
+    render_static_site(ast, TEMPLATE_DIR, rendered, incremental=incremental, workers=workers)
+    tree = ingest_tree(rendered, staging)
+
+    for name, backend in backends.items():
+        out = os.path.join(root, name)
+        with publish_dir(out, atomic, keep=backend.KEEP) as stage:
+            # the clone shares inodes with the object store, so unchanged files stay linked
+            public = os.path.join(stage, backend.PUBLIC)
+            os.makedirs(public, exist_ok=True)
+            placed, unchanged, removed = place_tree(tree, staging, public)
+            backend.scaffold(ast, stage)
+        print(f'{name}: {placed} files placed, {unchanged} unchanged, {removed} removed -> {out}')
+
+    gc_objects(staging, tree)
@@ -1,6 +1,6 @@
 import os
-import shutil
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from .publish import publish_dir
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
@@ -9,59 +9,22 @@ TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
 class StaticBackend:
     """Minimal static backend: writes HTML files and copies assets/CSS."""
 
-    def generate(self, ast, output_dir):
-        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html', 'xml']))
-
-        layouts = ast['layouts']
-        components = ast['components']
-
-        # clean
-        out = os.path.abspath(output_dir)
-        if os.path.exists(out):
-            shutil.rmtree(out)
-        os.makedirs(out, exist_ok=True)
+    # the rendered site is the whole project
+    PUBLIC = ''
 
-        # copy assets included in templates/assets
-        assets_src = os.path.join(TEMPLATE_DIR, 'assets')
-        if os.path.exists(assets_src):
-            shutil.copytree(assets_src, os.path.join(out, 'assets'))
+    # forms post wherever their actions point; nothing handles them here
+    FORM_HANDLERS = False
+    KEEP = ()
 
-        for p in ast['pages']:
-            route = p.get('route', '/')
-            if '{' in route and '}' in route:
-                # param routes skipped in static backend
-                continue
-            if route == '/' or route == '':
-                out_dir = out
-            else:
-                out_dir = os.path.join(out, route.lstrip('/'))
-            os.makedirs(out_dir, exist_ok=True)
-            layout_id = p.get('layout')
-            layout = layouts.get(layout_id)
-            layout_tmpl = layout.get('template') + '.html.j2'
-            tmpl = env.get_template(layout_tmpl)
+    def generate(self, ast, output_dir, incremental=False, workers=1, atomic=True):
+        from .common import render_static_site
 
-            rendered_regions = {}
-            for region_name in layout.get('regions', []):
-                parts = []
-                for inst in (p.get('regions') or {}).get(region_name, []):
-                    comp_id = inst.get('component')
-                    comp = components.get(comp_id)
-                    if not comp:
-                        parts.append(f'<!-- Missing component {comp_id} -->')
-                        continue
-                    comp_tmpl = comp.get('template') + '.html.j2'
-                    try:
-                        comp_template = env.get_template(comp_tmpl)
-                        props = dict(comp.get('props', {}))
-                        props.update(inst.get('props') or {})
-                        parts.append(comp_template.render(project=ast['project'], page=p, props=props, regions={}))
-                    except Exception as e:
-                        parts.append(f'<!-- component render error: {e} -->')
-                rendered_regions[region_name] = '\n'.join(parts)
-
-            html = tmpl.render(project=ast['project'], page=p, regions=rendered_regions)
-            with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
-                f.write(html)
+        out = os.path.abspath(output_dir)
+        # build into a staged copy of the site and swap it in when done
+        with publish_dir(out, atomic) as stage:
+            render_static_site(ast, TEMPLATE_DIR, stage, incremental=incremental, workers=workers)
 
         print('Static backend: generated site at', out)
+
+    def scaffold(self, ast, out):
+        """Static sites have no server scaffold."""
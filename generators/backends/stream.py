@@ -0,0 +1,181 @@
+"""Streaming page rendering.
+
+Enabled with `generator.options.streamPages` (`true`, or a buffer size in
+bytes). Instead of joining every region into one string and rendering the
+layout into another, the layout is rendered with Jinja's `Template.generate()`
+and regions are lazy: each region is a placeholder in the layout output, and
+it is replaced in the stream by its component fragments one at a time. Output
+goes through a buffer that is flushed to the file whenever it grows past the
+buffer size, so peak memory per page is bounded by the buffer (plus the largest
+single fragment), not by the page.
+
+Asset URL rewriting and HTML minification run on each flushed chunk. Chunks are
+cut just before a block-level tag outside `<pre>`, `<textarea>`, `<script>`,
+`<style>` and comments, which keeps both transforms byte-identical to running
+them over the whole page. A page with no such boundary is buffered until one
+comes along; each flush only scans the text added since the previous one.
+
+Regions keep working in layouts as `{{ regions.main | safe }}` (or without
+`safe`); `{% if regions.main %}` is true when the region has instances.
+"""
+import os
+import re
+
+from .minify import BLOCK_TAG
+from .publish import same_content
+
+DEFAULT_BUFFER = 64 * 1024
+_MARK = '\x00virtoweb-region:{}\x00'
+_MARK_RE = re.compile('\x00virtoweb-region:([^\x00]*)\x00')
+# a complete comment or raw element can't be cut; an unterminated one ends the search
+_CUT = re.compile(
+    r'<!--.*?-->'
+    r'|<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>'
+    r'|(?P<open><!--|<(?:pre|textarea|script|style)\b)'
+    # the tag name must be complete: `<p` at the end of the buffer may become `<pre`
+    r'|(?P<block>' + BLOCK_TAG.pattern + r'(?=[\s/>]))',
+    re.S | re.I,
+)
+
+
+def stream_settings(options):
+    """Return the streaming buffer size from `generator.options`, or None when off."""
+    value = (options or {}).get('streamPages', False)
+    if value is True:
+        return DEFAULT_BUFFER
+    if isinstance(value, int) and value > 0:
+        return value
+    return None
+
+
+class LazyRegion:
+    """A region whose component `instances` are rendered one by one with `render(inst)`."""
+
+    def __init__(self, name, instances, render):
+        self.name = name
+        self.instances = instances
+        self.render = render
+
+    def __bool__(self):
+        return bool(self.instances)
+
+    def __html__(self):
+        return _MARK.format(self.name)
+
+    __str__ = __html__
+
+    def __iter__(self):
+        for i, inst in enumerate(self.instances):
+            if i:
+                yield '\n'
+            yield self.render(inst)
+
+
+def safe_cut(html):
+    """Return `(cut, resume)` for `html`.
+
+    `cut` is the offset of the last chunk boundary (-1 if there is none) and
+    `resume` the offset a scan of the same text with more appended can start
+    from: every match before it is final.
+    """
+    cut = -1
+    resume = 0
+    for m in _CUT.finditer(html):
+        if m.group('open'):
+            # an unterminated comment or raw element: look at it again once it may be closed
+            return cut, m.start()
+        if m.group('block'):
+            cut = m.start()
+        resume = m.end()
+    # only a `<` after the last match can still start one (e.g. `<p` that becomes `<pre>`)
+    tail = html.rfind('<', resume)
+    return cut, tail if tail >= 0 else len(html)
+
+
+class ChunkWriter:
+    """Buffered page output written to a temp file next to `path`.
+
+    `close()` moves it into place, unless `path` already holds the same bytes
+    (see publish.write_file), and returns True if the file was written.
+    """
+
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER, transform=None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.transform = transform
+        # buffered text safe_cut has already scanned (no boundary in it but at its start) ...
+        self.scanned = []
+        self.scanned_size = 0
+        # ... and the text after it
+        self.parts = []
+        self.size = 0
+        # flush once this much is buffered
+        self.limit = buffer_size
+        self.tmp = f'{path}.{os.getpid()}.tmp'
+        self.file = open(self.tmp, 'wb')
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self.flush()
+
+    def flush(self, final=False):
+        html = ''.join(self.parts)
+        if final:
+            cut = resume = len(html)
+        else:
+            cut, resume = safe_cut(html)
+        # a boundary at the very start of the buffer leaves nothing to write before it
+        if cut > 0 or (cut == 0 and self.scanned):
+            chunk = ''.join(self.scanned) + html[:cut]
+            html = html[cut:]
+            resume -= cut
+            self.scanned = []
+            self.scanned_size = 0
+            if self.transform is not None:
+                chunk = self.transform(chunk)
+            self.file.write(chunk.encode('utf-8'))
+        # whatever couldn't be cut yet waits for another buffer's worth; only the
+        # text from `resume` on is scanned again
+        if resume:
+            self.scanned.append(html[:resume])
+            self.scanned_size += resume
+            html = html[resume:]
+        self.parts = [html] if html else []
+        self.size = self.scanned_size + len(html)
+        self.limit = self.size + self.buffer_size
+
+    def close(self):
+        try:
+            self.flush(final=True)
+            self.file.close()
+            if same_content(self.tmp, self.path):
+                os.remove(self.tmp)
+                return False
+            os.replace(self.tmp, self.path)
+            return True
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def stream_layout(template, context, regions, writer):
+    """Render `template` into `writer`, expanding the LazyRegions in `regions` in place."""
+    for chunk in template.generate(**context, regions=regions):
+        if '\x00' not in chunk:
+            writer.write(chunk)
+            continue
+        # split() alternates text and region names
+        for i, part in enumerate(_MARK_RE.split(chunk)):
+            if not i % 2:
+                if part:
+                    writer.write(part)
+            elif part in regions:
+                for fragment in regions[part]:
+                    writer.write(fragment)
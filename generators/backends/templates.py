@@ -0,0 +1,131 @@
+"""Shared Jinja2 environment setup for all renderers.
+
+Compiled templates are persisted in an on-disk bytecode cache so repeated builds
+(and different backends) skip parsing and compiling unchanged templates. Cache
+entries are keyed by template name, source hash and Jinja version, so edits to a
+template or a Jinja upgrade never pick up stale bytecode.
+
+The cache lives under `jinja/` in the VirtoWeb cache root; set VIRTOWEB_CACHE_DIR to
+move that root, or to an empty string to disable on-disk caching.
+"""
+import hashlib
+import os
+
+import jinja2
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, meta, select_autoescape
+from jinja2.bccache import Bucket
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_CACHE_DIR = os.path.join(ROOT, '.virtoweb-cache')
+
+
+class SourceKeyedBytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache whose file names include the template source hash and Jinja version."""
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        key = hashlib.sha1(f'{jinja2.__version__}\0{name}\0{checksum}'.encode('utf-8')).hexdigest()
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+
+def cache_dir():
+    return os.environ.get('VIRTOWEB_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+
+def make_environment(template_dir):
+    bcc = None
+    directory = cache_dir()
+    if directory:
+        directory = os.path.join(directory, 'jinja')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            bcc = SourceKeyedBytecodeCache(directory, '__virtoweb_%s.cache')
+        except OSError:
+            # an unwritable cache location only costs compile time
+            bcc = None
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        autoescape=select_autoescape(['html', 'xml']),
+        bytecode_cache=bcc,
+    )
+
+
+class TemplateTable:
+    """Resolve each template name once per build.
+
+    `Environment.get_template` re-checks the loader (a stat per call) every time it
+    is asked for a template; the table memoizes both successful lookups and load
+    errors so each name hits the environment only once.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._templates = {}
+        self._reads = {}
+
+    def get(self, name):
+        try:
+            tmpl = self._templates[name]
+        except KeyError:
+            try:
+                tmpl = self.env.get_template(name)
+            except Exception as e:
+                tmpl = e
+            self._templates[name] = tmpl
+        if isinstance(tmpl, Exception):
+            raise tmpl
+        return tmpl
+
+    def reads(self, name):
+        """Return the set of context variables template `name` reads, or None if unknown.
+
+        Variables read by included/extended templates are folded in, since those
+        templates see the same context. None means the template references a
+        dynamically named template or failed to load, and callers must assume it
+        reads everything.
+        """
+        if name in self._reads:
+            return self._reads[name]
+        # guard against include cycles while we recurse
+        self._reads[name] = set()
+        try:
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            parsed = self.env.parse(source)
+        except Exception:
+            self._reads[name] = None
+            return None
+        names = set(meta.find_undeclared_variables(parsed))
+        for ref in meta.find_referenced_templates(parsed):
+            sub = self.reads(ref) if ref else None
+            if sub is None:
+                names = None
+                break
+            names |= sub
+        self._reads[name] = names
+        return names
+
+    def invalidate(self, names):
+        """Forget resolved templates and read-sets, e.g. after template files changed."""
+        for name in names:
+            self._templates.pop(name, None)
+        # read-sets fold in included templates, so any change can affect any entry
+        self._reads.clear()
+
+    def closure(self, name):
+        """Return `name` plus every template it includes/extends, transitively."""
+        seen = set()
+        stack = [name]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            try:
+                source, _, _ = self.env.loader.get_source(self.env, current)
+                refs = meta.find_referenced_templates(self.env.parse(source))
+            except Exception:
+                continue
+            stack.extend(r for r in refs if r)
+        return seen
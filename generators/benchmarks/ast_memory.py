@@ -0,0 +1,111 @@
+"""
+Compare the compact node AST with the plain dict AST it replaced.
+
+Builds a synthetic schema (see synthetic.py) and reports:
+
+  memory    bytes retained per page by the parsed dict pages vs the node pages
+            (measured with tracemalloc)
+  load      time to get a usable AST: parse + validate + dict AST (the old path),
+            parse + validate + node AST (a cache miss) and a binary cache hit
+
+Usage:
+  python generators/benchmarks/ast_memory.py --pages 5000
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.benchmarks.synthetic import write_schema  # noqa: E402
+from generators.core.generator import SCHEMA_PATH, build_ast, load_ast  # noqa: E402
+from generators.validator.schema_cache import validate_schema  # noqa: E402
+
+
+def retained(fn):
+    """Return (result, bytes still allocated by fn once it returned)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def dict_ast(raw):
+    # what build_ast kept before the node types: the parsed dicts themselves
+    instance = json.loads(raw)
+    validate_schema(instance, SCHEMA_PATH)
+    return {'pages': instance['pages'], 'layouts': {l['id']: l for l in instance['layouts']}}
+
+
+def node_ast(raw, source_dir):
+    instance = json.loads(raw)
+    validate_schema(instance, SCHEMA_PATH)
+    return build_ast(instance, source_dir)[0]
+
+
+def median_time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure AST memory per page and AST load time.')
+    parser.add_argument('--pages', type=int, default=5000)
+    parser.add_argument('--components', type=int, default=3, help='component instances per region')
+    parser.add_argument('--prop-bytes', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # keep the benchmark's cache entries out of the user's cache
+        os.environ['VIRTOWEB_CACHE_DIR'] = os.path.join(tmp, 'cache')
+        schema_path = write_schema(os.path.join(tmp, 'bench_schema.json'), pages=args.pages,
+                                   components_per_region=args.components, prop_bytes=args.prop_bytes)
+        with open(schema_path, 'rb') as f:
+            raw = f.read()
+        source_dir = os.path.dirname(schema_path)
+        pages = len(json.loads(raw)['pages'])
+
+        # parse and validate retain nothing for the node AST: the dicts are dropped
+        validate_schema(json.loads(raw), SCHEMA_PATH)
+        _, dict_bytes = retained(lambda: dict_ast(raw))
+        _, node_bytes = retained(lambda: node_ast(raw, source_dir))
+        load_ast(schema_path)
+        _, cached_bytes = retained(lambda: load_ast(schema_path))
+
+        times = {
+            'dict AST (parse + validate)': median_time(lambda: dict_ast(raw), args.repeat),
+            'node AST (parse + validate)': median_time(lambda: node_ast(raw, source_dir), args.repeat),
+            'node AST (cache hit)': median_time(lambda: load_ast(schema_path), args.repeat),
+        }
+
+    print(f'{pages} pages, {len(raw) / 1e6:.1f} MB schema')
+    print(f'{"memory per page":<30}{"bytes":>10}')
+    print(f'{"  dict AST":<30}{dict_bytes / pages:>10.0f}')
+    print(f'{"  node AST":<30}{node_bytes / pages:>10.0f}  ({node_bytes / dict_bytes * 100:.0f}%)')
+    print(f'{"  node AST from cache":<30}{cached_bytes / pages:>10.0f}  ({cached_bytes / dict_bytes * 100:.0f}%)')
+    print(f'{"load time":<30}{"ms":>10}')
+    base = times['dict AST (parse + validate)']
+    for label, seconds in times.items():
+        print(f'  {label:<28}{seconds * 1000:>10.1f}  ({base / seconds:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
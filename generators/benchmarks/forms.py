@@ -0,0 +1,150 @@
+"""
+Benchmark the generated form handler.
+
+Generates the example project with the Python backend into a temporary
+directory and drives its `FormHandler` in-process through WSGI (no sockets, so
+only the handler's own cost is measured): `--threads` threads post valid
+submissions to the first form, each from its own client IP so the rate limiter
+is exercised without rejecting anything. Reports:
+
+  responses  status counts; 503s mean submissions arrived faster than the
+             writer drained the bounded queue (raise `--queue-size` to measure
+             acceptance alone)
+
+  accepted   submissions acknowledged per second (validated and queued)
+  written    rows committed per second by the writer thread, the number of
+             transactions and the average batch size, once the queue is drained
+
+Usage:
+  python generators/benchmarks/forms.py [path/to/site_schema.json] [--requests 20000] [--threads 8] [--queue-size N]
+"""
+import argparse
+import importlib.util
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.backends.forms import TYPE_PATTERNS  # noqa: E402
+from generators.core.generator import generate  # noqa: E402
+
+EXAMPLE = os.path.join(ROOT, 'examples', 'example_layout_site.json')
+# a value matching each field type's implied pattern
+SAMPLES = {TYPE_PATTERNS['email']: 'someone@example.com', TYPE_PATTERNS['url']: 'https://example.com/'}
+
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sample_values(fields):
+    """A submission that passes `fields` (compiled field specs)."""
+    values = {}
+    for f in fields:
+        if f['enum']:
+            values[f['name']] = f['enum'][0]
+        elif f['number']:
+            values[f['name']] = str(f['min'] if f['min'] is not None else 1)
+        else:
+            values[f['name']] = SAMPLES.get(f['pattern'], f'value of {f["name"]}')
+    return values
+
+
+def environ_for(form, body, ip):
+    environ = {
+        'REQUEST_METHOD': form['method'],
+        'PATH_INFO': form['action'],
+        'HTTP_HOST': 'localhost',
+        'HTTP_ORIGIN': 'http://localhost',
+        'REMOTE_ADDR': ip,
+    }
+    if form['method'] == 'GET':
+        environ['QUERY_STRING'] = body.decode('ascii')
+    else:
+        environ.update({'CONTENT_TYPE': 'application/x-www-form-urlencoded', 'CONTENT_LENGTH': str(len(body)),
+                        'wsgi.input': io.BytesIO(body)})
+    setup_testing_defaults(environ)
+    return environ
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure form submissions per second through the generated handler.')
+    parser.add_argument('schema', nargs='?', default=EXAMPLE)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--queue-size', type=int, default=None, help="default: the project's forms.queueSize")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'site')
+        generate(args.schema, 'python', out, atomic=False)
+        path = os.path.join(out, 'form_handlers.py')
+        if not os.path.exists(path):
+            print('The schema has no forms.', file=sys.stderr)
+            return 1
+        handlers = load_module(path, 'bench_form_handlers')
+        database = os.path.join(tmp, 'forms.sqlite3')
+        form = handlers.FORMS[0]
+        body = urlencode(sample_values(form['fields'])).encode('utf-8')
+
+        def app(environ, start_response):
+            start_response('404 Not Found', [])
+            return []
+
+        settings = dict(handlers.SETTINGS)
+        if args.queue_size:
+            settings['queueSize'] = args.queue_size
+        handler = handlers.FormHandler(app, settings=settings, database=database)
+        statuses = {}
+        lock = threading.Lock()
+
+        def worker(first, count):
+            seen = {}
+            for i in range(first, first + count):
+                # a fresh client per request: the limiter is consulted but never full
+                ip = f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+                result = {}
+                handler(environ_for(form, body, ip), lambda status, headers: result.setdefault('status', status))
+                seen[result['status']] = seen.get(result['status'], 0) + 1
+            with lock:
+                for status, n in seen.items():
+                    statuses[status] = statuses.get(status, 0) + n
+
+        per_thread = args.requests // args.threads
+        threads = [threading.Thread(target=worker, args=(t * per_thread, per_thread)) for t in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        accepted_time = time.perf_counter() - start
+        handler.writer.close()
+        written_time = time.perf_counter() - start
+
+        with sqlite3.connect(database) as db:
+            rows = db.execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+
+    total = per_thread * args.threads
+    writer = handler.writer
+    print(f'{total} submissions to {form["method"]} {form["action"]} from {args.threads} threads')
+    print('responses: ' + ', '.join(f'{status}: {n}' for status, n in sorted(statuses.items())))
+    print(f'{"accepted":<10}{total / accepted_time:>10.0f} /s  ({accepted_time * 1000:.0f} ms)')
+    print(f'{"written":<10}{rows / written_time:>10.0f} /s  ({rows} rows in {writer.batches} transactions, '
+          f'{rows / max(writer.batches, 1):.0f} per batch)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
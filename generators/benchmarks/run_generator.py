@@ -0,0 +1,185 @@
+"""
+Generator benchmark suite.
+
+Builds a synthetic schema (see synthetic.py), then times each phase of a build
+for every backend:
+
+  load      read and parse the schema file
+  validate  validate it against the project JSON Schema
+  build_ast build the AST and cross-check references
+  render    render every page to HTML in memory
+  write     full backend build into an empty output directory
+
+Each phase runs `--repeat` times and the median is reported. Results can be
+written as JSON (`--out`), saved as a baseline (`--save-baseline`) and compared
+against one (`--baseline`): the run fails (exit status 1) when a phase is more
+than `--threshold` slower than the baseline and at least `--min-delta` seconds
+slower, so tiny phases don't flap on noise.
+
+Usage:
+  python generators/benchmarks/run_generator.py --pages 2000 --save-baseline bench-baseline.json
+  python generators/benchmarks/run_generator.py --pages 2000 --baseline bench-baseline.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.backends.common import SiteRenderer  # noqa: E402
+from generators.backends.routes import iter_pages  # noqa: E402
+from generators.backends.static_backend import TEMPLATE_DIR  # noqa: E402
+from generators.backends.templates import TemplateTable, make_environment  # noqa: E402
+from generators.benchmarks.synthetic import DEFAULT_MIX, parse_mix, write_schema  # noqa: E402
+from generators.core.generator import SCHEMA_PATH, build_ast, get_backend  # noqa: E402
+from generators.core.loader import load_json  # noqa: E402
+from generators.validator.schema_cache import validate_schema  # noqa: E402
+
+BACKENDS = ['static', 'python', 'node', 'php']
+PHASES = ['load', 'validate', 'build_ast', 'render', 'write']
+RESULTS_VERSION = 1
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def run_backend(schema_path, backend_name, workers):
+    """Run every phase once for one backend; returns {phase: seconds}."""
+    times = {}
+    times['load'], instance = timed(lambda: load_json(schema_path))
+    times['validate'], (ok, errors) = timed(lambda: validate_schema(instance, SCHEMA_PATH))
+    if not ok:
+        raise RuntimeError(f'Synthetic schema is invalid: {errors[0]}')
+    times['build_ast'], (ast, _) = timed(lambda: build_ast(instance, os.path.dirname(schema_path)))
+
+    def render():
+        renderer = SiteRenderer(ast, TemplateTable(make_environment(TEMPLATE_DIR)))
+        for p in iter_pages(ast['pages'], ast.get('source_dir')):
+            renderer.render_page(p)
+
+    times['render'], _ = timed(render)
+    backend = get_backend(backend_name)
+    with tempfile.TemporaryDirectory() as tmp:
+        times['write'], _ = timed(lambda: backend.generate(ast, os.path.join(tmp, 'out'), workers=workers))
+    return times
+
+
+def run(schema_path, backends, repeat, workers):
+    results = {}
+    for name in backends:
+        samples = {phase: [] for phase in PHASES}
+        for _ in range(repeat):
+            # backends report progress on stdout; keep the benchmark output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                times = run_backend(schema_path, name, workers)
+            for phase, seconds in times.items():
+                samples[phase].append(seconds)
+        results[name] = {phase: {'median': statistics.median(s), 'samples': s} for phase, s in samples.items()}
+    return results
+
+
+def compare(results, baseline, threshold, min_delta):
+    """Return a list of regression messages (empty when nothing regressed)."""
+    regressions = []
+    for backend, phases in results.items():
+        for phase, data in phases.items():
+            base = baseline.get('results', {}).get(backend, {}).get(phase)
+            if not base:
+                continue
+            new, old = data['median'], base['median']
+            if new > old * (1 + threshold) and new - old >= min_delta:
+                regressions.append(f'{backend}/{phase}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms '
+                                   f'(+{(new / old - 1) * 100:.0f}%)')
+    return regressions
+
+
+def print_table(results, baseline=None):
+    header = f'{"backend":<8}' + ''.join(f'{phase:>12}' for phase in PHASES)
+    print(header + '   (median ms' + (', change vs baseline)' if baseline else ')'))
+    for backend, phases in results.items():
+        row = f'{backend:<8}'
+        for phase in PHASES:
+            cell = f'{phases[phase]["median"] * 1000:.1f}'
+            base = (baseline or {}).get('results', {}).get(backend, {}).get(phase)
+            if base:
+                cell += f' {(phases[phase]["median"] / base["median"] - 1) * 100:+.0f}%'
+            row += f'{cell:>12}'
+        print(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark VirtoWeb generation phases on a synthetic schema.')
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--components', type=int, default=3, help='component instances per region')
+    parser.add_argument('--prop-bytes', type=int, default=256, help='approximate prop payload per instance')
+    parser.add_argument('--mix', default=','.join(f'{k}:{v}' for k, v in DEFAULT_MIX.items()),
+                        help='weighted component mix, e.g. hero:1,content:3,nav:1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--baseline', help='compare against this results JSON')
+    parser.add_argument('--save-baseline', help='write results JSON here as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown per phase (0.2 = 20%%)')
+    parser.add_argument('--min-delta', type=float, default=0.005, help='ignore slowdowns below this many seconds')
+    args = parser.parse_args(argv)
+
+    params = {
+        'pages': args.pages, 'components': args.components, 'prop_bytes': args.prop_bytes,
+        'mix': parse_mix(args.mix), 'seed': args.seed, 'workers': args.workers,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        schema_path = write_schema(os.path.join(tmp, 'bench_schema.json'), pages=args.pages,
+                                   components_per_region=args.components, prop_bytes=args.prop_bytes,
+                                   mix=params['mix'], seed=args.seed)
+        results = run(schema_path, args.backends.split(','), args.repeat, args.workers)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'params': params,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print('Warning: baseline was recorded with different parameters:', baseline.get('params'))
+
+    print_table(results, baseline)
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print('Wrote', path)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f'Regressions beyond {args.threshold * 100:.0f}%:')
+            for line in regressions:
+                print('  ' + line)
+            return 1
+        print('No regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
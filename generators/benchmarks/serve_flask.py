@@ -0,0 +1,116 @@
+"""
+Benchmark the generated Flask app against the original `send_from_directory` app.
+
+Generates the example project with the Python backend into a temporary
+directory, then drives both apps in-process through their WSGI callables (no
+sockets, so only the app's own per-request cost is measured) for a page, a
+stylesheet and a conditional page request.
+
+Usage:
+  python generators/benchmarks/serve_flask.py [path/to/site_schema.json] [--requests 5000]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from wsgiref.util import setup_testing_defaults
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.core.generator import generate  # noqa: E402
+
+EXAMPLE = os.path.join(ROOT, 'examples', 'example_layout_site.json')
+
+# the app the Python backend generated before the route-table server
+LEGACY_APP = """
+from flask import Flask, send_from_directory
+import os
+app = Flask(__name__, static_folder='public', static_url_path='')
+
+@app.route('/')
+def index():
+    return send_from_directory(app.static_folder, 'index.html')
+
+@app.route('/<path:path>')
+def static_proxy(path):
+    # send static files from public/
+    full = os.path.join(app.static_folder, path)
+    if os.path.isdir(full):
+        return send_from_directory(app.static_folder, os.path.join(path, 'index.html'))
+    return send_from_directory(app.static_folder, path)
+"""
+
+
+def load_app(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Flask resolves static_folder against the module's file, found via sys.modules
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def call(app, path, headers=None):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}
+    for key, value in (headers or {}).items():
+        environ['HTTP_' + key.upper().replace('-', '_')] = value
+    setup_testing_defaults(environ)
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result['status'] = status
+        result['headers'] = dict(response_headers)
+
+    body = app(environ, start_response)
+    size = sum(len(chunk) for chunk in body)
+    if hasattr(body, 'close'):
+        body.close()
+    return result['status'], result['headers'], size
+
+
+def bench(app, path, headers, requests):
+    status, _, _ = call(app, path, headers)
+    start = time.perf_counter()
+    for _ in range(requests):
+        call(app, path, headers)
+    elapsed = time.perf_counter() - start
+    return status, requests / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the generated Flask app with the original one.')
+    parser.add_argument('schema', nargs='?', default=EXAMPLE)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'site')
+        generate(args.schema, backend_name='python', output_dir=out)
+        legacy_path = os.path.join(out, 'legacy_app.py')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            f.write(LEGACY_APP)
+        apps = [('original', load_app(legacy_path, 'legacy_app')), ('generated', load_app(os.path.join(out, 'app.py'), 'generated_app'))]
+
+        css = sorted(os.listdir(os.path.join(out, 'public', 'assets')))[0]
+        _, page_headers, _ = call(apps[1][1], '/')
+        cases = [
+            ('page /', '/', {}),
+            ('stylesheet', '/assets/' + css, {}),
+            ('conditional page', '/', {'If-None-Match': page_headers['ETag']}),
+        ]
+        print(f'{"case":<18} {"app":<10} {"status":<18} {"req/s":>10}')
+        for label, path, headers in cases:
+            rates = []
+            for name, app in apps:
+                status, rate = bench(app, path, headers, args.requests)
+                rates.append(rate)
+                print(f'{label:<18} {name:<10} {status:<18} {rate:>10.0f}')
+            print(f'{"":<18} speedup {rates[1] / rates[0]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
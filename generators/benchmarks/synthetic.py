@@ -0,0 +1,90 @@
+"""
+Synthetic VirtoWeb schemas for benchmarks.
+
+`make_schema` starts from the example schema (its project, layouts, components and
+forms) and adds generated pages. Each page fills every region of its layout with
+`components_per_region` component instances drawn from a weighted template mix,
+and every instance carries about `prop_bytes` of text props. The output is
+deterministic for a given seed.
+"""
+import json
+import os
+import random
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+EXAMPLE = os.path.join(ROOT, 'examples', 'example_layout_site.json')
+# component id -> weight; ids come from the base schema
+DEFAULT_MIX = {'hero': 1, 'content': 3, 'nav': 1}
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+          'incididunt ut labore et dolore magna aliqua').split()
+
+
+def parse_mix(spec):
+    """Parse `hero:1,content:3` into a component -> weight dict."""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition(':')
+        if name:
+            mix[name] = float(weight or 1)
+    return mix
+
+
+def _text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def _props(comp_id, rng, prop_bytes):
+    """Instance props sized to roughly prop_bytes for the example components."""
+    if comp_id == 'nav':
+        count = max(1, prop_bytes // 48)
+        return {'links': [{'title': _text(rng, 12), 'href': f'/bench/{rng.randrange(10 ** 6)}'} for _ in range(count)]}
+    if comp_id == 'hero':
+        return {'headline': _text(rng, prop_bytes // 2), 'sub': _text(rng, prop_bytes // 2)}
+    if comp_id == 'content':
+        return {'html': f'<p>{_text(rng, prop_bytes)}</p>'}
+    return {'text': _text(rng, prop_bytes)}
+
+
+def make_schema(pages=1000, components_per_region=3, prop_bytes=256, mix=None, seed=0, base=EXAMPLE):
+    """Return a schema dict with `pages` generated pages on top of `base`."""
+    with open(base, 'r', encoding='utf-8') as f:
+        schema = json.load(f)
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    components = {c['id'] for c in schema.get('components', [])}
+    unknown = set(mix) - components
+    if unknown:
+        raise ValueError(f"Unknown components in template mix: {', '.join(sorted(unknown))}")
+    names = sorted(mix)
+    weights = [mix[n] for n in names]
+    layouts = schema.get('layouts', [])
+
+    generated = []
+    for i in range(pages):
+        layout = layouts[i % len(layouts)]
+        regions = {}
+        for region in layout.get('regions', []):
+            picks = rng.choices(names, weights, k=components_per_region)
+            regions[region] = [{'component': c, 'props': _props(c, rng, prop_bytes)} for c in picks]
+        generated.append({
+            'id': f'bench{i}',
+            'route': f'/bench/{i}',
+            'title': f'Bench page {i}',
+            'layout': layout['id'],
+            'regions': regions,
+        })
+    schema['pages'] = schema.get('pages', []) + generated
+    return schema
+
+
+def write_schema(path, **kwargs):
+    schema = make_schema(**kwargs)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(schema, f)
+    return path
@@ -0,0 +1,87 @@
+"""
+Binary AST cache.
+
+A built AST is pickled into the VirtoWeb cache (`<cache>/ast/`) under a key made
+of the project file's bytes, the JSON Schema it was validated against, the
+directory data sources resolve against and the cache format version. Loading an
+unchanged project file then costs one hash and one unpickle: no JSON parsing,
+validation or AST building.
+
+Files start with a magic string and the format version; anything that doesn't
+match (or fails to unpickle) is treated as a miss and rebuilt.
+"""
+import gc
+import hashlib
+import os
+import pickle
+
+from ..validator.schema_cache import cache_root
+
+MAGIC = b'VWAST'
+# bump when the AST or its node types (core/nodes.py) change shape
+# (or build_ast checks more: cached ASTs skip the checks)
+AST_CACHE_VERSION = 2
+_HEADER = MAGIC + AST_CACHE_VERSION.to_bytes(2, 'big')
+
+
+def ast_cache_key(raw, source_dir, schema_path):
+    """Key for the AST of project file contents `raw` validated against `schema_path`."""
+    h = hashlib.sha256(_HEADER)
+    with open(schema_path, 'rb') as f:
+        h.update(hashlib.sha256(f.read()).digest())
+    h.update(os.fsencode(source_dir or ''))
+    h.update(b'\0')
+    h.update(raw)
+    return h.hexdigest()
+
+
+def ast_cache_path(key):
+    root = cache_root()
+    if not root:
+        return None
+    return os.path.join(root, 'ast', f'{key[:32]}.ast')
+
+
+def read_ast_cache(key):
+    """Return the cached `(ast, generator settings)` for `key`, or None."""
+    path = ast_cache_path(key)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(_HEADER):
+        return None
+    # the AST is a large acyclic graph: cyclic GC passes during the load find
+    # nothing and cost more than the load itself
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        stored_key, ast, settings = pickle.loads(memoryview(data)[len(_HEADER):])
+    except Exception:
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+    if stored_key != key:
+        return None
+    return ast, settings
+
+
+def write_ast_cache(key, ast, settings):
+    """Store a validated AST; returns the cache file path (None if caching is off)."""
+    path = ast_cache_path(key)
+    if path is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER)
+            pickle.dump((key, ast, settings), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        return None
+    return path
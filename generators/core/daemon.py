@@ -0,0 +1,359 @@
+"""
+Build daemon: a long-running build server on a local Unix socket.
+
+Starting a build from a fresh interpreter pays for interpreter start-up, the
+jsonschema/Jinja2 imports, compiling the validator and compiling templates before
+any page is rendered. The daemon pays that once. It keeps one SiteWatcher (see
+watch.py) per project (schema, backend, output dir), so the compiled validator,
+the Jinja environment with its compiled templates and the parsed AST stay warm.
+Schema and template edits are picked up by modification time before each build.
+
+Builds run one at a time on a single build thread. Requests for a project that
+is already queued are coalesced into the queued build and every requester gets
+its result; a request that arrives while its project is building queues the
+next build, so the result always reflects the files as they were when the
+request was made. Output is published atomically, as with `generate()`.
+
+The protocol is one JSON object per line. The client sends a request
+(`{"op": "build", "schema": ..., "backend": ..., "out": ..., "incremental": ...,
+"workers": ..., "cwd": ...}`, `{"op": "status"}` or `{"op": "stop"}`); for a build the daemon
+streams `queued`, `log` (one per line of build output) and a final `done`
+message with `ok`, `stats` and `seconds` (or `error`).
+
+The client side only uses the standard library, so it starts fast.
+
+Usage:
+  python -m generators.core.daemon serve [--socket PATH]
+  python -m generators.core.daemon build path/to/site_schema.json [--backend static] [--out dist/site] [--full]
+  python -m generators.core.daemon status
+  python -m generators.core.daemon stop
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import redirect_stdout
+
+
+def default_socket_path():
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'virtoweb-build.sock')
+    uid = os.getuid() if hasattr(os, 'getuid') else 'user'
+    return os.path.join(tempfile.gettempdir(), f'virtoweb-build-{uid}.sock')
+
+
+def log(*args):
+    # the build thread's stdout is redirected to the clients; daemon logs bypass it
+    print('[daemon]', *args, file=sys.__stdout__, flush=True)
+
+
+class BuildJob:
+    """A queued build of one project and everyone waiting for it."""
+
+    def __init__(self, key, incremental, workers):
+        self.key = key
+        self.incremental = incremental
+        self.workers = workers
+        self.subscribers = []
+
+    def merge(self, incremental, workers):
+        # one full request makes the coalesced build a full build
+        self.incremental = self.incremental and incremental
+        self.workers = max(self.workers, workers)
+
+    def send(self, message):
+        for sub in self.subscribers:
+            sub.put(message)
+
+
+class _JobOutput:
+    """File-like stdout for the build thread: each line goes to the job's subscribers."""
+
+    def __init__(self, job):
+        self.job = job
+        self.buffer = ''
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        for line in lines:
+            self.job.send({'type': 'log', 'line': line})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer:
+            self.job.send({'type': 'log', 'line': self.buffer})
+            self.buffer = ''
+
+
+class BuildDaemon:
+    """Queue, coalesce and run builds against warm per-project state."""
+
+    def __init__(self):
+        self.projects = {}
+        self.pending = OrderedDict()
+        self.building = None
+        self.cond = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='virtoweb-build', daemon=True)
+
+    def submit(self, request, subscriber):
+        """Queue a build for the request's project; returns the queued message."""
+        schema = os.path.abspath(request['schema'])
+        base = request.get('cwd') or os.getcwd()
+        out = request.get('out')
+        # without an explicit output dir the schema's outputDir applies, resolved
+        # against the client's working directory
+        key = (schema, request.get('backend'), os.path.join(base, out) if out else None, None if out else base)
+        incremental = request.get('incremental', True)
+        workers = int(request.get('workers') or 1)
+        with self.cond:
+            job = self.pending.get(key)
+            coalesced = job is not None
+            if coalesced:
+                job.merge(incremental, workers)
+            else:
+                job = self.pending[key] = BuildJob(key, incremental, workers)
+            job.subscribers.append(subscriber)
+            position = list(self.pending).index(key) + (self.building is not None)
+            self.cond.notify()
+        return {'type': 'queued', 'position': position, 'coalesced': coalesced}
+
+    def status(self):
+        with self.cond:
+            return {
+                'type': 'status',
+                'building': self.building[0] if self.building else None,
+                'pending': [key[0] for key in self.pending],
+                'projects': sorted(key[0] for key in self.projects),
+            }
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    for job in self.pending.values():
+                        job.send({'type': 'done', 'ok': False, 'error': 'daemon stopped'})
+                    return
+                key, job = self.pending.popitem(last=False)
+                self.building = key
+            try:
+                job.send(self.build(job))
+            finally:
+                with self.cond:
+                    self.building = None
+
+    def project(self, key):
+        from .watch import SiteWatcher
+
+        watcher = self.projects.get(key)
+        if watcher is None:
+            schema, backend, out, base = key
+            watcher = self.projects[key] = SiteWatcher(schema, backend, out, base_dir=base)
+        return watcher
+
+    def build(self, job):
+        start = time.perf_counter()
+        output = _JobOutput(job)
+        try:
+            with redirect_stdout(output):
+                watcher = self.project(job.key)
+                if not watcher.sync():
+                    raise RuntimeError('schema is invalid (see the log above)')
+                stats = watcher.build(incremental=job.incremental, workers=job.workers, atomic=True)
+        except Exception as e:
+            output.close()
+            log(f'{job.key[0]}: build failed: {e}')
+            return {'type': 'done', 'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        output.close()
+        seconds = time.perf_counter() - start
+        log(f'{job.key[0]}: {stats["rendered"]} pages rendered in {seconds * 1000:.1f} ms '
+            f'for {len(job.subscribers)} request(s)')
+        return {'type': 'done', 'ok': True, 'stats': stats, 'seconds': seconds, 'out': watcher.out}
+
+
+def _send(conn, message):
+    conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def handle(daemon, conn):
+    """Serve one client connection."""
+    with conn, conn.makefile('rb') as reader:
+        try:
+            request = json.loads(reader.readline(1 << 16) or b'{}')
+            op = request.get('op')
+            if op == 'status':
+                _send(conn, daemon.status())
+            elif op == 'stop':
+                _send(conn, {'type': 'stopping'})
+                daemon.stop()
+            elif op == 'build':
+                # the build thread never writes to sockets, so a slow client can't stall it
+                messages = queue.Queue()
+                _send(conn, daemon.submit(request, messages))
+                while True:
+                    message = messages.get()
+                    _send(conn, message)
+                    if message['type'] == 'done':
+                        break
+            else:
+                _send(conn, {'type': 'error', 'error': f'unknown op: {op!r}'})
+        except (ValueError, KeyError) as e:
+            _send(conn, {'type': 'error', 'error': f'bad request: {e}'})
+        except OSError:
+            # the client went away; a build it queued still runs for the others
+            pass
+
+
+def bind(path):
+    """Listen on `path`, replacing a stale socket left by a daemon that died."""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+        else:
+            raise RuntimeError(f'A build daemon is already listening on {path}')
+        finally:
+            probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    # builds write wherever the requests say: only this user may connect
+    os.chmod(path, 0o600)
+    server.listen(64)
+    return server
+
+
+def serve(path=None, preload=()):
+    """Run the daemon until it is stopped (op "stop" or Ctrl+C)."""
+    path = path or default_socket_path()
+    # pay the heavy imports (jinja2, jsonschema, the backends) before the first request
+    from . import watch  # noqa: F401
+
+    daemon = BuildDaemon()
+    daemon.thread.start()
+    server = bind(path)
+    server.settimeout(0.5)
+    log(f'listening on {path} (pid {os.getpid()})')
+    for schema in preload:
+        daemon.submit({'schema': schema}, queue.Queue())
+    try:
+        while daemon.running:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            threading.Thread(target=handle, args=(daemon, conn), daemon=True).start()
+    except KeyboardInterrupt:
+        daemon.stop()
+    finally:
+        server.close()
+        os.remove(path)
+        daemon.thread.join(timeout=60)
+        log('stopped')
+
+
+def request(message, path=None, on_message=None):
+    """Send one request to the daemon; return its final message.
+
+    `on_message` is called with every message the daemon streams back.
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(path or default_socket_path())
+    with conn, conn.makefile('rb') as reader:
+        _send(conn, message)
+        last = None
+        for line in reader:
+            last = json.loads(line)
+            if on_message is not None:
+                on_message(last)
+            if last['type'] != 'queued' and last['type'] != 'log':
+                break
+    if last is None:
+        raise RuntimeError('The build daemon closed the connection without replying')
+    return last
+
+
+def request_build(schema_path, backend_name=None, output_dir=None, incremental=True, workers=1,
+                  path=None, on_message=None):
+    """Ask the daemon to build a project; returns the `done` message."""
+    return request({
+        'op': 'build', 'schema': os.path.abspath(schema_path), 'backend': backend_name,
+        'out': os.path.abspath(output_dir) if output_dir else None, 'cwd': os.getcwd(),
+        'incremental': incremental, 'workers': workers,
+    }, path, on_message)
+
+
+def _print_message(message):
+    if message['type'] == 'log':
+        print(message['line'], flush=True)
+    elif message['type'] == 'queued':
+        where = 'joined the queued build' if message['coalesced'] else f'queued at position {message["position"]}'
+        print(f'Build request {where}', flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Warm VirtoWeb build daemon and its client.')
+    parser.add_argument('--socket', default=None, help='socket path (default: virtoweb-build.sock in $XDG_RUNTIME_DIR or the temp dir)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_cmd = commands.add_parser('serve', help='run the daemon in the foreground')
+    serve_cmd.add_argument('--preload', action='append', default=[], metavar='SCHEMA',
+                           help='build this project at start-up to warm it (repeatable)')
+    build_cmd = commands.add_parser('build', help='build a project through the daemon')
+    build_cmd.add_argument('schema')
+    build_cmd.add_argument('--backend', default=None)
+    build_cmd.add_argument('--out', default=None)
+    build_cmd.add_argument('--workers', type=int, default=1)
+    build_cmd.add_argument('--full', action='store_true', help='re-render every page instead of only changed ones')
+    commands.add_parser('status', help='show the projects the daemon keeps warm')
+    commands.add_parser('stop', help='stop the daemon after the running build')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.socket, [os.path.abspath(p) for p in args.preload])
+        return 0
+    try:
+        if args.command == 'build':
+            done = request_build(args.schema, args.backend, args.out, not args.full, args.workers,
+                                 args.socket, _print_message)
+        else:
+            done = request({'op': args.command}, args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print('No build daemon is running; start one with: python -m generators.core.daemon serve', file=sys.stderr)
+        return 2
+    if done['type'] == 'done':
+        if not done['ok']:
+            print('Build failed:', done['error'], file=sys.stderr)
+            return 1
+        stats = done['stats']
+        print(f'Built {done["out"]} in {done["seconds"] * 1000:.1f} ms: {stats["rendered"]} rendered, '
+              f'{stats["written"]} written, {stats["unchanged"]} unchanged, {stats["deleted"]} deleted')
+    elif done['type'] == 'error':
+        print('Error:', done['error'], file=sys.stderr)
+        return 1
+    else:
+        print(json.dumps(done, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,54 +2,116 @@
 Core multi-language generator for VirtoWeb.
 
 Responsibilities:
-- load and validate schema against JSON Schema
-- produce an intermediate AST
+- load and validate schema against JSON Schema (compiled once, see validator/schema_cache.py)
+- produce an intermediate AST of compact nodes (see nodes.py), cached by file hash (see ast_cache.py)
 - dispatch to language-specific backend generators
 
 This module is intentionally small and importable from CLI wrappers.
 """
 import json
 import os
-from jsonschema import validate as js_validate, ValidationError
+
+from ..backends.forms import check_forms
+from ..backends.profile import BuildProfile, phase, profiling
+from ..validator.schema_cache import PAGE_POINTER, format_errors, format_page_errors, get_validator, validate_schema
+from .ast_cache import ast_cache_key, read_ast_cache, write_ast_cache
+from .loader import SchemaStream
+from .nodes import NodeBuilder
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 SCHEMA_PATH = os.path.join(ROOT, 'generators', 'schema', 'v1', 'virtoweb.schema.json')
 
 
-def load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def validate_schema(schema_def, instance):
-    try:
-        js_validate(instance=instance, schema=schema_def)
-        return True, None
-    except ValidationError as e:
-        return False, e
-
-
-def build_ast(instance):
+def build_ast(instance, source_dir=None):
+    nodes = NodeBuilder()
     ast = {
         'project': instance.get('project', {}),
-        'layouts': {l['id']: l for l in instance.get('layouts', [])},
-        'components': {c['id']: c for c in instance.get('components', [])},
-        'pages': instance.get('pages', []),
+        'layouts': {l['id']: nodes.layout(l) for l in instance.get('layouts', [])},
+        'components': {c['id']: nodes.component(c) for c in instance.get('components', [])},
+        'pages': [nodes.page(p) for p in instance.get('pages', [])],
         'forms': {f['id']: f for f in instance.get('forms', [])},
-        'assets': instance.get('assets', [])
+        'assets': instance.get('assets', []),
+        # free-form generator.options (e.g. minify)
+        'options': instance.get('generator', {}).get('options', {}),
+        # directory that relative data sources (parameterized routes) resolve against
+        'source_dir': source_dir,
     }
     errors = []
     for p in ast['pages']:
-        if p['layout'] not in ast['layouts']:
-            errors.append(f"Page '{p.get('id')}' references unknown layout '{p.get('layout')}'")
-        for region, comps in (p.get('regions') or {}).items():
-            for ci in comps:
-                comp_id = ci.get('component')
-                if comp_id not in ast['components']:
-                    errors.append(f"Page '{p.get('id')}' region '{region}' references unknown component '{comp_id}'")
+        errors += check_page(ast, p)
     return ast, errors
 
 
+def check_page(ast, p):
+    """Cross-check a page's layout and component references against the AST."""
+    errors = []
+    if p['layout'] not in ast['layouts']:
+        errors.append(f"Page '{p.get('id')}' references unknown layout '{p.get('layout')}'")
+    for region, comps in (p.get('regions') or {}).items():
+        for ci in comps:
+            comp_id = ci.get('component')
+            if comp_id not in ast['components']:
+                errors.append(f"Page '{p.get('id')}' region '{region}' references unknown component '{comp_id}'")
+    return errors
+
+
+def iter_checked_pages(source, ast, errors):
+    """Yield pages from a SchemaStream, validating and cross-checking each one.
+
+    Invalid pages are not yielded; their errors are appended to `errors`.
+    """
+    page_errors = get_validator(SCHEMA_PATH, pointer=PAGE_POINTER)
+    for i, p in enumerate(source.iter_pages()):
+        found = page_errors(p)
+        if found:
+            errors.append(format_page_errors(i, p, found))
+            continue
+        cross = check_page(ast, p)
+        if cross:
+            errors.append('; '.join(cross))
+            continue
+        yield p
+
+
+def check_instance(instance, schema_path):
+    """Validate a parsed project file and build its AST; raises RuntimeError if invalid.
+
+    Returns `(ast, generator settings)`.
+    """
+    with phase('validate'):
+        ok, errors = validate_schema(instance, SCHEMA_PATH)
+    if not ok:
+        raise RuntimeError('Schema validation failed:\n' + format_errors(instance, errors))
+    with phase('build_ast'):
+        ast, cross_errors = build_ast(instance, os.path.dirname(os.path.abspath(schema_path)))
+    if cross_errors:
+        raise RuntimeError('Cross-check errors: ' + '; '.join(cross_errors))
+    return ast, instance.get('generator', {})
+
+
+def load_ast(schema_path, cache=True):
+    """Load, validate and build the AST of a project file; returns `(ast, generator settings)`.
+
+    With `cache=True` a project file whose bytes are unchanged since its last
+    successful load comes straight from the binary AST cache (see ast_cache.py),
+    skipping parsing and validation. Raises RuntimeError if the file is invalid.
+    """
+    key = None
+    with phase('load'):
+        with open(schema_path, 'rb') as f:
+            raw = f.read()
+        if cache:
+            key = ast_cache_key(raw, os.path.dirname(os.path.abspath(schema_path)), SCHEMA_PATH)
+            cached = read_ast_cache(key)
+            if cached is not None:
+                return cached
+        instance = json.loads(raw)
+    ast, settings = check_instance(instance, schema_path)
+    if key is not None:
+        write_ast_cache(key, ast, settings)
+    return ast, settings
+
+
 def get_backend(name):
     name = (name or '').lower()
     if name == 'static':
@@ -67,20 +129,95 @@ def get_backend(name):
     raise ValueError(f'Unknown backend: {name}')
 
 
-def generate(schema_path, backend_name=None, output_dir=None):
-    schema_def = load_json(SCHEMA_PATH)
-    instance = load_json(schema_path)
-
-    ok, err = validate_schema(schema_def, instance)
-    if not ok:
-        raise RuntimeError(f'Schema validation failed: {err}')
-
-    ast, cross_errors = build_ast(instance)
-    if cross_errors:
-        raise RuntimeError('Cross-check errors: ' + '; '.join(cross_errors))
-
-    backend_name = backend_name or instance.get('generator', {}).get('language', 'static')
-    output_dir = output_dir or instance.get('generator', {}).get('outputDir', 'dist/output')
-
-    backend = get_backend(backend_name)
-    backend.generate(ast, output_dir)
+def generate(schema_path, backend_name=None, output_dir=None, incremental=False, workers=1, stream=False, atomic=True,
+             profile=False, ast_cache=True, shard=None):
+    """Validate `schema_path` and generate a project with the selected backend.
+
+    Returns the output directory the project was written to (the schema's
+    `outputDir` unless `output_dir` is given).
+
+    With `incremental=True` the existing output directory is reused: only pages whose
+    inputs changed since the last build (per the build manifest) are re-rendered.
+    `workers` > 1 renders pages in parallel across that many processes.
+
+    With `stream=True` the schema file is memory-mapped and pages are validated and
+    rendered one at a time (see loader.SchemaStream), keeping memory flat for very
+    large page arrays. Invalid pages are skipped and reported once the build ends.
+
+    With `atomic=True` (the default) the build is written to a staged copy of the
+    output directory that replaces it in one rename when the build succeeds;
+    `atomic=False` writes into the output directory in place.
+
+    With `ast_cache=True` (the default) an unchanged project file is loaded from the
+    binary AST cache without being parsed or validated again (see load_ast).
+
+    With `shard` set to `"i/n"` (or `(i, n)`) only the pages of shard i of n are
+    rendered, so a site can be built on n machines and combined with
+    `merge_shards()` (see core/shard.py and backends/shards.py).
+
+    With `profile` set, wall time, CPU time and peak memory are recorded per phase,
+    along with render times per template and the slowest pages (see
+    backends/profile.py). A summary is printed and the JSON report is written to
+    `profile` when it is a path, else next to the output as `<output_dir>.profile.json`.
+    """
+    if profile:
+        build_profile = BuildProfile()
+        with profiling(build_profile):
+            output_dir = _generate(schema_path, backend_name, output_dir, incremental, workers, stream, atomic,
+                                   ast_cache, shard)
+        if not isinstance(profile, str):
+            profile = os.path.abspath(output_dir).rstrip(os.sep) + '.profile.json'
+        build_profile.write_json(profile)
+        print(build_profile.summary())
+        print('Profile written to', profile)
+        return output_dir
+    return _generate(schema_path, backend_name, output_dir, incremental, workers, stream, atomic, ast_cache, shard)
+
+
+def _generate(schema_path, backend_name, output_dir, incremental, workers, stream, atomic, ast_cache, shard=None):
+    if shard is not None:
+        from ..backends.shards import parse_shard
+        shard = parse_shard(shard)
+        if isinstance(backend_name, (list, tuple)):
+            raise ValueError('Sharded builds generate one backend at a time')
+    source = None
+    page_errors = []
+    try:
+        if stream:
+            with phase('load'):
+                source = SchemaStream(schema_path)
+            # pages are validated one by one as the backend consumes them
+            ast, settings = check_instance(dict(source.head, pages=[]), schema_path)
+            ast['pages'] = iter_checked_pages(source, ast, page_errors)
+        else:
+            ast, settings = load_ast(schema_path, ast_cache)
+
+        if shard is not None:
+            ast = dict(ast, shard=shard)
+        backend_name = backend_name or settings.get('language', 'static')
+        output_dir = output_dir or settings.get('outputDir', 'dist/output')
+
+        many = isinstance(backend_name, (list, tuple))
+        backends = {name: get_backend(name) for name in (backend_name if many else [backend_name])}
+        if any(b.FORM_HANDLERS for b in backends.values()):
+            # fail before rendering rather than when the handlers are written
+            form_errors, _ = check_forms(ast['forms'])
+            if form_errors:
+                raise RuntimeError('Form errors: ' + '; '.join(form_errors))
+
+        if many:
+            # render once, then link the public tree into every backend
+            from ..backends.staging import generate_many
+            with phase('backend (total)'):
+                generate_many(backends, ast, output_dir, incremental=incremental, workers=workers, atomic=atomic)
+        else:
+            backend = backends[backend_name]
+            with phase('backend (total)'):
+                backend.generate(ast, output_dir, incremental=incremental, workers=workers, atomic=atomic)
+    finally:
+        if source is not None:
+            source.close()
+
+    if page_errors:
+        raise RuntimeError('Invalid pages were skipped:\n' + '\n'.join(page_errors))
+    return output_dir
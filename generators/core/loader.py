@@ -0,0 +1,140 @@
+"""
+Schema file loading.
+
+`load_json` reads a whole project file. `SchemaStream` is the streaming
+alternative for very large project files: the file is memory-mapped, every
+top-level section except `pages` is parsed eagerly (they are small), and pages
+are decoded one at a time as `iter_pages()` is consumed. Only the current page is
+ever held as Python objects, so peak memory does not grow with the number of
+pages.
+"""
+import json
+import mmap
+import re
+
+_WS = re.compile(rb'[ \t\r\n]*')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+_STRUCT = re.compile(rb'["{}\[\]]')
+_SCALAR = re.compile(rb'[^,}\]\s]+')
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class SchemaStream:
+    """Memory-mapped project file with lazily decoded pages.
+
+    `head` holds every top-level section except `pages`; use `iter_pages()` to
+    stream the pages. Use as a context manager or call `close()` when done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file: mmap refuses zero-length maps
+            self._file.close()
+            raise ValueError(f'Empty schema file: {path}')
+        if hasattr(self._buf, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._buf.madvise(mmap.MADV_SEQUENTIAL)
+        self.head = {}
+        self._pages_span = None
+        self._index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._buf.close()
+        self._file.close()
+
+    def _skip_ws(self, pos):
+        return _WS.match(self._buf, pos).end()
+
+    def _expect(self, pos, char):
+        pos = self._skip_ws(pos)
+        if self._buf[pos:pos + 1] != char:
+            raise ValueError(f'{self.path}: expected {char.decode()!r} at byte {pos}')
+        return pos + 1
+
+    def _string_end(self, pos):
+        m = _STRING.match(self._buf, pos)
+        if not m:
+            raise ValueError(f'{self.path}: unterminated string at byte {pos}')
+        return m.end()
+
+    def _value_end(self, pos):
+        """Return the offset just past the JSON value starting at `pos`."""
+        buf = self._buf
+        c = buf[pos:pos + 1]
+        if c == b'"':
+            return self._string_end(pos)
+        if c not in (b'{', b'['):
+            m = _SCALAR.match(buf, pos)
+            if not m:
+                raise ValueError(f'{self.path}: unexpected input at byte {pos}')
+            return m.end()
+        depth = 0
+        while True:
+            m = _STRUCT.search(buf, pos)
+            if not m:
+                raise ValueError(f'{self.path}: unterminated value')
+            c = m.group()
+            if c == b'"':
+                pos = self._string_end(m.start())
+                continue
+            pos = m.end()
+            if c in (b'{', b'['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+    def _index(self):
+        buf = self._buf
+        pos = self._expect(0, b'{')
+        pos = self._skip_ws(pos)
+        if buf[pos:pos + 1] == b'}':
+            return
+        while True:
+            pos = self._skip_ws(pos)
+            key_end = self._string_end(pos)
+            key = json.loads(buf[pos:key_end])
+            pos = self._skip_ws(self._expect(key_end, b':'))
+            end = self._value_end(pos)
+            if key == 'pages':
+                self._pages_span = (pos, end)
+            else:
+                self.head[key] = json.loads(buf[pos:end])
+            pos = self._skip_ws(end)
+            c = buf[pos:pos + 1]
+            if c == b'}':
+                return
+            pos = self._expect(pos, b',')
+
+    def iter_pages(self):
+        """Yield page dicts one at a time, in file order."""
+        if self._pages_span is None:
+            return
+        buf = self._buf
+        start, _ = self._pages_span
+        if buf[start:start + 1] != b'[':
+            raise ValueError(f"{self.path}: 'pages' must be an array")
+        pos = self._skip_ws(start + 1)
+        if buf[pos:pos + 1] == b']':
+            return
+        while True:
+            value_end = self._value_end(pos)
+            yield json.loads(buf[pos:value_end])
+            pos = self._skip_ws(value_end)
+            if buf[pos:pos + 1] == b']':
+                return
+            pos = self._skip_ws(self._expect(pos, b','))
@@ -0,0 +1,139 @@
+"""
+Compact AST nodes.
+
+`build_ast` turns schema entries into slotted node types instead of keeping the
+parsed JSON dicts. A node stores only the fields the schema defines for its entry
+(the schema forbids additional properties), so it costs a fraction of a dict.
+Ids, template names, layout and component references and region names are
+interned, and identical component instance props share one dict. Nodes and
+props are read-only once built.
+
+Nodes are read-only mappings: `node.get('route')`, `node['layout']`,
+`'regions' in node`, `dict(node)` and Jinja's `page.title` all behave as they did
+on the dicts. A field that was absent in the schema is absent on the node too.
+"""
+import sys
+from collections.abc import Mapping
+
+_intern = sys.intern
+
+
+class Node(Mapping):
+    """Slotted read-only mapping over the fields listed in `FIELDS`."""
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, fields):
+        for key, value in fields.items():
+            object.__setattr__(self, key, value)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            return getattr(self, key, default)
+        return default
+
+    def __contains__(self, key):
+        return key in self.FIELDS and hasattr(self, key)
+
+    def __iter__(self):
+        return (name for name in self.FIELDS if hasattr(self, name))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} nodes are read-only')
+
+    def __reduce__(self):
+        # a flat tuple pickles smaller and loads faster than the default slot state
+        return _restore, (type(self), tuple(getattr(self, name, _UNSET) for name in self.FIELDS))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+
+class _Unset:
+    def __reduce__(self):
+        return '_UNSET'
+
+
+_UNSET = _Unset()
+
+
+def _restore(cls, values):
+    node = cls.__new__(cls)
+    for name, value in zip(cls.FIELDS, values):
+        if value is not _UNSET:
+            object.__setattr__(node, name, value)
+    return node
+
+
+class Layout(Node):
+    __slots__ = FIELDS = ('id', 'title', 'template', 'regions', 'props', 'default')
+
+
+class Component(Node):
+    __slots__ = FIELDS = ('id', 'type', 'template', 'props', 'children')
+
+
+class Instance(Node):
+    """A component instance in a page region."""
+
+    __slots__ = FIELDS = ('component', 'props')
+
+
+class Page(Node):
+    __slots__ = FIELDS = ('id', 'route', 'title', 'description', 'layout', 'meta', 'regions', 'data')
+
+
+class NodeBuilder:
+    """Build nodes for one AST, sharing interned strings and identical props."""
+
+    def __init__(self):
+        self.props = {}
+
+    def shared_props(self, props):
+        if not props:
+            return props
+        # for JSON values equal reprs mean equal dicts, and repr is much cheaper than dumps
+        return self.props.setdefault(repr(props), props)
+
+    def layout(self, data):
+        fields = dict(data)
+        fields['id'] = _intern(fields['id'])
+        fields['template'] = _intern(fields['template'])
+        if 'regions' in fields:
+            fields['regions'] = tuple(_intern(r) for r in fields['regions'])
+        return Layout(fields)
+
+    def component(self, data):
+        fields = dict(data)
+        fields['id'] = _intern(fields['id'])
+        if 'template' in fields:
+            fields['template'] = _intern(fields['template'])
+        return Component(fields)
+
+    def instance(self, data):
+        fields = {'component': _intern(data['component'])}
+        if 'props' in data:
+            fields['props'] = self.shared_props(data['props'])
+        return Instance(fields)
+
+    def page(self, data):
+        fields = dict(data)
+        fields['id'] = _intern(fields['id'])
+        fields['layout'] = _intern(fields['layout'])
+        regions = fields.get('regions')
+        if regions:
+            fields['regions'] = {_intern(name): tuple(self.instance(i) for i in instances)
+                                 for name, instances in regions.items()}
+        return Page(fields)
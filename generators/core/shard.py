@@ -0,0 +1,115 @@
+"""
+Sharded builds across machines.
+
+Each machine builds one shard of the site into its own directory, then one
+machine merges the shard directories into the final project (see
+backends/shards.py for how pages are split and what the merge checks):
+
+  machine k:  python -m generators.core.shard build site.json --shard k/4 --out shards/k
+  then:       python -m generators.core.shard merge site.json shards/1 shards/2 shards/3 shards/4 --out dist/site
+
+Shards must be built from the same project file and templates. `--incremental`
+rebuilds a shard directory like an incremental build. `local` runs all n shard
+builds as separate processes on this machine and merges them, which is how the
+split can be tried (and compared with an unsharded build) without a cluster.
+
+Usage:
+  python -m generators.core.shard build path/to/site_schema.json --shard 1/4 --out shards/1 [--backend static] [--workers 4] [--incremental]
+  python -m generators.core.shard merge path/to/site_schema.json SHARD_DIR... [--out dist/site] [--backend static]
+  python -m generators.core.shard local path/to/site_schema.json --shards 4 [--out dist/site] [--backend static] [--workers 1]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from .generator import ROOT, generate, get_backend, load_ast
+
+
+def merge(schema_path, shard_dirs, output_dir=None, backend_name=None, atomic=True, ast_cache=True):
+    """Merge shard builds of `schema_path` into one project; returns the merge counts."""
+    from ..backends.shards import merge_shards
+
+    ast, settings = load_ast(schema_path, ast_cache)
+    backend = get_backend(backend_name or settings.get('language', 'static'))
+    output_dir = output_dir or settings.get('outputDir', 'dist/output')
+    return merge_shards(ast, backend, shard_dirs, output_dir, atomic=atomic)
+
+
+def shard_dirs_for(output_dir, count):
+    return [os.path.join(f'{os.path.abspath(output_dir)}.shards', str(i)) for i in range(1, count + 1)]
+
+
+def build_local(schema_path, count, output_dir=None, backend_name=None, workers=1, incremental=False):
+    """Build `count` shards as parallel processes next to output_dir, then merge them."""
+    if output_dir is None:
+        _, settings = load_ast(schema_path)
+        output_dir = settings.get('outputDir', 'dist/output')
+    dirs = shard_dirs_for(output_dir, count)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    procs = []
+    for i, shard_dir in enumerate(dirs, 1):
+        cmd = [sys.executable, '-m', 'generators.core.shard', 'build', os.path.abspath(schema_path),
+               '--shard', f'{i}/{count}', '--out', shard_dir, '--workers', str(workers)]
+        if backend_name:
+            cmd += ['--backend', backend_name]
+        if incremental:
+            cmd.append('--incremental')
+        procs.append(subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True))
+    failed = []
+    for i, proc in enumerate(procs, 1):
+        output, _ = proc.communicate()
+        for line in output.splitlines():
+            print(f'[shard {i}/{count}] {line}')
+        if proc.returncode:
+            failed.append(i)
+    if failed:
+        raise RuntimeError(f'Shard build(s) failed: {", ".join(map(str, failed))}')
+    print(f'Built {count} shards in {(time.perf_counter() - start) * 1000:.1f} ms')
+    return merge(schema_path, dirs, output_dir, backend_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a VirtoWeb site in shards and merge them.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_cmd = commands.add_parser('build', help='build one shard')
+    build_cmd.add_argument('schema')
+    build_cmd.add_argument('--shard', required=True, help='i/n: build shard i of n (numbered from 1)')
+    build_cmd.add_argument('--out', required=True, help='directory for this shard')
+    build_cmd.add_argument('--backend', default=None)
+    build_cmd.add_argument('--workers', type=int, default=1)
+    build_cmd.add_argument('--incremental', action='store_true', help='only re-render changed pages of the shard')
+    merge_cmd = commands.add_parser('merge', help='merge shard directories into the final project')
+    merge_cmd.add_argument('schema')
+    merge_cmd.add_argument('shards', nargs='+', metavar='SHARD_DIR')
+    merge_cmd.add_argument('--out', default=None)
+    merge_cmd.add_argument('--backend', default=None)
+    local_cmd = commands.add_parser('local', help='build every shard as a local process, then merge')
+    local_cmd.add_argument('schema')
+    local_cmd.add_argument('--shards', type=int, required=True)
+    local_cmd.add_argument('--out', default=None, help='merged output (shards go to <out>.shards/<i>)')
+    local_cmd.add_argument('--backend', default=None)
+    local_cmd.add_argument('--workers', type=int, default=1, help='render workers per shard')
+    local_cmd.add_argument('--incremental', action='store_true')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'build':
+            generate(args.schema, args.backend, args.out, incremental=args.incremental, workers=args.workers,
+                     shard=args.shard)
+        elif args.command == 'merge':
+            merge(args.schema, args.shards, args.out, args.backend)
+        else:
+            if args.shards < 1:
+                parser.error('--shards must be at least 1')
+            build_local(args.schema, args.shards, args.out, args.backend, args.workers, args.incremental)
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
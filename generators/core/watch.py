@@ -0,0 +1,254 @@
+"""
+Watch mode: rebuild a site as its schema or templates change.
+
+The AST, the Jinja environment (with its resolved templates) and the compiled
+validator stay warm between rebuilds. Reverse indexes map every template file
+(including templates pulled in through `{% include %}`/`{% extends %}`) and every
+component id to the pages that use it, so editing `components/hero.html.j2`, or
+only the `hero` entry of the schema's components, re-renders just the pages
+containing `hero`. Other schema edits fall back to the hash-based incremental
+build, which also only re-renders pages whose inputs changed.
+
+Changes are detected by polling modification times.
+
+Usage:
+  python -m generators.core.watch path/to/site_schema.json [--backend static] [--out dist/site] [--interval 0.5]
+"""
+import argparse
+import os
+import time
+from collections import defaultdict
+
+from ..backends.assets import AssetUrls, load_asset_manifest
+from ..backends.common import SiteRenderer, page_input_hash, page_output_file, page_templates, render_static_site
+from ..backends.compress import compress_outputs, variant_paths
+from ..backends.manifest import TemplateHasher, load_manifest, remove_stale_outputs, save_manifest
+from ..backends.publish import publish_dir
+from ..backends.routes import iter_pages
+from ..backends.search import SEARCH_STATE, build_search_index, search_settings
+from ..backends.templates import TemplateTable, make_environment
+from .generator import ROOT, get_backend, load_ast
+
+TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
+
+
+def scan_mtimes(root):
+    mtimes = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+    return mtimes
+
+
+class SiteWatcher:
+    """Keep one site's build state warm and apply minimal rebuilds."""
+
+    def __init__(self, schema_path, backend_name=None, output_dir=None, template_dir=TEMPLATE_DIR, base_dir=None):
+        self.schema_path = os.path.abspath(schema_path)
+        self.template_dir = template_dir
+        self.backend_name = backend_name
+        self.output_dir = output_dir
+        # relative output dirs resolve against this (default: the working directory)
+        self.base_dir = base_dir
+        self.templates = TemplateTable(make_environment(template_dir))
+        self.ast = None
+        self.renderer = None
+        self.schema_mtime = None
+        self.template_mtimes = scan_mtimes(template_dir)
+
+    def load(self):
+        """(Re)load and validate the schema; return False if it is invalid."""
+        self.schema_mtime = os.stat(self.schema_path).st_mtime_ns
+        try:
+            ast, generator_opts = load_ast(self.schema_path)
+        except ValueError as e:
+            print('[watch] schema is not valid JSON:', e)
+            return False
+        except RuntimeError as e:
+            print('[watch]', e)
+            return False
+
+        self.backend = get_backend(self.backend_name or generator_opts.get('language', 'static'))
+        out = self.output_dir or generator_opts.get('outputDir', 'dist/output')
+        self.out = os.path.abspath(os.path.join(self.base_dir or os.getcwd(), out))
+        self.public = os.path.join(self.out, self.backend.PUBLIC)
+        self.ast = ast
+        self.renderer = SiteRenderer(ast, self.templates)
+        self.build_index()
+        return True
+
+    def build_index(self):
+        """Map template names and component ids to the output paths of pages using them."""
+        self.pages = {}
+        self.by_template = defaultdict(set)
+        self.by_component = defaultdict(set)
+        closures = {}
+        for p in iter_pages(self.ast.get('pages', []), self.ast.get('source_dir')):
+            rel = page_output_file(p.get('route', '/'))
+            self.pages[rel] = p
+            for name in page_templates(self.ast, p):
+                if name not in closures:
+                    closures[name] = self.templates.closure(name)
+                for dep in closures[name]:
+                    self.by_template[dep].add(rel)
+            for comps in (p.get('regions') or {}).values():
+                for inst in comps:
+                    self.by_component[inst.get('component')].add(rel)
+
+    def components_changed(self, old):
+        """Pages to re-render if `old` differs from the current AST only in component entries, else None."""
+        if old is None or any(old.get(k) != v for k, v in self.ast.items() if k != 'components'):
+            return None
+        before, after = old['components'], self.ast['components']
+        rels = set()
+        for comp_id in before.keys() | after.keys():
+            if before.get(comp_id) != after.get(comp_id):
+                rels |= self.by_component.get(comp_id, set())
+        return rels
+
+    def build(self, incremental=True, workers=1, atomic=False):
+        """Build the whole site with the warm templates; returns its counts.
+
+        Watch mode writes in place; `atomic=True` publishes through a staged copy
+        like `generate()` does (the build daemon uses this).
+        """
+        with publish_dir(self.out, atomic, keep=self.backend.KEEP) as stage:
+            stats = render_static_site(self.ast, self.template_dir, os.path.join(stage, self.backend.PUBLIC),
+                                       incremental=incremental, workers=workers, templates=self.templates)
+            self.backend.scaffold(self.ast, stage)
+        self.use_published_assets()
+        return stats
+
+    def use_published_assets(self):
+        # later page re-renders must point at the assets the last build fingerprinted
+        manifest = load_asset_manifest(self.public) or {}
+        self.renderer.assets = AssetUrls(manifest.get('assets', {}))
+
+    def rebuild_pages(self, rels):
+        """Re-render the given pages and refresh their manifest entries."""
+        manifest = load_manifest(self.public) or {'pages': {}}
+        hasher = TemplateHasher(self.templates.env)
+        for rel in rels:
+            p = self.pages[rel]
+            self.renderer.write_page(p, os.path.join(self.public, rel))
+            manifest['pages'][rel] = page_input_hash(self.ast, p, hasher, self.renderer.assets.urls)
+        save_manifest(self.public, manifest['pages'])
+        compress_outputs(self.public, rels)
+        if self.renderer.search is not None:
+            # re-rendered pages may have new text; the other pages' terms are stored
+            search = build_search_index(self.public, self.renderer.search.drain(), manifest['pages'],
+                                        search_settings(self.ast.get('options')), incremental=True)
+            compress_outputs(self.public, search['files'] - {SEARCH_STATE})
+            remove_stale_outputs(self.public, search['stale'] | variant_paths(search['stale']), search['files'])
+        # scaffolds may index public/ (e.g. the PHP route map with its ETags)
+        self.backend.scaffold(self.ast, self.out)
+
+    def invalidate(self, paths):
+        """Drop the memoized templates (and rendered fragments) for changed template files."""
+        names = {os.path.relpath(path, self.template_dir).replace(os.sep, '/') for path in paths}
+        self.templates.invalidate(names)
+        if self.renderer is not None:
+            # fragments may embed any changed include; they refill on the next render
+            self.renderer.fragments.clear()
+        return names
+
+    def templates_changed(self, paths):
+        names = self.invalidate(paths)
+        if any(name.startswith('assets/') for name in names):
+            # a new fingerprint changes the asset map every page hash includes,
+            # so the hash-based build re-renders the pages
+            return self.build()['rendered']
+        rels = set()
+        for name in names:
+            rels |= self.by_template.get(name, set())
+        self.rebuild_pages(sorted(rels))
+        return len(rels)
+
+    def scan_templates(self):
+        """Return the template files added, changed or removed since the last scan."""
+        template_mtimes = scan_mtimes(self.template_dir)
+        changed = {p for p, m in template_mtimes.items() if self.template_mtimes.get(p) != m}
+        changed |= set(self.template_mtimes) - set(template_mtimes)
+        self.template_mtimes = template_mtimes
+        return changed
+
+    def sync(self):
+        """Pick up schema and template edits made since the last build.
+
+        Returns False when the schema can't be loaded.
+        """
+        self.invalidate(self.scan_templates())
+        if self.ast is None or os.stat(self.schema_path).st_mtime_ns != self.schema_mtime:
+            if not self.load():
+                # don't build the previous AST as if it were current
+                self.ast = None
+                return False
+        return True
+
+    def poll(self):
+        """Check for changes once and rebuild what is affected."""
+        try:
+            schema_mtime = os.stat(self.schema_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        changed = self.scan_templates()
+
+        if schema_mtime != self.schema_mtime:
+            start = time.perf_counter()
+            # invalidate first: the scan has consumed these edits even if the schema doesn't load
+            self.invalidate(changed)
+            old = self.ast
+            if self.load():
+                rels = None if changed else self.components_changed(old)
+                if rels is not None:
+                    self.use_published_assets()
+                    self.rebuild_pages(sorted(rels))
+                    print(f'[watch] components changed: {len(rels)} pages re-rendered in '
+                          f'{(time.perf_counter() - start) * 1000:.1f} ms')
+                else:
+                    # template edits are picked up too: the build re-hashes every page
+                    self.build()
+                    print(f'[watch] schema changed: rebuilt in {(time.perf_counter() - start) * 1000:.1f} ms')
+            else:
+                # don't re-render pages from the previous AST as if it were current
+                self.ast = None
+        elif changed and self.ast is not None:
+            start = time.perf_counter()
+            count = self.templates_changed(changed)
+            names = ', '.join(sorted(os.path.relpath(p, self.template_dir) for p in changed))
+            print(f'[watch] {names} changed: {count} pages re-rendered in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    def run(self, interval=0.5):
+        if self.load():
+            start = time.perf_counter()
+            self.build()
+            print(f'[watch] initial build in {(time.perf_counter() - start) * 1000:.1f} ms')
+        print(f'[watch] watching {self.schema_path} and {self.template_dir} (Ctrl+C to stop)')
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        except KeyboardInterrupt:
+            print('[watch] stopped')
+
+
+def watch(schema_path, backend_name=None, output_dir=None, interval=0.5):
+    SiteWatcher(schema_path, backend_name, output_dir).run(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild a VirtoWeb site as its schema and templates change.')
+    parser.add_argument('schema')
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--interval', type=float, default=0.5)
+    args = parser.parse_args(argv)
+    watch(args.schema, args.backend, args.out, args.interval)
+
+
+if __name__ == '__main__':
+    main()
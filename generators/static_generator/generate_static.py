@@ -6,48 +6,46 @@ Minimal static site generator for VirtoWeb example schemas.
 Usage:
   python generate_static.py path/to/site_schema.json
 
+Parameterized routes (e.g. /products/{slug}) are expanded from the page's `data`
+(inline records or a JSONL/CSV source, see generators/backends/routes.py).
+
 Limitations:
-- Only supports static, non-parameterized routes (no {slug} expansion)
 - Assumes templates follow the naming convention: <template>.html.j2
 """
-import json
 import os
 import sys
 import shutil
-from jsonschema import validate, ValidationError
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.backends.assets import build_assets  # noqa: E402
+from generators.backends.common import page_output_file  # noqa: E402
+from generators.backends.minify import minify_html, minify_settings  # noqa: E402
+from generators.backends.routes import iter_pages  # noqa: E402
+from generators.backends.stream import ChunkWriter, LazyRegion, stream_layout, stream_settings  # noqa: E402
+from generators.backends.templates import TemplateTable, make_environment  # noqa: E402
+from generators.core.loader import load_json  # noqa: E402
+from generators.validator.schema_cache import validate_schema, format_errors  # noqa: E402
+
 SCHEMA_PATH = os.path.join(ROOT, 'generators', 'schema', 'v1', 'virtoweb.schema.json')
 TEMPLATE_DIR = os.path.join(ROOT, 'generators', 'templates', 'static')
 
 
-def load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def validate_schema(schema_def, instance):
-    try:
-        validate(instance=instance, schema=schema_def)
-        return True, None
-    except ValidationError as e:
-        return False, e
-
-
 def template_name_to_file(tname):
     # convert 'layouts/main' -> 'layouts/main.html.j2'
     return tname + '.html.j2'
 
 
-def render_component(env, components_map, instance):
+def render_component(templates, components_map, instance):
     comp_id = instance.get('component')
     comp_def = components_map.get(comp_id)
     if not comp_def:
         return f"<!-- Missing component: {comp_id} -->"
     tmpl_name = template_name_to_file(comp_def.get('template'))
     try:
-        tmpl = env.get_template(tmpl_name)
+        tmpl = templates.get(tmpl_name)
     except Exception as e:
         return f"<!-- Template load error for {tmpl_name}: {e} -->"
     # merge props
@@ -66,23 +64,20 @@ if __name__ == '__main__':
     if not os.path.isabs(site_path):
         site_path = os.path.abspath(site_path)
 
-    schema_def = load_json(SCHEMA_PATH)
     instance = load_json(site_path)
 
-    ok, err = validate_schema(schema_def, instance)
+    ok, errors = validate_schema(instance, SCHEMA_PATH)
     if not ok:
-        print('Schema validation FAILED:')
-        print(err)
+        print(f'Schema validation FAILED ({len(errors)} errors):')
+        print(format_errors(instance, errors))
         sys.exit(3)
 
     project = instance.get('project', {})
     generator_opts = instance.get('generator', {})
     output_dir = os.path.abspath(generator_opts.get('outputDir', 'dist/static-output'))
 
-    env = Environment(
-        loader=FileSystemLoader(TEMPLATE_DIR),
-        autoescape=select_autoescape(['html', 'xml'])
-    )
+    # shared environment: compiled templates come from the on-disk bytecode cache
+    templates = TemplateTable(make_environment(TEMPLATE_DIR))
 
     layouts = {l['id']: l for l in instance.get('layouts', [])}
     components_map = {c['id']: c for c in instance.get('components', [])}
@@ -92,29 +87,29 @@ if __name__ == '__main__':
         shutil.rmtree(output_dir)
     os.makedirs(output_dir, exist_ok=True)
 
-    # Copy any assets
-    for asset in instance.get('assets', []):
-        src = os.path.join(ROOT, asset['src']) if not os.path.isabs(asset['src']) else asset['src']
-        dest_path = os.path.join(output_dir, asset['dest'])
-        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-        try:
-            shutil.copy2(src, dest_path)
-            print(f'Copied asset {src} -> {dest_path}')
-        except Exception as e:
-            print(f'Warning: failed to copy asset {src}: {e}')
+    # generator.options.minify: minify pages and stylesheets as they are written
+    minify_pages, minify_css = minify_settings(generator_opts.get('options'))
+    # generator.options.streamPages: write pages in bounded chunks as they render
+    stream_buffer = stream_settings(generator_opts.get('options'))
+
+    # Copy assets under content-hashed names (template assets/ and the schema's assets)
+    assets, asset_stats = build_assets(TEMPLATE_DIR, instance, output_dir, minify_css=minify_css)
+    for logical, url in sorted(assets.urls.items()):
+        print(f'Copied asset {logical} -> {url}')
+
+    def transform(html):
+        html = assets.rewrite(html)
+        if minify_pages:
+            html = minify_html(html, css=minify_css)
+        return html
 
     # Render pages
-    for p in instance.get('pages', []):
+    # parameterized routes expand lazily from each page's data
+    for p in iter_pages(instance.get('pages', []), os.path.dirname(site_path)):
         page = p
         route = p.get('route', '/')
-        if '{' in route and '}' in route:
-            print(f"Skipping parameterized route {route} (not supported by minimal static generator)")
-            continue
         # output path
-        if route == '/' or route == '':
-            out_dir = output_dir
-        else:
-            out_dir = os.path.join(output_dir, route.lstrip('/'))
+        out_dir = os.path.dirname(os.path.join(output_dir, page_output_file(route)))
         os.makedirs(out_dir, exist_ok=True)
         layout_id = p.get('layout')
         layout = layouts.get(layout_id)
@@ -123,24 +118,38 @@ if __name__ == '__main__':
             continue
         layout_tmpl = template_name_to_file(layout.get('template'))
         try:
-            tmpl = env.get_template(layout_tmpl)
+            tmpl = templates.get(layout_tmpl)
         except Exception as e:
             print(f"Error loading layout template {layout_tmpl} for page {p.get('id')}: {e}")
             continue
+        out_file = os.path.join(out_dir, 'index.html')
+        if stream_buffer:
+            regions = {}
+            for region_name in layout.get('regions', []):
+                regions[region_name] = LazyRegion(region_name, (p.get('regions') or {}).get(region_name, []),
+                                                  lambda inst: render_component(templates, components_map, inst))
+            writer = ChunkWriter(out_file, stream_buffer, transform)
+            try:
+                stream_layout(tmpl, {'project': project, 'page': p}, regions, writer)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.close()
+            print('Wrote', out_file)
+            continue
         # render regions
         rendered_regions = {}
         for region_name in layout.get('regions', []):
             rendered_parts = []
             for inst in (p.get('regions') or {}).get(region_name, []):
-                rendered_parts.append(render_component(env, components_map, inst))
+                rendered_parts.append(render_component(templates, components_map, inst))
             rendered_regions[region_name] = '\n'.join(rendered_parts)
         ctx = {
             'project': project,
             'page': p,
             'regions': rendered_regions
         }
-        out_html = tmpl.render(**ctx)
-        out_file = os.path.join(out_dir, 'index.html')
+        out_html = transform(tmpl.render(**ctx))
         with open(out_file, 'w', encoding='utf-8') as f:
             f.write(out_html)
         print('Wrote', out_file)
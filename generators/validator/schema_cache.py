@@ -0,0 +1,393 @@
+"""
+Shared, cached schema validation for VirtoWeb schema v1.
+
+The project schema is compiled once per schema file hash:
+
+- by default it is translated into a specialised Python module (a plain function
+  per sub-schema) that is written to the VirtoWeb cache and imported on later runs,
+  so `jsonschema` is never imported on the hot path;
+- if the schema uses a keyword the translator doesn't know, or `specialized=False`
+  is requested, a `jsonschema` Draft-07 validator is built instead (the meta-schema
+  is checked once per process).
+
+Both paths report every error in one pass rather than stopping at the first one.
+Errors are `(path, message)` tuples where `path` is a tuple of keys/indexes into
+the instance, e.g. `('pages', 3, 'route')`.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SCHEMA_PATH = os.path.join(ROOT, 'generators', 'schema', 'v1', 'virtoweb.schema.json')
+DEFAULT_CACHE_DIR = os.path.join(ROOT, '.virtoweb-cache')
+# bump when the generated validator code changes shape
+COMPILER_VERSION = 2
+# sub-schema of a single entry of `pages`
+PAGE_POINTER = '/properties/pages/items'
+
+_validators = {}
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+# keywords that carry no validation semantics
+_ANNOTATIONS = {'$schema', '$id', 'title', 'description', 'default', 'examples', '$comment', 'definitions'}
+
+_TYPE_CHECKS = {
+    'object': 'isinstance({v}, dict)',
+    'array': 'isinstance({v}, list)',
+    'string': 'isinstance({v}, str)',
+    'boolean': 'isinstance({v}, bool)',
+    'null': '{v} is None',
+    'number': '(isinstance({v}, (int, float)) and not isinstance({v}, bool))',
+    'integer': '((isinstance({v}, int) and not isinstance({v}, bool)) or (isinstance({v}, float) and {v}.is_integer()))',
+}
+
+
+class _Compiler:
+    """Translate a draft-07 schema into Python source, one function per sub-schema."""
+
+    SUPPORTED = _ANNOTATIONS | {
+        'type', 'required', 'properties', 'additionalProperties', 'patternProperties',
+        'enum', 'const', 'items', 'pattern', '$ref', 'minItems', 'maxItems',
+        'minLength', 'maxLength', 'minimum', 'maximum',
+    }
+
+    def __init__(self, root):
+        self.root = root
+        self.funcs = {}  # JSON pointer -> function name
+        self.chunks = []
+        self.consts = []
+        self.pending = []
+
+    def const(self, value):
+        name = f'_C{len(self.consts)}'
+        self.consts.append(f'{name} = {value}')
+        return name
+
+    def resolve(self, ref):
+        if not ref.startswith('#'):
+            raise UnsupportedSchema(f'non-local $ref {ref}')
+        node = self.root
+        pointer = ref[1:]
+        for part in [p for p in pointer.split('/') if p]:
+            part = part.replace('~1', '/').replace('~0', '~')
+            node = node[int(part)] if isinstance(node, list) else node[part]
+        return pointer, node
+
+    def func_for(self, schema, pointer):
+        if pointer in self.funcs:
+            return self.funcs[pointer]
+        name = f'_v{len(self.funcs)}'
+        self.funcs[pointer] = name
+        self.pending.append((name, schema, pointer))
+        return name
+
+    def compile(self):
+        self.func_for(self.root, '')
+        while self.pending:
+            name, schema, pointer = self.pending.pop()
+            self.chunks.append(self.compile_schema(name, schema, pointer))
+        lines = [
+            '# Generated by generators/validator/schema_cache.py. Do not edit.',
+            'import re',
+            '',
+        ]
+        lines += self.chunks
+        # constants may reference validator functions, so they come after them
+        lines += self.consts
+        lines += ['', '_ENTRY = {' + ', '.join(f'{p!r}: {n}' for p, n in sorted(self.funcs.items())) + '}',
+                  '', '',
+                  "def iter_errors(instance, pointer=''):",
+                  '    errors = []',
+                  '    _ENTRY[pointer](instance, (), errors)',
+                  '    return errors', '']
+        return '\n'.join(lines)
+
+    def compile_schema(self, name, schema, pointer):
+        if schema is True or schema == {}:
+            return f'def {name}(x, path, errors):\n    return\n'
+        if schema is False:
+            return f"def {name}(x, path, errors):\n    errors.append((path, 'False schema does not allow %r' % (x,)))\n"
+        unknown = set(schema) - self.SUPPORTED
+        if unknown:
+            raise UnsupportedSchema(f'unsupported keywords at {pointer or "/"}: {sorted(unknown)}')
+
+        body = []
+        if '$ref' in schema:
+            # draft-07: siblings of $ref are ignored
+            ref_pointer, target = self.resolve(schema['$ref'])
+            body.append(f'{self.func_for(target, ref_pointer)}(x, path, errors)')
+            return self.emit(name, body)
+
+        # enum/const are reported alongside a type error, as jsonschema does
+        if 'enum' in schema:
+            c = self.const(repr(schema['enum']))
+            body += [f'if x not in {c}:',
+                     f"    errors.append((path, '%r is not one of %r' % (x, {c})))"]
+        if 'const' in schema:
+            c = self.const(repr(schema['const']))
+            body += [f'if x != {c}:',
+                     f"    errors.append((path, '%r was expected' % ({c},)))"]
+        types = schema.get('type')
+        if types is not None:
+            types = [types] if isinstance(types, str) else list(types)
+            if set(types) - set(_TYPE_CHECKS):
+                raise UnsupportedSchema(f'unknown type at {pointer or "/"}: {types}')
+            check = ' or '.join(_TYPE_CHECKS[t].format(v='x') for t in types)
+            label = ', '.join(repr(t) for t in types)
+            message = repr('%r is not of type ' + label)
+            body += [f'if not ({check}):',
+                     f'    errors.append((path, {message} % (x,)))',
+                     '    return']
+
+        sections = [
+            ('object', self.compile_object(schema, pointer)),
+            ('array', self.compile_array(schema, pointer)),
+            ('string', self.compile_string(schema)),
+            ('number', self.compile_number(schema)),
+        ]
+        for kind, lines in sections:
+            if not lines:
+                continue
+            if types == [kind]:
+                # the type check above already returned for anything else
+                body += lines
+            else:
+                body += [f'if {_TYPE_CHECKS[kind].format(v="x")}:'] + ['    ' + line for line in lines]
+        return self.emit(name, body)
+
+    def emit(self, name, body):
+        if not body:
+            body = ['return']
+        return '\n'.join([f'def {name}(x, path, errors):'] + ['    ' + line for line in body]) + '\n'
+
+    def compile_object(self, schema, pointer):
+        out = []
+        for key in schema.get('required', []):
+            out += [f'if {key!r} not in x:',
+                    f"    errors.append((path, {repr(repr(key) + ' is a required property')}))"]
+        props = schema.get('properties', {})
+        patterns = schema.get('patternProperties', {})
+        additional = schema.get('additionalProperties', True)
+        if not props and not patterns and additional is True:
+            return out
+
+        table = {k: self.func_for(s, f'{pointer}/properties/{k}') for k, s in props.items()}
+        ptable = self.const('{' + ', '.join(f'{k!r}: {v}' for k, v in table.items()) + '}') if table else None
+        pattern_funcs = [(self.const(f're.compile({pat!r})'), self.func_for(s, f'{pointer}/patternProperties/{pat}'))
+                         for pat, s in patterns.items()]
+        if isinstance(additional, dict):
+            additional_func = self.func_for(additional, f'{pointer}/additionalProperties')
+        else:
+            additional_func = None
+
+        if additional is False:
+            out.append('extra = []')
+        out.append('for k, v in x.items():')
+        loop = []
+        if ptable:
+            loop += [f'f = {ptable}.get(k)',
+                     'if f is not None:',
+                     '    f(v, path + (k,), errors)']
+        if pattern_funcs:
+            loop.append('matched = False')
+            for rx, fn in pattern_funcs:
+                loop += [f'if {rx}.search(k):', f'    {fn}(v, path + (k,), errors)', '    matched = True']
+            unknown = 'f is None and not matched' if ptable else 'not matched'
+        else:
+            unknown = 'f is None' if ptable else 'True'
+        if additional is False:
+            loop += [f'if {unknown}:', '    extra.append(k)']
+        elif additional_func:
+            loop += [f'if {unknown}:', f'    {additional_func}(v, path + (k,), errors)']
+        if not loop:
+            loop = ['pass']
+        out += ['    ' + line for line in loop]
+        if additional is False:
+            out += ['if extra:',
+                    "    errors.append((path, 'Additional properties are not allowed (%s %s unexpected)'"
+                    " % (', '.join(repr(k) for k in extra), 'was' if len(extra) == 1 else 'were')))"]
+        return out
+
+    def compile_array(self, schema, pointer):
+        out = []
+        if 'minItems' in schema:
+            out += [f'if len(x) < {schema["minItems"]}:',
+                    f"    errors.append((path, '%r is too short' % (x,)))"]
+        if 'maxItems' in schema:
+            out += [f'if len(x) > {schema["maxItems"]}:',
+                    f"    errors.append((path, '%r is too long' % (x,)))"]
+        items = schema.get('items')
+        if isinstance(items, list):
+            raise UnsupportedSchema(f'tuple items at {pointer or "/"}')
+        if items is not None and items is not True and items != {}:
+            fn = self.func_for(items, f'{pointer}/items')
+            out += ['for i, v in enumerate(x):', f'    {fn}(v, path + (i,), errors)']
+        return out
+
+    def compile_string(self, schema):
+        out = []
+        if 'pattern' in schema:
+            rx = self.const(f're.compile({schema["pattern"]!r})')
+            out += [f'if not {rx}.search(x):',
+                    f"    errors.append((path, '%r does not match %r' % (x, {schema['pattern']!r})))"]
+        if 'minLength' in schema:
+            out += [f'if len(x) < {schema["minLength"]}:',
+                    f"    errors.append((path, '%r is too short' % (x,)))"]
+        if 'maxLength' in schema:
+            out += [f'if len(x) > {schema["maxLength"]}:',
+                    f"    errors.append((path, '%r is too long' % (x,)))"]
+        return out
+
+    def compile_number(self, schema):
+        out = []
+        if 'minimum' in schema:
+            out += [f'if x < {schema["minimum"]!r}:',
+                    f"    errors.append((path, '%r is less than the minimum of {schema['minimum']!r}' % (x,)))"]
+        if 'maximum' in schema:
+            out += [f'if x > {schema["maximum"]!r}:',
+                    f"    errors.append((path, '%r is greater than the maximum of {schema['maximum']!r}' % (x,)))"]
+        return out
+
+
+def generate_validator_source(schema):
+    """Return Python source for a module exposing `iter_errors(instance, pointer='')`.
+
+    `pointer` is a JSON pointer (e.g. `/properties/pages/items`) selecting the
+    sub-schema to validate against; every sub-schema gets an entry.
+    """
+    return _Compiler(schema).compile()
+
+
+def cache_root():
+    """The VirtoWeb cache directory (`VIRTOWEB_CACHE_DIR`; empty disables caching)."""
+    return os.environ.get('VIRTOWEB_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+
+def _load_specialized(schema, digest):
+    source = None
+    path = None
+    root = cache_root()
+    if root:
+        path = os.path.join(root, 'validators', f'schema_{digest[:16]}_c{COMPILER_VERSION}.py')
+        if not os.path.exists(path):
+            source = generate_validator_source(schema)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(source)
+                os.replace(tmp, path)
+            except OSError:
+                path = None
+    if path:
+        spec = importlib.util.spec_from_file_location(f'_virtoweb_schema_{digest[:16]}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.iter_errors
+    # no usable cache directory: compile in memory
+    namespace = {}
+    exec(compile(source or generate_validator_source(schema), '<virtoweb-schema>', 'exec'), namespace)
+    return namespace['iter_errors']
+
+
+def _load_jsonschema(schema):
+    from jsonschema import Draft7Validator
+
+    Draft7Validator.check_schema(schema)
+    root = Draft7Validator(schema)
+    validators = {'': root}
+
+    def iter_errors(instance, pointer=''):
+        validator = validators.get(pointer)
+        if validator is None:
+            # evolve() keeps the root resolver so local $refs still resolve
+            _, sub = _Compiler(schema).resolve('#' + pointer)
+            validator = validators[pointer] = root.evolve(schema=sub)
+        return [(tuple(e.absolute_path), e.message) for e in validator.iter_errors(instance)]
+    return iter_errors
+
+
+def _load(schema_path, specialized):
+    with open(schema_path, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    key = (digest, specialized)
+    if key in _validators:
+        return _validators[key]
+    schema = json.loads(raw.decode('utf-8'))
+    validator = None
+    if specialized:
+        try:
+            validator = _load_specialized(schema, digest)
+        except UnsupportedSchema:
+            validator = None
+    if validator is None:
+        validator = _load_jsonschema(schema)
+    _validators[key] = validator
+    return validator
+
+
+def get_validator(schema_path=SCHEMA_PATH, specialized=True, pointer=''):
+    """Return a cached `iter_errors(instance) -> [(path, message), ...]` for schema_path.
+
+    `pointer` selects a sub-schema, e.g. PAGE_POINTER to validate a single page.
+    """
+    iter_errors = _load(schema_path, specialized)
+    if not pointer:
+        return iter_errors
+    return lambda instance: iter_errors(instance, pointer)
+
+
+def validate_schema(instance, schema_path=SCHEMA_PATH, specialized=True, pointer=''):
+    """Validate `instance`; return `(ok, errors)` with every error found."""
+    errors = get_validator(schema_path, specialized, pointer)(instance)
+    return not errors, errors
+
+
+def format_path(path):
+    out = ''
+    for part in path:
+        out += f'[{part}]' if isinstance(part, int) else ('.' if out else '') + str(part)
+    return out or '<root>'
+
+
+def page_label(index, page):
+    page_id = page.get('id') if isinstance(page, dict) else None
+    return f'pages[{index}]' + (f" '{page_id}'" if page_id is not None else '')
+
+
+def group_errors(instance, errors):
+    """Group errors by page: returns {label: [messages]}, one label per page index."""
+    pages = instance.get('pages') if isinstance(instance, dict) else None
+    groups = {}
+    for path, message in errors:
+        if len(path) >= 2 and path[0] == 'pages' and isinstance(path[1], int):
+            page = pages[path[1]] if isinstance(pages, list) and path[1] < len(pages) else None
+            label = page_label(path[1], page)
+            rest = format_path(path[2:]) if len(path) > 2 else '<page>'
+        else:
+            label = 'project schema'
+            rest = format_path(path)
+        groups.setdefault(label, []).append(f'{rest}: {message}')
+    return groups
+
+
+def format_errors(instance, errors):
+    lines = []
+    for label, messages in group_errors(instance, errors).items():
+        lines.append(f'{label}:')
+        lines += [f'  - {m}' for m in messages]
+    return '\n'.join(lines)
+
+
+def format_page_errors(index, page, errors):
+    """Format errors from validating a single page (paths relative to the page)."""
+    lines = [f'{page_label(index, page)}:']
+    lines += [f'  - {format_path(path) if path else "<page>"}: {message}' for path, message in errors]
+    return '\n'.join(lines)
@@ -5,53 +5,21 @@ Usage:
 
 Outputs:
   - prints validation results
-  - writes AST to generators/validator/ast.json
+  - stores the AST in the binary AST cache (see generators/core/ast_cache.py),
+    so a following `generate()` of the unchanged file skips parsing and validation
 """
 import json
 import os
 import sys
-from jsonschema import validate, ValidationError
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-SCHEMA_PATH = os.path.join(ROOT, 'generators', 'schema', 'v1', 'virtoweb.schema.json')
-AST_OUT = os.path.join(os.path.dirname(__file__), 'ast.json')
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
 
-
-def load_json(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def validate_schema(schema_def, instance):
-    try:
-        validate(instance=instance, schema=schema_def)
-        return True, None
-    except ValidationError as e:
-        return False, e
-
-
-def build_ast(instance):
-    # Produce a minimal AST useful for backends: maps and lists keyed by id
-    ast = {
-        'project': instance.get('project', {}),
-        'layouts': {l['id']: l for l in instance.get('layouts', [])},
-        'components': {c['id']: c for c in instance.get('components', [])},
-        'pages': instance.get('pages', []),
-        'forms': {f['id']: f for f in instance.get('forms', [])},
-        'assets': instance.get('assets', [])
-    }
-    # Simple cross-checks
-    errors = []
-    for p in ast['pages']:
-        if p['layout'] not in ast['layouts']:
-            errors.append(f"Page '{p.get('id')}' references unknown layout '{p.get('layout')}'")
-        # validate components in regions
-        for region, comps in (p.get('regions') or {}).items():
-            for ci in comps:
-                comp_id = ci.get('component')
-                if comp_id not in ast['components']:
-                    errors.append(f"Page '{p.get('id')}' region '{region}' references unknown component '{comp_id}'")
-    return ast, errors
+from generators.core.ast_cache import ast_cache_key, write_ast_cache  # noqa: E402
+from generators.backends.forms import check_forms  # noqa: E402
+from generators.core.generator import SCHEMA_PATH, build_ast  # noqa: E402
+from generators.validator.schema_cache import validate_schema, format_errors  # noqa: E402
 
 
 def main():
@@ -67,29 +35,40 @@ def main():
         print('Schema file not found:', site_path)
         sys.exit(2)
 
-    schema_def = load_json(SCHEMA_PATH)
-    instance = load_json(site_path)
+    with open(site_path, 'rb') as f:
+        raw = f.read()
+    instance = json.loads(raw)
 
-    ok, err = validate_schema(schema_def, instance)
+    ok, errors = validate_schema(instance, SCHEMA_PATH)
     if not ok:
-        print('Schema validation FAILED:')
-        print(err)
+        print(f'Schema validation FAILED ({len(errors)} errors):')
+        print(format_errors(instance, errors))
         sys.exit(3)
 
     print('Schema validation: OK')
 
-    ast, cross_errors = build_ast(instance)
+    source_dir = os.path.dirname(site_path)
+    ast, cross_errors = build_ast(instance, source_dir)
     if cross_errors:
         print('Cross-check errors:')
         for e in cross_errors:
             print(' -', e)
-    else:
-        print('Cross-checks: OK')
-
-    # Write AST
-    with open(AST_OUT, 'w', encoding='utf-8') as f:
-        json.dump(ast, f, indent=2)
-    print('AST written to', AST_OUT)
+        # generate() refuses this file, so there is nothing to cache
+        return
+    print('Cross-checks: OK')
+
+    # only the python, node and php backends write form handlers, so these don't fail the file
+    form_errors, form_warnings = check_forms(ast['forms'])
+    if form_errors or form_warnings:
+        print('Form handlers (python, node and php backends):')
+        for e in form_errors:
+            print(' - error:', e)
+        for w in form_warnings:
+            print(' - warning:', w)
+
+    path = write_ast_cache(ast_cache_key(raw, source_dir, SCHEMA_PATH), ast, instance.get('generator', {}))
+    if path:
+        print('AST cached at', path)
 
 
 if __name__ == '__main__':
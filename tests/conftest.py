@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generators.benchmarks.synthetic import make_schema  # noqa: E402
+
+
+def tree(root, skip=()):
+    """{relative path: bytes} of every file under root, minus the names in skip."""
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            if rel not in skip:
+                with open(path, 'rb') as f:
+                    files[rel] = f.read()
+    return files
+
+
+@pytest.fixture
+def site(tmp_path):
+    """Write a synthetic project file to tmp_path; returns a factory taking make_schema arguments and overrides."""
+    def write(name='site.json', pages=12, **overrides):
+        schema = make_schema(pages=pages, components_per_region=2, prop_bytes=64)
+        schema.update(overrides)
+        path = tmp_path / name
+        path.write_text(json.dumps(schema), encoding='utf-8')
+        return str(path)
+    return write
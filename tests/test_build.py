@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from conftest import tree
+from generators.backends.manifest import MANIFEST_NAME
+from generators.core.generator import generate
+
+OPTIONS = {'minify': True, 'search': True}
+
+
+@pytest.fixture
+def schema(site):
+    return site(pages=40, generator={'language': 'static', 'options': OPTIONS})
+
+
+@pytest.fixture
+def reference(schema, tmp_path):
+    return tree(generate(schema, 'static', str(tmp_path / 'reference'), ast_cache=False))
+
+
+def test_parallel_build_matches_serial(schema, reference, tmp_path):
+    out = generate(schema, 'static', str(tmp_path / 'parallel'), workers=3, ast_cache=False)
+    assert tree(out) == reference
+
+
+def test_streamed_schema_matches(schema, reference, tmp_path):
+    out = generate(schema, 'static', str(tmp_path / 'streamed'), stream=True, ast_cache=False)
+    assert tree(out) == reference
+
+
+def test_streamed_pages_match(site, reference, tmp_path):
+    # the option itself is part of every page's input hash, so only the build manifest differs
+    streamed = site(name='streamed.json', pages=40,
+                    generator={'language': 'static', 'options': dict(OPTIONS, streamPages=256)})
+    out = generate(streamed, 'static', str(tmp_path / 'streamed'), ast_cache=False)
+    del reference[MANIFEST_NAME]
+    assert tree(out, skip={MANIFEST_NAME}) == reference
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_incremental_build_matches_full_build(schema, reference, tmp_path, workers):
+    with open(schema, encoding='utf-8') as f:
+        edited = json.load(f)
+    # an earlier state of the site: a retitled page, a dropped page and a changed component default
+    edited['pages'][3]['title'] = 'An older title'
+    del edited['pages'][5]
+    next(c for c in edited['components'] if c['id'] == 'hero')['props']['headline'] = 'Older headline'
+    earlier = tmp_path / 'earlier.json'
+    earlier.write_text(json.dumps(edited), encoding='utf-8')
+
+    out = str(tmp_path / 'incremental')
+    generate(str(earlier), 'static', out, workers=workers, ast_cache=False)
+    generate(schema, 'static', out, incremental=True, workers=workers, ast_cache=False)
+    assert tree(out) == reference
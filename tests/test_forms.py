@@ -0,0 +1,123 @@
+import os
+import sqlite3
+from urllib.parse import urlencode
+
+import pytest
+
+from generators.backends.forms import TYPE_PATTERNS, portable_pattern_error
+from generators.benchmarks.forms import environ_for, load_module, sample_values
+from generators.core.generator import generate
+
+CONTACT = {
+    'id': 'contact', 'action': '/api/contact', 'method': 'POST',
+    'fields': [
+        {'name': 'name', 'type': 'text', 'required': True},
+        {'name': 'email', 'type': 'email', 'required': True},
+        {'name': 'age', 'type': 'number', 'validation': {'min': 18, 'max': 120}},
+    ],
+}
+EXTERNAL = {
+    'id': 'newsletter', 'action': 'https://formspree.io/f/abc', 'method': 'POST',
+    'fields': [{'name': 'email', 'type': 'email', 'validation': {'format': 'email'}}],
+}
+
+
+@pytest.fixture
+def handler(site, tmp_path):
+    out = generate(site(forms=[CONTACT, EXTERNAL]), 'python', str(tmp_path / 'py'), ast_cache=False)
+    handlers = load_module(os.path.join(out, 'form_handlers.py'), 'test_form_handlers')
+    app = handlers.FormHandler(lambda environ, start_response: start_response('404 Not Found', []) or [],
+                               database=str(tmp_path / 'forms.sqlite3'))
+    yield handlers, app
+    app.writer.close()
+
+
+def post(app, form, values, ip='10.0.0.1'):
+    status = {}
+    body = app(environ_for(form, urlencode(values).encode('utf-8'), ip),
+               lambda s, headers: status.setdefault('status', s))
+    return status['status'], b''.join(body)
+
+
+def test_valid_submission_is_stored(handler, tmp_path):
+    handlers, app = handler
+    form = handlers.FORMS[0]
+    status, _ = post(app, form, dict(sample_values(form['fields']), age='30'))
+    assert status.startswith('303')
+    app.writer.close()
+    with sqlite3.connect(str(tmp_path / 'forms.sqlite3')) as db:
+        assert db.execute('SELECT form FROM submissions').fetchall() == [('contact',)]
+
+
+@pytest.mark.parametrize('values', [
+    {'name': 'Ann'},
+    {'name': 'Ann', 'email': 'not an address'},
+    {'name': 'Ann', 'email': 'ann@example.com', 'age': '12'},
+])
+def test_invalid_submission_is_rejected(handler, values):
+    handlers, app = handler
+    status, _ = post(app, handlers.FORMS[0], values)
+    assert status.startswith('422')
+
+
+def test_external_action_gets_no_handler(handler):
+    handlers, _ = handler
+    assert [f['id'] for f in handlers.FORMS] == ['contact']
+
+
+def test_warns_about_external_actions_and_unknown_keys(site, tmp_path, capsys):
+    loose = dict(CONTACT, fields=[{'name': 'email', 'type': 'email', 'validation': {'format': 'email'}}])
+    generate(site(forms=[loose, EXTERNAL]), 'python', str(tmp_path / 'py'), ast_cache=False)
+    out = capsys.readouterr().out
+    assert 'https://formspree.io/f/abc' in out
+    assert "ignoring unsupported validation ['format']" in out
+
+
+def test_static_build_does_not_check_forms(site, tmp_path):
+    bad = dict(CONTACT, fields=[{'name': 'code', 'type': 'text', 'validation': {'pattern': '('}}])
+    generate(site(forms=[bad, EXTERNAL]), 'static', str(tmp_path / 'static'), ast_cache=False)
+
+
+def test_bad_pattern_fails_before_building(site, tmp_path):
+    bad = dict(CONTACT, fields=[{'name': 'code', 'type': 'text', 'validation': {'pattern': '('}}])
+    with pytest.raises(RuntimeError, match='invalid pattern'):
+        generate(site(forms=[bad]), 'python', str(tmp_path / 'py'), ast_cache=False)
+    assert not os.path.exists(tmp_path / 'py')
+
+
+def test_database_is_kept_across_rebuilds(site, tmp_path):
+    schema = site(forms=[CONTACT])
+    out = generate(schema, 'python', str(tmp_path / 'py'), ast_cache=False)
+    handlers = load_module(os.path.join(out, 'form_handlers.py'), 'test_form_handlers_db')
+    assert handlers.DATABASE == os.path.join(out, 'data', 'forms.sqlite3')
+    db = handlers.connect(handlers.DATABASE)
+    with db:
+        db.execute("INSERT INTO submissions (form, received, ip, data) VALUES ('contact', 0, NULL, '{}')")
+    # the running server keeps its connection open while the project is rebuilt
+    generate(schema, 'python', out, ast_cache=False)
+    with db:
+        db.execute("INSERT INTO submissions (form, received, ip, data) VALUES ('contact', 1, NULL, '{}')")
+    db.close()
+    with sqlite3.connect(handlers.DATABASE) as db:
+        assert db.execute('SELECT COUNT(*) FROM submissions').fetchone()[0] == 2
+
+
+@pytest.mark.parametrize('pattern', list(TYPE_PATTERNS.values()) + [
+    r'[\w.-]+@[\w-]+\.[a-z]{2,}', r'\d{3}-\d{4}', r'(a)\1', r'(?<=a)b(?!c)', r'a{2,3}?', r'\x41[a\-z]',
+])
+def test_portable_patterns_are_accepted(pattern):
+    assert portable_pattern_error(pattern) is None
+
+
+@pytest.mark.parametrize('pattern', [
+    '(?P<code>[0-9]+)', '(?<code>[0-9]+)', '(?i)abc', '(?>a)', 'a++', r'\A[0-9]+\Z', r'\p{L}+', r'\-', '[[:alpha:]]',
+    '[]a]', 'a{', 'a{,3}',
+])
+def test_non_portable_patterns_are_rejected(pattern):
+    assert portable_pattern_error(pattern)
+
+
+def test_named_group_fails_node_build(site, tmp_path):
+    form = dict(CONTACT, fields=[{'name': 'code', 'type': 'text', 'validation': {'pattern': '(?P<code>[0-9]+)'}}])
+    with pytest.raises(RuntimeError, match='not portable'):
+        generate(site(forms=[form]), 'node', str(tmp_path / 'node'), ast_cache=False)
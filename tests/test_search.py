@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from generators.backends.search import SEARCH_DIR, SEARCH_STATE
+from generators.core.generator import generate
+
+# runs the generated loader in node with fetch() reading the built files
+RUN_LOADER = r"""
+const fs = require('fs');
+const path = require('path');
+const [dir, query] = process.argv.slice(1);
+global.window = globalThis;
+global.document = {currentScript: {src: 'http://localhost/assets/search/search.js'}, readyState: 'complete',
+                   querySelectorAll: () => []};
+global.fetch = url => {
+  const file = path.join(dir, url.replace(/^.*\//, ''));
+  return Promise.resolve({ok: fs.existsSync(file), status: 404,
+                          json: () => Promise.resolve(JSON.parse(fs.readFileSync(file, 'utf8')))});
+};
+require(path.join(dir, 'search.js'));
+VirtoSearch.search(query, 100000).then(hits => console.log(JSON.stringify(hits.map(h => h.url).sort())));
+"""
+
+
+def expected(out, query):
+    with open(os.path.join(out, SEARCH_STATE), encoding='utf-8') as f:
+        docs = json.load(f)['docs']
+    return sorted(route for route, _, _, terms in docs.values() if any(t.startswith(query) for t in terms))
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node to run the loader')
+@pytest.mark.parametrize('query', ['be', 'ben', 'bench', 'lo', 'zz'])
+def test_prefix_queries_shorter_than_the_shard_prefix(site, tmp_path, query):
+    schema = site(generator={'language': 'static', 'options': {'search': {'prefixLength': 3}}})
+    out = generate(schema, 'static', str(tmp_path / 'out'), ast_cache=False)
+    result = subprocess.run(['node', '-e', RUN_LOADER, os.path.join(out, SEARCH_DIR), query],
+                            capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout) == expected(out, query)
+    if query != 'zz':
+        assert expected(out, query)
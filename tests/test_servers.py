@@ -0,0 +1,58 @@
+import ast
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from generators.core.generator import generate
+
+# (Accept-Encoding, coding the server should send) with br and gzip variants
+CASES = [
+    ('', None),
+    ('gzip', 'gzip'),
+    ('br, gzip', 'br'),
+    ('*', 'br'),
+    ('br;q=0, *', 'gzip'),
+    ('br;q=0, gzip;q=0, *', None),
+    ('gzip;q=0', None),
+    ('*;q=0', None),
+    ('identity', None),
+]
+
+
+@pytest.fixture(scope='module')
+def projects(tmp_path_factory):
+    root = tmp_path_factory.mktemp('servers')
+    schema = os.path.join(os.path.dirname(__file__), '..', 'examples', 'example_layout_site.json')
+    return {name: generate(schema, name, str(root / name), ast_cache=False) for name in ('python', 'node')}
+
+
+def python_functions(path, names):
+    # app.py imports Flask; only the named functions are taken from it
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    module = ast.Module([n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name in names], [])
+    namespace = {}
+    exec(compile(module, path, 'exec'), namespace)
+    return namespace
+
+
+@pytest.mark.parametrize('header, coding', CASES)
+def test_python_encoding_negotiation(projects, header, coding):
+    ns = python_functions(os.path.join(projects['python'], 'app.py'), {'accepted_encodings', 'pick_variant'})
+    assert ns['pick_variant']([('br', 'br'), ('gzip', 'gzip')], header) == coding
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+@pytest.mark.parametrize('header, coding', CASES)
+def test_node_encoding_negotiation(projects, header, coding):
+    with open(os.path.join(projects['node'], 'server.js'), encoding='utf-8') as f:
+        source = f.read()
+    functions = [re.search(r'^function %s\(.*?^}$' % name, source, re.S | re.M).group(0)
+                 for name in ('acceptedEncodings', 'pickVariant')]
+    script = '\n'.join(functions) + "\nconsole.log(JSON.stringify(pickVariant([['br', 'br'], ['gzip', 'gzip']], " \
+        "process.argv[1]) || null));"
+    result = subprocess.run(['node', '-e', script, header], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ('null' if coding is None else f'"{coding}"')
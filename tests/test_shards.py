@@ -0,0 +1,29 @@
+import os
+
+from conftest import tree
+from generators.backends.assets import ASSET_STATE
+from generators.core.generator import generate
+from generators.core.shard import merge
+
+
+def test_merge_matches_unsharded_build(site, tmp_path):
+    schema = site()
+    whole = generate(schema, 'static', str(tmp_path / 'whole'), ast_cache=False)
+    shards = [generate(schema, 'static', str(tmp_path / f'shard{i}'), ast_cache=False, shard=f'{i}/3')
+              for i in (1, 2, 3)]
+    merged = str(tmp_path / 'merged')
+    merge(schema, shards, merged, ast_cache=False)
+    assert tree(merged, skip={ASSET_STATE}) == tree(whole, skip={ASSET_STATE})
+
+
+def test_merge_ignores_source_mtimes(site, tmp_path):
+    # shards built on different machines see the same asset contents with different mtimes
+    logo = tmp_path / 'logo.svg'
+    logo.write_text('<svg xmlns="http://www.w3.org/2000/svg"/>', encoding='utf-8')
+    schema = site(assets=[{'src': str(logo), 'dest': 'assets/logo.svg', 'type': 'image'}])
+    first = generate(schema, 'static', str(tmp_path / 'shard1'), ast_cache=False, shard='1/2')
+    os.utime(logo, ns=(1_000_000_000, 1_000_000_000))
+    second = generate(schema, 'static', str(tmp_path / 'shard2'), ast_cache=False, shard='2/2')
+    merged = str(tmp_path / 'merged')
+    merge(schema, [first, second], merged, ast_cache=False)
+    assert any(rel.startswith('assets/logo.') for rel in tree(merged))
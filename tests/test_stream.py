@@ -0,0 +1,36 @@
+from generators.backends import stream
+from generators.backends.minify import minify_html
+from generators.backends.stream import ChunkWriter
+
+PAGE = ['<!doctype html>\n<html>\n<head>\n  <title>Page</title>\n  <style>\n  p  { margin: 0 }\n  </style>\n</head>\n<body>\n']
+PAGE += [f'<div class="item">\n  <p>Item   {i}</p>\n  <pre>  keep\n   this  {i}</pre>\n  <!-- note <div> -->\n</div>\n'
+         for i in range(300)]
+PAGE += ['<script>\n if (a < b) { go(); }\n</script>\n</body>\n</html>\n']
+
+
+def write(path, pieces, buffer_size, transform=None):
+    writer = ChunkWriter(str(path), buffer_size=buffer_size, transform=transform)
+    for piece in pieces:
+        writer.write(piece)
+    writer.close()
+    return path.read_text(encoding='utf-8')
+
+
+def test_chunked_output_matches_whole_page(tmp_path):
+    whole = ''.join(PAGE)
+    # split mid-tag too, so cuts have to wait for tags to complete
+    pieces = [whole[i:i + 7] for i in range(0, len(whole), 7)]
+    for size in (1, 64, 1000, 1 << 20):
+        assert write(tmp_path / 'page.html', pieces, size, minify_html) == minify_html(whole)
+        assert write(tmp_path / 'page.html', pieces, size) == whole
+
+
+def test_unbroken_text_is_scanned_once(tmp_path, monkeypatch):
+    # no block boundary for a long stretch: each flush must only scan what is new
+    scanned = []
+    safe_cut = stream.safe_cut
+    monkeypatch.setattr(stream, 'safe_cut', lambda html: scanned.append(len(html)) or safe_cut(html))
+    pieces = ['<p>'] + ['<span>word</span> '] * 20000 + ['</p>\n<p>end</p>']
+    assert write(tmp_path / 'page.html', pieces, 1024) == ''.join(pieces)
+    assert len(scanned) > 100
+    assert max(scanned) < 2 * 1024
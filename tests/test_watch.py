@@ -0,0 +1,59 @@
+import json
+import os
+
+from conftest import tree
+from generators.core.generator import generate
+from generators.core.watch import SiteWatcher
+
+
+def rewrite(path, schema):
+    st = os.stat(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(schema, f)
+    # polling compares mtimes: make sure this edit is seen even within one clock tick
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_component_edit_rerenders_only_its_pages(site, tmp_path):
+    plain = {'id': 'plain', 'route': '/plain', 'title': 'Plain', 'layout': 'main',
+             'regions': {'main': [{'component': 'hero', 'props': {}}]}}
+    path = site(pages=6)
+    with open(path, encoding='utf-8') as f:
+        schema = json.load(f)
+    schema['pages'].append(plain)
+    rewrite(path, schema)
+
+    watcher = SiteWatcher(path, 'static', str(tmp_path / 'watched'))
+    assert watcher.load()
+    watcher.build(incremental=False)
+    hero_pages = watcher.by_component['hero']
+    assert 'plain/index.html' in hero_pages and len(hero_pages) < len(watcher.pages)
+
+    rendered = []
+    rebuild_pages = watcher.rebuild_pages
+    watcher.rebuild_pages = lambda rels: rendered.append(rels) or rebuild_pages(rels)
+    hero = next(c for c in schema['components'] if c['id'] == 'hero')
+    hero['props']['headline'] = 'A new default headline'
+    rewrite(path, schema)
+    watcher.poll()
+
+    assert rendered == [sorted(hero_pages)]
+    with open(os.path.join(watcher.public, 'plain', 'index.html'), encoding='utf-8') as f:
+        assert 'A new default headline' in f.read()
+    fresh = generate(path, 'static', str(tmp_path / 'fresh'), ast_cache=False)
+    assert tree(watcher.public) == tree(fresh)
+
+
+def test_other_schema_edits_rebuild(site, tmp_path):
+    path = site(pages=4)
+    with open(path, encoding='utf-8') as f:
+        schema = json.load(f)
+    watcher = SiteWatcher(path, 'static', str(tmp_path / 'watched'))
+    assert watcher.load()
+    watcher.build(incremental=False)
+    schema['pages'][0]['title'] = 'Renamed'
+    rewrite(path, schema)
+    assert watcher.components_changed(watcher.ast) == set()
+    old = watcher.ast
+    assert watcher.load()
+    assert watcher.components_changed(old) is None